@@ -1,13 +1,27 @@
 import os
 import json
+import time
+import asyncio
 import datetime
-from typing import Dict, Any # Added for type hinting
+import multiprocessing
+import click
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Tuple # Added for type hinting
 from flask import (
-    Flask, render_template, request, redirect, url_for, session, flash, send_from_directory, jsonify
+    Flask, render_template, request, redirect, url_for, session, flash, send_from_directory, send_file, jsonify, abort,
+    Response, stream_with_context, has_request_context
 )
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import HTTPException
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, case, tuple_, select, insert, update, delete
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.dialects.postgresql import JSONB, insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.orm.exc import StaleDataError
+import sqlite3
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
 import datetime # Already imported, but good to ensure it's here for model defaults
@@ -15,10 +29,23 @@ import datetime # Already imported, but good to ensure it's here for model defau
 # Assuming your other .py files are in the same directory or accessible via PYTHONPATH
 from config import (
     get_phase_config, get_all_phases, PHASES_CONFIG, # PHASES_CONFIG for checking if loaded
-    SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS # For DB setup
+    SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS, SQLALCHEMY_ENGINE_OPTIONS, # For DB setup
+    SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS
 )
-from gemini_client import generate_solution_summary, seed_next_phase_data
-from doc_generator import build_document_for_phase
+import gemini_client
+from gemini_client import generate_solution_summary_async, seed_next_phase_data_async
+from doc_generator import (
+    build_document_for_phase_async, split_document_sections, document_config_version, estimate_document_build
+)
+import search_index
+import revisions
+import doc_store
+import zip_stream
+import bulk_io
+import doc_preview
+import batch_regen
+import instrumentation
+import speculation
 
 app = Flask(__name__)
 
@@ -29,15 +56,45 @@ app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev_default_super_secret_ke
 # Configuration for file uploads (generated documents)
 UPLOAD_FOLDER = 'generated_docs'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True) # Ensure the upload folder exists
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER # Legacy flat files; new documents go to the content-addressed store
+app.config['DOC_STORE_ROOT'] = doc_store.DOC_STORE_ROOT
+app.config['DOC_STORE_COMPRESS'] = doc_store.DOC_STORE_COMPRESS
+# Let a fronting nginx/Apache serve document blobs itself (X-Sendfile) instead of the app process
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
 
 # Database Configuration
 app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = SQLALCHEMY_TRACK_MODIFICATIONS
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = SQLALCHEMY_ENGINE_OPTIONS
+
+@event.listens_for(Engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Applies the configured SQLite pragmas to every new SQLite connection (no-op for other databases)."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {int(SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    finally:
+        cursor.close()
+
+# Query count/time per request for Server-Timing and the slow-request log (see instrumentation.py)
+instrumentation.install_sqlalchemy_hooks(Engine)
 
 db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+def _include_in_autogenerate(obj, name, type_, reflected, compare_to) -> bool:
+    """Hides engine-specific objects that are managed by hand-written migrations from autogenerate."""
+    if type_ == 'table' and name and name.startswith('search_entry_fts'):
+        return False # FTS5 virtual table and its shadow tables (SQLite)
+    if type_ == 'index' and name == 'ix_phase_data_data_gin' and not SQLALCHEMY_DATABASE_URI.startswith('postgres'):
+        return False # PostgreSQL-only GIN index
+    return True
+
+migrate = Migrate(app, db, include_object=_include_in_autogenerate)
 csrf = CSRFProtect(app)
+instrumentation.init_app(app) # Server-Timing, structured request logs, slow-request log, profiler
 
 # --- SQLAlchemy Models ---
 class Project(db.Model):
@@ -53,14 +110,134 @@ class PhaseData(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
     phase_id_int = db.Column(db.Integer, nullable=False) # e.g., 1, 2, 3 for Phase 1, Phase 2 etc.
-    data = db.Column(db.JSON, nullable=False, default=dict) # Stores the actual phase data dictionary
+    # Stores the actual phase data dictionary; binary, indexable jsonb on PostgreSQL
+    data = db.Column(db.JSON().with_variant(JSONB(), 'postgresql'), nullable=False, default=dict)
     last_modified = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0') # Latest PhaseRevision.revision
+    revisions = db.relationship('PhaseRevision', backref='phase_data', lazy='dynamic', cascade="all, delete-orphan")
 
-    __table_args__ = (db.UniqueConstraint('project_id', 'phase_id_int', name='uq_project_phase'),)
+    __table_args__ = (
+        db.UniqueConstraint('project_id', 'phase_id_int', name='uq_project_phase'),
+        # Covers the dashboard aggregate (per-phase max(last_modified) per project) without touching the table.
+        db.Index('ix_phase_data_project_phase_modified', 'project_id', 'phase_id_int', 'last_modified'),
+        db.Index('ix_phase_data_data_gin', 'data', postgresql_using='gin',
+                 postgresql_ops={'data': 'jsonb_path_ops'}).ddl_if(dialect='postgresql'),
+    )
 
     def __repr__(self):
         return f"<PhaseData {self.id} for Project {self.project_id} - PhaseDef {self.phase_id_int}>"
 
+class PhaseRevision(db.Model):
+    """One saved version of a PhaseData row: a full snapshot or a delta of changed keys (see revisions.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    phase_data_id = db.Column(db.Integer, db.ForeignKey('phase_data.id'), nullable=False)
+    revision = db.Column(db.Integer, nullable=False)
+    is_snapshot = db.Column(db.Boolean, nullable=False, default=False)
+    payload = db.Column(db.JSON().with_variant(JSONB(), 'postgresql'), nullable=False) # Full data or {"set": ..., "unset": ...}
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('phase_data_id', 'revision', name='uq_phase_revision'),)
+
+    def __repr__(self):
+        return f"<PhaseRevision {self.revision} of PhaseData {self.phase_data_id}{' (snapshot)' if self.is_snapshot else ''}>"
+
+class GeneratedDocument(db.Model):
+    """One document build for a project phase, pointing at a content-addressed blob in doc_store."""
+    __tablename__ = 'generated_document'
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
+    phase_id_int = db.Column(db.Integer, nullable=False)
+    build_no = db.Column(db.Integer, nullable=False) # 1, 2, 3... per project phase
+    filename = db.Column(db.String, nullable=False) # Download name
+    content_hash = db.Column(db.String(64), nullable=False, index=True) # SHA-256 of the uncompressed content
+    size = db.Column(db.Integer, nullable=False)
+    stored_size = db.Column(db.Integer, nullable=False)
+    compressed = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+    config_version = db.Column(db.String(16), nullable=True) # doc_generator.document_config_version(); None for older builds
+
+    __table_args__ = (db.UniqueConstraint('project_id', 'phase_id_int', 'build_no', name='uq_generated_document_build'),)
+
+    def __repr__(self):
+        return f"<GeneratedDocument {self.id}: Project {self.project_id} - PhaseDef {self.phase_id_int} build {self.build_no}>"
+
+class RegenerationBatch(db.Model):
+    """One `flask docs regenerate` run and its selection filters; its items are the checkpoints."""
+    __tablename__ = 'regeneration_batch'
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(16), nullable=False, default=batch_regen.BATCH_RUNNING)
+    filters = db.Column(db.JSON, nullable=False, default=dict)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    items = db.relationship('RegenerationItem', backref='batch', lazy='dynamic', cascade="all, delete-orphan")
+
+    def __repr__(self):
+        return f"<RegenerationBatch {self.id} ({self.status})>"
+
+class RegenerationItem(db.Model):
+    """One project phase document of a regeneration batch; marked done in the same transaction as its build."""
+    __tablename__ = 'regeneration_item'
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey('regeneration_batch.id'), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
+    phase_id_int = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default=batch_regen.ITEM_PENDING)
+    document_id = db.Column(db.Integer, nullable=True) # The GeneratedDocument built
+    error = db.Column(db.Text, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('batch_id', 'project_id', 'phase_id_int', name='uq_regeneration_item'),
+        db.Index('ix_regeneration_item_batch_status', 'batch_id', 'status'),
+    )
+
+    def __repr__(self):
+        return f"<RegenerationItem {self.id} of batch {self.batch_id}: Project {self.project_id} - PhaseDef {self.phase_id_int} ({self.status})>"
+
+class SearchEntry(db.Model):
+    """Searchable text: one row per phase field value or generated document section (see search_index.py)."""
+    __tablename__ = 'search_entry'
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
+    phase_id_int = db.Column(db.Integer, nullable=False)
+    source = db.Column(db.String(16), nullable=False) # search_index.SOURCE_PHASE_DATA or SOURCE_DOCUMENT
+    field_key = db.Column(db.String, nullable=False) # Phase field key, or section_<n> for documents
+    title = db.Column(db.String, nullable=False, default="")
+    body = db.Column(db.Text, nullable=False, default="")
+
+    __table_args__ = (
+        # Lets a save replace just its own rows
+        db.Index('ix_search_entry_scope', 'project_id', 'phase_id_int', 'source', 'field_key'),
+    )
+
+    def __repr__(self):
+        return f"<SearchEntry {self.id} for Project {self.project_id} - PhaseDef {self.phase_id_int} {self.source}:{self.field_key}>"
+
+class SpeculativeResult(db.Model):
+    """An AI result precomputed after a save, waiting for the click it anticipates (see speculation.py)."""
+    __tablename__ = 'speculative_result'
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
+    phase_id_int = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(32), nullable=False) # speculation.ACTION_*
+    fingerprint = db.Column(db.String(64), nullable=False) # speculation.fingerprint() of the prompt input
+    status = db.Column(db.String(16), nullable=False, default=speculation.STATUS_RUNNING)
+    result = db.Column(db.JSON().with_variant(JSONB(), 'postgresql'), nullable=True) # Summary text or seeded field dict
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    consumed_at = db.Column(db.DateTime, nullable=True) # Set once, by the click that used it
+
+    __table_args__ = (
+        db.UniqueConstraint('project_id', 'phase_id_int', 'action', 'fingerprint', name='uq_speculative_result'),
+        db.Index('ix_speculative_result_created_at', 'created_at'), # Daily caps and stats
+    )
+
+    def __repr__(self):
+        return f"<SpeculativeResult {self.id}: Project {self.project_id} - PhaseDef {self.phase_id_int} {self.action} ({self.status})>"
+
+# FTS5 table + triggers on SQLite, tsvector column + GIN index on PostgreSQL
+search_index.install_search_ddl(SearchEntry.__table__)
+
 # --- Helper Functions for Database Data Management ---
 def get_or_create_default_project() -> Project:
     """Tries to fetch the project with id=1, or creates it if not found."""
@@ -79,6 +256,65 @@ def get_or_create_default_project() -> Project:
             raise
     return project
 
+def get_current_project() -> Project:
+    """Returns the project selected in the session, falling back to the default project."""
+    project_id = session.get('current_project_id')
+    project = Project.query.get(project_id) if isinstance(project_id, int) else None
+    if project is None:
+        project = get_or_create_default_project()
+        session['current_project_id'] = project.id
+    return project
+
+def get_project_summaries(page_size: int, before_id: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Returns one page of projects (newest first) with per-phase last-modified timestamps.
+
+    Uses keyset pagination on Project.id and a single aggregate query over only the projects
+    on the page, so the cost does not grow with the total number of projects or phases.
+    The second element of the tuple is the `before` cursor for the next page, or None.
+    """
+    phase_ids = [p.id for p in get_all_phases()]
+
+    page_query = db.session.query(Project.id).order_by(Project.id.desc())
+    if before_id is not None:
+        page_query = page_query.filter(Project.id < before_id)
+    page_ids = page_query.limit(page_size + 1).subquery()
+
+    phase_columns = [
+        func.max(case((PhaseData.phase_id_int == pid, PhaseData.last_modified))).label(f"phase_{pid}")
+        for pid in phase_ids
+    ]
+    rows = (
+        db.session.query(
+            Project.id, Project.name, Project.created_at,
+            func.max(PhaseData.last_modified).label('last_modified'),
+            *phase_columns
+        )
+        .join(page_ids, page_ids.c.id == Project.id)
+        .outerjoin(PhaseData, PhaseData.project_id == Project.id)
+        .group_by(Project.id, Project.name, Project.created_at)
+        .order_by(Project.id.desc())
+        .all()
+    )
+
+    next_before_id = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_before_id = rows[-1].id
+
+    summaries = []
+    for row in rows:
+        phase_last_modified = {pid: getattr(row, f"phase_{pid}") for pid in phase_ids}
+        summaries.append({
+            'id': row.id,
+            'name': row.name,
+            'created_at': row.created_at,
+            'last_modified': row.last_modified,
+            'phase_last_modified': phase_last_modified,
+            'phases_started': sum(1 for ts in phase_last_modified.values() if ts is not None),
+        })
+    return summaries, next_before_id
+
 def get_all_project_phase_data_db(project_id: int) -> Dict[str, Any]:
     """Queries all PhaseData entries for a project and returns them in a dict keyed by phase_id_int."""
     phases = PhaseData.query.filter_by(project_id=project_id).all()
@@ -91,33 +327,786 @@ def get_current_phase_data_db(project_id: int, phase_id_int: int) -> Dict[str, A
         return phase_data_entry.data
     return {}
 
-def update_current_phase_data_db(project_id: int, phase_id_int: int, data_to_update: Dict[str, Any]) -> None:
-    """Updates or creates a PhaseData entry for the project and phase_id_int."""
-    phase_data_entry = PhaseData.query.filter_by(project_id=project_id, phase_id_int=phase_id_int).first()
-    if phase_data_entry:
-        current_data = phase_data_entry.data or {}
-        current_data.update(data_to_update)
-        phase_data_entry.data = current_data
-        phase_data_entry.last_modified = datetime.datetime.utcnow()
-        # Ensure SQLAlchemy detects the change in the JSON field
-        db.session.flag_modified(phase_data_entry, "data")
-    else:
-        phase_data_entry = PhaseData(
-            project_id=project_id,
-            phase_id_int=phase_id_int,
-            data=data_to_update,
-            last_modified=datetime.datetime.utcnow()
-        )
-        db.session.add(phase_data_entry)
+def get_document_store() -> doc_store.DocumentStore:
+    return doc_store.DocumentStore(app.config['DOC_STORE_ROOT'], compress=app.config['DOC_STORE_COMPRESS'])
+
+def get_latest_generated_document(project_id: int, phase_id_int: int) -> Optional[GeneratedDocument]:
+    return (GeneratedDocument.query
+            .filter_by(project_id=project_id, phase_id_int=phase_id_int)
+            .order_by(GeneratedDocument.build_no.desc())
+            .first())
+
+def store_generated_document(project_id: int, phase_id_int: int, filename: str, content: str,
+                             config_version: Optional[str] = None) -> GeneratedDocument:
+    """
+    Writes the content to the document store (deduplicated) and adds the build's metadata row
+    to the session; the caller commits. Raises IOError if the blob cannot be written.
+    """
+    blob = get_document_store().put(content)
+    latest = get_latest_generated_document(project_id, phase_id_int)
+    document = GeneratedDocument(
+        project_id=project_id,
+        phase_id_int=phase_id_int,
+        build_no=(latest.build_no + 1) if latest else 1,
+        filename=filename,
+        content_hash=blob.content_hash,
+        size=blob.size,
+        stored_size=blob.stored_size,
+        compressed=blob.compressed,
+        config_version=config_version
+    )
+    db.session.add(document)
+    db.session.flush() # Assigns document.id
+    return document
+
+def prune_document_builds(project_id: int, phase_id_int: int, keep: int = doc_store.DOC_RETENTION_BUILDS) -> List[str]:
+    """Deletes build rows beyond the newest `keep` (caller commits) and returns their content hashes."""
+    if keep <= 0:
+        return []
+    expired = (GeneratedDocument.query
+               .filter_by(project_id=project_id, phase_id_int=phase_id_int)
+               .order_by(GeneratedDocument.build_no.desc())
+               .offset(keep)
+               .all())
+    for document in expired:
+        db.session.delete(document)
+    return [document.content_hash for document in expired]
+
+def collect_document_garbage(candidates: Optional[List[str]] = None) -> int:
+    """Removes blobs no build references any more (only `candidates` when given). Run after committing."""
+    query = db.session.query(GeneratedDocument.content_hash)
+    if candidates is not None:
+        if not candidates:
+            return 0
+        query = query.filter(GeneratedDocument.content_hash.in_(set(candidates)))
+    referenced = {content_hash for (content_hash,) in query.distinct()}
+    return get_document_store().collect_garbage(referenced, candidates=candidates)
+
+def save_document_build(project_id: int, phase_id_int: int, content: str,
+                        checkpoint: Optional['RegenerationItem'] = None) -> GeneratedDocument:
+    """
+    Stores a new document build, applies build retention, indexes its sections and points the
+    phase data at it, all in one commit. A regeneration batch item passed as `checkpoint` is
+    marked done in that same commit. Raises IOError if the blob cannot be written; the caller rolls back.
+    """
+    phase_config = get_phase_config(phase_id_int)
+    doc_filename_base = phase_config.document.name if phase_config and phase_config.document else f"phase_{phase_id_int}_doc.md"
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    doc_filename = secure_filename(f"{doc_filename_base.split('.')[0]}_{timestamp}.md")
+
+    document = store_generated_document(project_id, phase_id_int, doc_filename, content,
+                                        config_version=document_config_version(phase_id_int))
+    expired_hashes = prune_document_builds(project_id, phase_id_int)
+    # Index the new sections; committed together with the build and phase data below
+    search_index.index_document_sections(db.session, SearchEntry, project_id, phase_id_int,
+                                         split_document_sections(content))
+    if checkpoint is not None:
+        checkpoint.status = batch_regen.ITEM_DONE
+        checkpoint.document_id = document.id
+        checkpoint.error = None
+        checkpoint.finished_at = datetime.datetime.utcnow()
+    # Store the build in the database for the current phase for download link
+    update_current_phase_data_db(project_id, phase_id_int, {
+        '_generated_doc_id': document.id,
+        '_generated_doc_filename': doc_filename
+    })
+    collect_document_garbage(expired_hashes)
+    return document
+
+def get_search_field_labels(phase_id_int: int) -> Dict[str, str]:
+    """Display titles for indexed phase fields."""
+    phase_config = get_phase_config(phase_id_int)
+    labels = {key: meta.label for key, meta in phase_config.fields.items()} if phase_config else {}
+    labels['_solution_summary'] = "AI Solution Summary"
+    return labels
+
+def claim_next_phase_revision(phase_data_entry: PhaseData, current_revision: int, new_data: Dict[str, Any],
+                               delta: Dict[str, Any]) -> bool:
+    """
+    Writes new_data as revision current_revision + 1 with a compare-and-set on PhaseData.revision,
+    and adds the matching PhaseRevision to the session (the caller commits). Returns False, writing
+    nothing, when another save moved the row past current_revision first.
+    """
+    next_revision = current_revision + 1
+    claimed = db.session.execute(
+        update(PhaseData)
+        .where(PhaseData.id == phase_data_entry.id, PhaseData.revision == current_revision)
+        .values(data=new_data, revision=next_revision, last_modified=datetime.datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if claimed != 1:
+        return False
+    is_snapshot = revisions.is_snapshot_revision(next_revision)
+    db.session.add(PhaseRevision(phase_data_id=phase_data_entry.id, revision=next_revision, is_snapshot=is_snapshot,
+                                 payload=dict(new_data) if is_snapshot else delta))
+    return True
+
+def get_phase_revision_data(phase_data_entry: PhaseData, revision: int) -> Optional[Dict[str, Any]]:
+    """Rebuilds the phase data as of `revision` from the nearest snapshot plus the deltas after it."""
+    snapshot = (phase_data_entry.revisions
+                .filter(PhaseRevision.revision <= revision, PhaseRevision.is_snapshot.is_(True))
+                .order_by(PhaseRevision.revision.desc())
+                .first())
+    if snapshot is None:
+        return None
+    deltas = (phase_data_entry.revisions
+              .filter(PhaseRevision.revision > snapshot.revision, PhaseRevision.revision <= revision)
+              .order_by(PhaseRevision.revision)
+              .all())
+    if len(deltas) != revision - snapshot.revision:
+        return None # A revision in between was compacted away
+    return revisions.reconstruct(snapshot.payload, (d.payload for d in deltas))
+
+def compact_phase_revisions(phase_data_entry: PhaseData, keep: int = revisions.REVISION_RETENTION_COUNT,
+                            max_age_days: int = revisions.REVISION_RETENTION_DAYS) -> int:
+    """
+    Applies the retention policy to one phase's history and returns the number of revisions removed.
+
+    The oldest surviving revision is rewritten as a snapshot, so every kept revision stays
+    reconstructable. The latest revision is never removed. The caller commits.
+    """
+    latest = phase_data_entry.revision or 0
+    cutoff = 1
+    if keep > 0:
+        cutoff = max(cutoff, latest - keep + 1)
+    if max_age_days > 0:
+        too_old = datetime.datetime.utcnow() - datetime.timedelta(days=max_age_days)
+        newest_expired = (phase_data_entry.revisions
+                          .filter(PhaseRevision.created_at < too_old)
+                          .order_by(PhaseRevision.revision.desc())
+                          .first())
+        if newest_expired is not None:
+            cutoff = max(cutoff, min(newest_expired.revision + 1, latest))
+    oldest_kept = phase_data_entry.revisions.filter(PhaseRevision.revision >= cutoff).order_by(PhaseRevision.revision).first()
+    if oldest_kept is None or not phase_data_entry.revisions.filter(PhaseRevision.revision < oldest_kept.revision).count():
+        return 0
+
+    if not oldest_kept.is_snapshot:
+        rebased = get_phase_revision_data(phase_data_entry, oldest_kept.revision)
+        if rebased is None:
+            return 0
+        oldest_kept.payload = rebased
+        oldest_kept.is_snapshot = True
+        db.session.flush()
+    return phase_data_entry.revisions.filter(PhaseRevision.revision < oldest_kept.revision).delete(synchronize_session=False)
+
+def _get_or_create_phase_data_entry(project_id: int, phase_id_int: int) -> Optional[PhaseData]:
+    """
+    The phase's PhaseData row, freshly loaded, created empty at revision 0 if missing. None when a
+    concurrent save created it first (the session was rolled back; try again).
+    """
+    entry = (PhaseData.query.filter_by(project_id=project_id, phase_id_int=phase_id_int)
+             .populate_existing().first())
+    if entry is not None:
+        return entry
+    entry = PhaseData(project_id=project_id, phase_id_int=phase_id_int, data={}, revision=0,
+                      last_modified=datetime.datetime.utcnow())
+    db.session.add(entry)
     try:
-        db.session.commit()
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+    return entry
+
+def update_current_phase_data_db(project_id: int, phase_id_int: int, data_to_update: Dict[str, Any],
+                                 replace: bool = False, attempts: int = 5) -> None:
+    """
+    Updates or creates a PhaseData entry for the project and phase_id_int and records a revision.
+    With replace=True the stored data becomes exactly data_to_update (used to restore revisions);
+    otherwise data_to_update is merged into the data as it is at write time, so a save that lands
+    in between (e.g. an autosave) is kept. Commits, together with anything already in the session.
+    """
+    try:
+        for _ in range(attempts):
+            phase_data_entry = _get_or_create_phase_data_entry(project_id, phase_id_int)
+            if phase_data_entry is None:
+                continue
+            old_data = dict(phase_data_entry.data or {})
+            new_data = dict(data_to_update) if replace else {**old_data, **data_to_update}
+            delta = revisions.compute_delta(old_data, new_data)
+            if not delta:
+                db.session.commit()
+                return
+            # Lost the race to another save: merge into its data instead (re-read on the next attempt).
+            # The failed UPDATE keeps this transaction's pending work and, on SQLite, its write lock.
+            if not claim_next_phase_revision(phase_data_entry, phase_data_entry.revision or 0, new_data, delta):
+                continue
+            db.session.refresh(phase_data_entry)
+            # Amortised retention: trim the history once per snapshot interval, not on every save
+            if revisions.is_snapshot_revision(phase_data_entry.revision):
+                compact_phase_revisions(phase_data_entry)
+            # Keep the search index in step with the data, in the same transaction
+            search_index.index_phase_data(db.session, SearchEntry, project_id, phase_id_int, new_data,
+                                          changed_keys=revisions.changed_keys(delta),
+                                          field_labels=get_search_field_labels(phase_id_int))
+            db.session.commit()
+            return
+        raise StaleDataError(f"Phase {phase_id_int} of project {project_id} kept changing during {attempts} save attempts.")
     except Exception as e:
         db.session.rollback()
-        flash("A database error occurred while saving your data. Please try again later.", "error")
+        if has_request_context():
+            flash("A database error occurred while saving your data. Please try again later.", "error")
         # Log error e
         # Depending on app structure, might re-raise or handle differently
         raise
 
+def patch_phase_data_fields(project_id: int, phase_id_int: int, fields: Dict[str, Any],
+                            base_revision: int, attempts: int = 5) -> Tuple[Optional[PhaseData], Optional[Dict[str, Any]]]:
+    """
+    Writes only `fields` into a phase's data, unless someone else changed any of them after
+    `base_revision` (the revision the client's form was loaded at).
+
+    Saves that touch other fields of the same phase are not conflicts: their changes are kept
+    and these fields are applied on top. The write itself is a compare-and-set on
+    PhaseData.revision, so two concurrent saves can never both win.
+
+    Returns (entry, conflicts): the refreshed PhaseData row, and for a refused write the
+    conflicting fields with their current server values (empty when the write succeeded).
+    conflicts is None when every attempt lost the race to other saves; the client should retry.
+    """
+    for _ in range(attempts):
+        entry = _get_or_create_phase_data_entry(project_id, phase_id_int)
+        if entry is None:
+            continue # Created concurrently; compare against that row instead
+
+        current_data = dict(entry.data or {})
+        current_revision = entry.revision or 0
+        if current_revision == 0 and base_revision != 0:
+            db.session.rollback() # The form was loaded from a row that no longer exists
+            return None, {key: None for key in fields}
+        if current_revision != base_revision:
+            base_data = get_phase_revision_data(entry, base_revision) if 0 < base_revision < current_revision else None
+            conflicts = {
+                key: current_data.get(key) for key, value in fields.items()
+                if current_data.get(key) != value and (base_data is None or base_data.get(key) != current_data.get(key))
+            }
+            if conflicts:
+                db.session.rollback()
+                return entry, conflicts
+
+        new_data = {**current_data, **fields}
+        delta = revisions.compute_delta(current_data, new_data)
+        if not delta:
+            db.session.commit() # No revision; only keeps a just-created empty row
+            return entry, {}
+        if not claim_next_phase_revision(entry, current_revision, new_data, delta):
+            db.session.rollback() # Lost the race to another save; re-read and re-check
+            continue
+
+        search_index.index_phase_data(db.session, SearchEntry, project_id, phase_id_int, new_data,
+                                      changed_keys=revisions.changed_keys(delta),
+                                      field_labels=get_search_field_labels(phase_id_int))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback() # Revision number taken by a concurrent save; re-read and re-check
+            continue
+        db.session.refresh(entry)
+        if revisions.is_snapshot_revision(entry.revision):
+            if compact_phase_revisions(entry):
+                db.session.commit()
+        return entry, {}
+
+    return PhaseData.query.filter_by(project_id=project_id, phase_id_int=phase_id_int).first(), None
+
+# --- Speculative Precompute ---
+def _speculative_jobs(phase_id_int: int) -> List[Tuple[str, Optional[List[str]]]]:
+    """(action, next phase field keys) of the clicks that usually follow a save of this phase."""
+    jobs = [(speculation.ACTION_SOLUTION_SUMMARY, None)]
+    next_phase_config = get_phase_config(phase_id_int + 1)
+    if next_phase_config and next_phase_config.fields:
+        jobs.append((speculation.ACTION_SEED_NEXT_PHASE, list(next_phase_config.fields.keys())))
+    return jobs
+
+def _speculative_key(project_id: int, phase_id_int: int, action: str, fingerprint: str) -> Tuple:
+    return (project_id, phase_id_int, action, fingerprint)
+
+def _speculative_budget_left(project_id: int) -> bool:
+    """Whether today's (UTC) global and per-project speculative call caps still allow one more."""
+    since = datetime.datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    global_count, project_count = db.session.query(
+        func.count(SpeculativeResult.id),
+        func.count(case((SpeculativeResult.project_id == project_id, 1)))
+    ).filter(SpeculativeResult.created_at >= since).one()
+    return (global_count < speculation.SPECULATIVE_DAILY_CAP_GLOBAL
+            and project_count < speculation.SPECULATIVE_DAILY_CAP_PER_PROJECT)
+
+def _run_speculative_job(entry_id: int, action: str, phase_data_json: str, next_phase_field_keys: Optional[List[str]]) -> None:
+    """Pool worker: makes the Gemini call and stores its result on the SpeculativeResult row."""
+    started = datetime.datetime.utcnow()
+    try:
+        if action == speculation.ACTION_SEED_NEXT_PHASE:
+            result = gemini_client.seed_next_phase_data(phase_data_json, next_phase_field_keys)
+        else:
+            result = gemini_client.generate_solution_summary(phase_data_json)
+        status = speculation.STATUS_FAILED if gemini_client.is_error_result(result) else speculation.STATUS_READY
+    except Exception:
+        app.logger.exception("Speculative %s failed", action)
+        result, status = None, speculation.STATUS_FAILED
+    with app.app_context():
+        try:
+            entry = db.session.get(SpeculativeResult, entry_id)
+            if entry is None:
+                return # Pruned meanwhile
+            entry.status = status
+            entry.result = result if status == speculation.STATUS_READY else None
+            entry.completed_at = datetime.datetime.utcnow()
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            app.logger.exception("Could not store speculative %s result %s", action, entry_id)
+            status = speculation.STATUS_FAILED
+    speculation.metrics.incr('completed' if status == speculation.STATUS_READY else 'failed')
+    speculation.log_event('completed', action=action, status=status, result_id=entry_id,
+                          seconds=round((datetime.datetime.utcnow() - started).total_seconds(), 3))
+
+def schedule_speculative_precompute(project_id: int, phase_id_int: int, phase_data: Dict[str, Any],
+                                    actions: Optional[List[str]] = None) -> int:
+    """
+    Queues the AI calls a save of this phase usually leads to (limited to `actions` if given),
+    when SPECULATIVE_PRECOMPUTE is on and there is spare capacity; see speculation.py.
+    Never raises: speculation must not break the save it follows. Returns the number queued.
+    """
+    if not speculation.SPECULATIVE_PRECOMPUTE or not phase_data:
+        return 0
+    queued = 0
+    try:
+        for action, next_phase_field_keys in _speculative_jobs(phase_id_int):
+            if actions is not None and action not in actions:
+                continue
+            fingerprint = speculation.fingerprint(action, phase_data, next_phase_field_keys)
+            existing = SpeculativeResult.query.filter_by(project_id=project_id, phase_id_int=phase_id_int,
+                                                         action=action, fingerprint=fingerprint).first()
+            if existing is not None:
+                stale_before = datetime.datetime.utcnow() - datetime.timedelta(seconds=speculation.SPECULATIVE_STALE_SECONDS)
+                if existing.status != speculation.STATUS_RUNNING or existing.created_at >= stale_before:
+                    continue # Already computed (or being computed) for exactly this input
+                db.session.delete(existing) # Abandoned by a process that died
+                db.session.flush()
+
+            if not speculation.pool.has_idle_worker():
+                speculation.metrics.incr('skipped_busy')
+                continue
+            if gemini_client.rate_limit_headroom() < speculation.SPECULATIVE_MIN_HEADROOM:
+                speculation.metrics.incr('skipped_rate_limit')
+                continue
+            if not _speculative_budget_left(project_id):
+                speculation.metrics.incr('skipped_daily_cap')
+                continue
+
+            entry = SpeculativeResult(project_id=project_id, phase_id_int=phase_id_int, action=action,
+                                      fingerprint=fingerprint, status=speculation.STATUS_RUNNING)
+            db.session.add(entry)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback() # Another process queued the same input first
+                continue
+            key = _speculative_key(project_id, phase_id_int, action, fingerprint)
+            if speculation.pool.submit(key, _run_speculative_job, entry.id, action,
+                                       json.dumps(phase_data), next_phase_field_keys) is None:
+                # The last idle worker was taken since the check above
+                db.session.delete(entry)
+                db.session.commit()
+                speculation.metrics.incr('skipped_busy')
+                continue
+            queued += 1
+            speculation.metrics.incr('scheduled')
+            speculation.log_event('scheduled', action=action, project_id=project_id, phase_id=phase_id_int, result_id=entry.id)
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception("Could not schedule speculative precompute for project %s phase %s", project_id, phase_id_int)
+    return queued
+
+async def claim_speculative_result(project_id: int, phase_id_int: int, action: str, phase_data: Dict[str, Any],
+                                   next_phase_field_keys: Optional[List[str]] = None) -> Optional[Any]:
+    """
+    Returns the precomputed result of `action` for exactly this input and marks it used, or None
+    (a miss: the caller makes the call itself). A matching call still running in this process is awaited.
+    """
+    if not speculation.SPECULATIVE_PRECOMPUTE:
+        return None
+    fingerprint = speculation.fingerprint(action, phase_data, next_phase_field_keys)
+    future = speculation.pool.in_flight(_speculative_key(project_id, phase_id_int, action, fingerprint))
+    if future is not None:
+        await asyncio.wrap_future(future) # Already part-way through the same call
+    claimed = await run_blocking(_claim_speculative_entry, project_id, phase_id_int, action, fingerprint)
+    if claimed is None:
+        speculation.metrics.incr('misses')
+        speculation.log_event('miss', action=action, project_id=project_id, phase_id=phase_id_int)
+        return None
+    speculation.metrics.incr('waited_hits' if future is not None else 'hits')
+    if claimed['completed_at']:
+        # The Gemini latency this click did not have to wait for (all of it, for a hit)
+        speculation.metrics.incr('saved_seconds', (claimed['completed_at'] - claimed['created_at']).total_seconds())
+    speculation.log_event('hit', action=action, project_id=project_id, phase_id=phase_id_int,
+                          result_id=claimed['id'], waited=future is not None)
+    return claimed['result']
+
+def _claim_speculative_entry(project_id: int, phase_id_int: int, action: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+    """
+    The database side of claim_speculative_result: the claimed entry's id, result and timestamps,
+    copied out of the ORM object (its caller runs on the event loop), or None.
+    """
+    try:
+        entry = SpeculativeResult.query.filter_by(project_id=project_id, phase_id_int=phase_id_int, action=action,
+                                                  fingerprint=fingerprint, status=speculation.STATUS_READY,
+                                                  consumed_at=None).first()
+        # Single use, claimed with a conditional update so two clicks cannot both take it
+        claimed = entry is not None and db.session.execute(
+            update(SpeculativeResult)
+            .where(SpeculativeResult.id == entry.id, SpeculativeResult.consumed_at.is_(None))
+            .values(consumed_at=datetime.datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+        db.session.commit()
+        if not claimed:
+            return None
+        return {'id': entry.id, 'result': entry.result, 'created_at': entry.created_at, 'completed_at': entry.completed_at}
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception("Could not claim speculative %s result", action)
+        return None
+
+def get_speculation_stats(days: int = 7) -> Dict[str, Any]:
+    """Speculative calls of the last `days` days by action and outcome, plus this process's counters."""
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    rows = db.session.query(
+        SpeculativeResult.action, SpeculativeResult.status,
+        func.count(SpeculativeResult.id), func.count(SpeculativeResult.consumed_at)
+    ).filter(SpeculativeResult.created_at >= since).group_by(SpeculativeResult.action, SpeculativeResult.status).all()
+
+    actions: Dict[str, Dict[str, Any]] = {}
+    for action, status, count, used in rows:
+        totals = actions.setdefault(action, {'calls': 0, 'ready': 0, 'running': 0, 'failed': 0, 'used': 0})
+        totals['calls'] += count
+        totals[status] = totals.get(status, 0) + count
+        totals['used'] += used
+    for totals in actions.values():
+        totals['unused'] = totals['ready'] - totals['used']
+        # Share of the speculative calls that a click went on to use
+        totals['hit_rate'] = round(totals['used'] / totals['calls'], 4) if totals['calls'] else None
+    return {
+        'enabled': speculation.SPECULATIVE_PRECOMPUTE,
+        'days': days,
+        'actions': actions,
+        'process': speculation.metrics.snapshot(),
+    }
+
+# --- Bulk Import/Export ---
+def resolve_bulk_projects(records: List[bulk_io.BulkRecord], project_map: Dict[Tuple[Any, ...], int],
+                          report: bulk_io.BulkImportReport,
+                          match_ids: bool = False) -> Tuple[List[bulk_io.BulkRecord], List[Tuple[Any, ...]]]:
+    """
+    Points every record at an existing or newly created project, with one lookup query per chunk.
+
+    A project_id without a project_name must exist and is used as-is. With a project_name, the
+    id is only trusted when the existing project has that name (or match_ids is set): otherwise
+    it is a source id from another database, and one new project is created per source id, so
+    colliding ids never merge data into unrelated projects. A project_name alone reuses the oldest
+    project of that name or creates it. project_map carries these decisions across chunks of
+    the same import. Returns the resolved records and the project_map keys created here (so a
+    failed chunk can forget them).
+    """
+    wanted_ids = {r.project_id for r in records if r.project_id is not None and ('id', r.project_id) not in project_map}
+    if wanted_ids:
+        for project_id, name in db.session.query(Project.id, Project.name).filter(Project.id.in_(wanted_ids)):
+            project_map[('id', project_id)] = project_id
+            project_map[('id', project_id, name)] = project_id
+
+    def _key(record):
+        if record.project_id is not None and not record.project_name:
+            return ('id', record.project_id) if ('id', record.project_id) in project_map else None
+        if record.project_id is not None:
+            if match_ids and ('id', record.project_id) in project_map:
+                return ('id', record.project_id)
+            if ('id', record.project_id, record.project_name) in project_map:
+                return ('id', record.project_id, record.project_name)
+            return ('source', record.project_id) # Source id from another database: one new project per id
+        if record.project_name:
+            return ('name', record.project_name)
+        return None
+
+    wanted_names = {r.project_name for r in records if r.project_id is None and r.project_name
+                    and ('name', r.project_name) not in project_map}
+    if wanted_names:
+        for project_id, name in (db.session.query(Project.id, Project.name)
+                                 .filter(Project.name.in_(wanted_names)).order_by(Project.id.desc())):
+            project_map[('name', name)] = project_id # Newest first, so the oldest project of each name wins
+
+    resolved, new_projects = [], {}
+    for record in records:
+        key = _key(record)
+        if key is None:
+            report.add_error(record.line_no, f"Project {record.project_id} does not exist and no 'project_name' was given.")
+            continue
+        if key not in project_map and key not in new_projects:
+            new_projects[key] = Project(name=record.project_name)
+        resolved.append((key, record))
+
+    if new_projects:
+        db.session.add_all(new_projects.values())
+        db.session.flush() # Assigns the ids the phase rows refer to
+        for key, project in new_projects.items():
+            project_map[key] = project.id
+        report.projects_created += len(new_projects)
+    for key, record in resolved:
+        record.project_id = project_map[key]
+    return [record for _, record in resolved], list(new_projects)
+
+def _dialect_upsert(table, rows: List[Dict[str, Any]]):
+    """A multi-row INSERT ... ON CONFLICT DO UPDATE for phase_data, or None if the database has no upsert."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        stmt = sqlite_insert(table).values(rows)
+    elif dialect == 'postgresql':
+        stmt = postgresql_insert(table).values(rows)
+    else:
+        return None
+    return stmt.on_conflict_do_update(
+        index_elements=['project_id', 'phase_id_int'],
+        set_={'data': stmt.excluded.data, 'last_modified': stmt.excluded.last_modified,
+              'revision': stmt.excluded.revision},
+    ).returning(table.c.id, table.c.project_id, table.c.phase_id_int)
+
+def bulk_upsert_phase_data(records: List[bulk_io.BulkRecord], replace: bool = False) -> int:
+    """
+    Writes one chunk of validated, project-resolved records in the caller's transaction and
+    returns the number of phase rows written.
+
+    Existing rows are loaded with one query and merged in Python, then written with a single
+    multi-row upsert; their revisions and search entries follow as two bulk inserts. Several
+    records for the same project phase are applied in input order. Unchanged rows are skipped.
+    """
+    incoming: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    for record in records:
+        key = (record.project_id, record.phase_id)
+        if replace or key not in incoming:
+            incoming[key] = dict(record.data)
+        else:
+            incoming[key].update(record.data)
+    if not incoming:
+        return 0
+
+    existing = {
+        (row.project_id, row.phase_id_int): row
+        for row in db.session.execute(
+            select(PhaseData.id, PhaseData.project_id, PhaseData.phase_id_int, PhaseData.data, PhaseData.revision)
+            .where(tuple_(PhaseData.project_id, PhaseData.phase_id_int).in_(list(incoming)))
+            .with_for_update() # Row locks on PostgreSQL; SQLite serialises writers anyway
+        )
+    }
+
+    now = datetime.datetime.utcnow()
+    rows, changes = [], {}
+    for key, data in incoming.items():
+        current = existing.get(key)
+        old_data = dict(current.data or {}) if current else {}
+        new_data = data if replace else {**old_data, **data}
+        delta = revisions.compute_delta(old_data, new_data)
+        if current and not delta:
+            continue
+        base_revision = (current.revision or 0) if current else 0
+        revision = base_revision + 1 if delta else base_revision
+        rows.append({'project_id': key[0], 'phase_id_int': key[1], 'data': new_data,
+                     'last_modified': now, 'revision': revision})
+        changes[key] = (new_data, delta, revision)
+    if not rows:
+        return 0
+
+    stmt = _dialect_upsert(PhaseData.__table__, rows)
+    if stmt is not None:
+        ids = {(r.project_id, r.phase_id_int): r.id for r in db.session.execute(stmt)}
+    else:
+        # No native upsert: fall back to the ORM, still within this one transaction
+        ids = {}
+        for row in rows:
+            key = (row['project_id'], row['phase_id_int'])
+            entry = db.session.get(PhaseData, existing[key].id) if key in existing else PhaseData(**row)
+            if key in existing:
+                entry.data, entry.last_modified, entry.revision = row['data'], row['last_modified'], row['revision']
+                flag_modified(entry, "data")
+            else:
+                db.session.add(entry)
+            db.session.flush()
+            ids[key] = entry.id
+
+    revision_rows = []
+    for key, (new_data, delta, revision) in changes.items():
+        if not delta:
+            continue
+        is_snapshot = revisions.is_snapshot_revision(revision)
+        revision_rows.append({'phase_data_id': ids[key], 'revision': revision, 'is_snapshot': is_snapshot,
+                              'payload': dict(new_data) if is_snapshot else delta, 'created_at': now})
+    if revision_rows:
+        db.session.execute(insert(PhaseRevision), revision_rows)
+
+    # Re-index every written row from scratch: one delete and one multi-row insert for the chunk
+    db.session.execute(delete(SearchEntry).where(
+        tuple_(SearchEntry.project_id, SearchEntry.phase_id_int).in_(list(changes)),
+        SearchEntry.source == search_index.SOURCE_PHASE_DATA,
+    ))
+    labels = {}
+    entry_rows = []
+    for (project_id, phase_id_int), (new_data, _, _) in changes.items():
+        if phase_id_int not in labels:
+            labels[phase_id_int] = get_search_field_labels(phase_id_int)
+        entry_rows.extend(search_index.phase_data_entry_rows(project_id, phase_id_int, new_data,
+                                                             field_labels=labels[phase_id_int]))
+    if entry_rows:
+        db.session.execute(insert(SearchEntry), entry_rows)
+    return len(rows)
+
+def import_phase_data_records(raw_records, replace: bool = False, chunk_size: int = bulk_io.BULK_CHUNK_SIZE,
+                              dry_run: bool = False, match_ids: bool = False) -> bulk_io.BulkImportReport:
+    """
+    Validates and writes (line number, decoded record) pairs in chunks of `chunk_size`, one
+    transaction per chunk. Invalid records are reported and skipped; a chunk the database
+    rejects is rolled back and reported without stopping the import. With dry_run nothing is written.
+    match_ids trusts record project_ids even when the project names differ (see resolve_bulk_projects).
+    """
+    report = bulk_io.BulkImportReport()
+    project_map: Dict[Tuple[Any, ...], int] = {}
+
+    def _valid_records():
+        for line_no, raw in raw_records:
+            report.records += 1
+            try:
+                record = bulk_io.validate_record(line_no, raw)
+            except bulk_io.BulkRecordError as e:
+                report.add_error(line_no, str(e))
+                continue
+            report.valid += 1
+            yield record
+
+    try:
+        for chunk in bulk_io.chunked(_valid_records(), chunk_size):
+            if dry_run:
+                continue
+            created = []
+            try:
+                records, created = resolve_bulk_projects(chunk, project_map, report, match_ids=match_ids)
+                written = bulk_upsert_phase_data(records, replace=replace)
+                db.session.commit()
+                report.upserted += written
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                for key in created:
+                    project_map.pop(key, None)
+                report.projects_created -= len(created)
+                for record in chunk:
+                    report.add_error(record.line_no, f"Database error, chunk rolled back: {type(e).__name__}")
+    except (ValueError, UnicodeDecodeError) as e:
+        # Unreadable input (e.g. a malformed JSON document); chunks written before this point stay committed
+        report.add_error(report.records, f"Input aborted: {e}")
+    return report
+
+def iter_phase_data_export(project_ids: Optional[List[int]] = None, batch_size: int = 500):
+    """Yields every phase data row as an NDJSON line, in keyset-paged batches of plain column tuples."""
+    last_id = 0
+    while True:
+        query = (select(PhaseData.id, PhaseData.project_id, PhaseData.phase_id_int, PhaseData.revision,
+                        PhaseData.last_modified, PhaseData.data, Project.name)
+                 .join(Project, Project.id == PhaseData.project_id)
+                 .where(PhaseData.id > last_id)
+                 .order_by(PhaseData.id)
+                 .limit(batch_size))
+        if project_ids:
+            query = query.where(PhaseData.project_id.in_(project_ids))
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        for row in rows:
+            yield bulk_io.export_line(row.project_id, row.phase_id_int, row.data, revision=row.revision,
+                                      last_modified=row.last_modified, project_name=row.name)
+
+def select_regeneration_targets(phase_ids: Optional[List[int]] = None, project_ids: Optional[List[int]] = None,
+                                config_version: Optional[str] = None, built_before: Optional[datetime.datetime] = None,
+                                include_unbuilt: bool = False, force: bool = False) -> List[Tuple[int, int]]:
+    """
+    (project_id, phase_id_int) pairs whose document should be rebuilt, judged by each phase's latest build:
+    its config version differs from `config_version` (default: the phase's current document_config_version)
+    or is unknown, or it was built before `built_before`. Phases never built are only included with
+    include_unbuilt; force selects every phase that has data. Phases default to all with a document outline.
+    """
+    if not phase_ids:
+        phase_ids = [phase.id for phase in get_all_phases() if phase.document and phase.document.outline]
+    if not phase_ids:
+        return []
+    latest = (select(GeneratedDocument.project_id, GeneratedDocument.phase_id_int,
+                     func.max(GeneratedDocument.build_no).label('build_no'))
+              .group_by(GeneratedDocument.project_id, GeneratedDocument.phase_id_int)
+              .subquery())
+    query = (select(PhaseData.project_id, PhaseData.phase_id_int, GeneratedDocument.id.label('document_id'),
+                    GeneratedDocument.config_version, GeneratedDocument.created_at)
+             .outerjoin(latest, (latest.c.project_id == PhaseData.project_id)
+                        & (latest.c.phase_id_int == PhaseData.phase_id_int))
+             .outerjoin(GeneratedDocument, (GeneratedDocument.project_id == latest.c.project_id)
+                        & (GeneratedDocument.phase_id_int == latest.c.phase_id_int)
+                        & (GeneratedDocument.build_no == latest.c.build_no))
+             .where(PhaseData.phase_id_int.in_(phase_ids))
+             .order_by(PhaseData.project_id, PhaseData.phase_id_int))
+    if project_ids:
+        query = query.where(PhaseData.project_id.in_(project_ids))
+
+    target_versions = {phase_id: config_version or document_config_version(phase_id) for phase_id in phase_ids}
+    targets = []
+    for row in db.session.execute(query):
+        if row.document_id is None:
+            selected = include_unbuilt or force
+        else:
+            selected = (force
+                        or row.config_version is None
+                        or row.config_version != target_versions[row.phase_id_int]
+                        or (built_before is not None and row.created_at < built_before))
+        if selected:
+            targets.append((row.project_id, row.phase_id_int))
+    return targets
+
+def _regeneration_worker_init(rate_limiter, call_slots) -> None:
+    """Process pool initializer: every worker's Gemini calls go through the batch-wide limits."""
+    gemini_client.use_shared_limits(rate_limiter, call_slots)
+
+def regenerate_document_item(item_id: int) -> Dict[str, Any]:
+    """
+    Rebuilds the document of one regeneration item and checkpoints it (runs in a pool worker, or in
+    process with --workers 0). A build with failed sections is not stored; the item is marked failed.
+    """
+    started = time.monotonic()
+    with app.app_context():
+        item = db.session.get(RegenerationItem, item_id)
+        result = {'item_id': item_id, 'project_id': item.project_id if item else None,
+                  'phase_id': item.phase_id_int if item else None, 'error': None}
+        if item is None or item.status == batch_regen.ITEM_DONE: # Done by a concurrent resume
+            result.update(status=batch_regen.ITEM_DONE, seconds=0.0)
+            return result
+        try:
+            current_phase_data = get_current_phase_data_db(item.project_id, item.phase_id_int)
+            if not current_phase_data:
+                raise ValueError("No data entered for this phase.")
+            content = asyncio.run(build_document_for_phase_async(
+                item.phase_id_int, current_phase_data, get_all_project_phase_data_db(item.project_id)))
+            if content.startswith('# Error'):
+                raise ValueError(content.splitlines()[-1])
+            failed_sections = [heading for heading, body in split_document_sections(content)
+                               if heading and gemini_client.is_error_result(body)]
+            if failed_sections:
+                raise ValueError(f"{len(failed_sections)} section(s) failed, first: {failed_sections[0]}")
+            save_document_build(item.project_id, item.phase_id_int, content, checkpoint=item)
+            result['status'] = batch_regen.ITEM_DONE
+        except Exception as e:
+            db.session.rollback()
+            item = db.session.get(RegenerationItem, item_id)
+            item.status = batch_regen.ITEM_FAILED
+            item.error = f"{type(e).__name__}: {e}"[:2000]
+            item.finished_at = datetime.datetime.utcnow()
+            db.session.commit()
+            result.update(status=batch_regen.ITEM_FAILED, error=item.error)
+    result['seconds'] = round(time.monotonic() - started, 3)
+    return result
+
 # --- Context Processors (Variables available in all templates) ---
 @app.context_processor
 def inject_global_template_vars():
@@ -135,9 +1124,20 @@ def inject_global_template_vars():
         if not any(p.id == active_phase_id for p in all_phases_list):
             active_phase_id = all_phases_list[0].id if all_phases_list else 1
 
+    active_project_id = session.get('current_project_id')
+    if not isinstance(active_project_id, int):
+        active_project_id = None # Resolved (default project) on first phase visit
+
+    def phase_url(phase_id: int) -> str:
+        if active_project_id is None:
+            return url_for('show_current_project_phase', phase_id=phase_id)
+        return url_for('show_phase', project_id=active_project_id, phase_id=phase_id)
+
     return dict(
         get_all_phases_for_nav=get_all_phases, # Function to get phases for navigation
         active_phase_id=active_phase_id,
+        active_project_id=active_project_id,
+        phase_url=phase_url, # Phase link within the active project
         max_phase_id=max_p_id
     )
 
@@ -150,16 +1150,62 @@ def index():
     session.setdefault('current_phase_id', default_start_phase)
     return render_template('index.html')
 
+PROJECTS_PAGE_SIZE = 50
+
+@app.route('/projects', methods=['GET'])
+def list_projects():
+    before_id = request.args.get('before', type=int)
+    project_summaries, next_before_id = get_project_summaries(PROJECTS_PAGE_SIZE, before_id)
+    return render_template(
+        'projects.html',
+        projects=project_summaries,
+        next_before_id=next_before_id,
+        phases=get_all_phases()
+    )
+
+@app.route('/projects', methods=['POST'])
+def create_project():
+    name = (request.form.get('name') or '').strip() or "Untitled Project"
+    project = Project(name=name)
+    db.session.add(project)
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        flash("A database error occurred while creating the project. Please try again later.", "error")
+        raise
+    session['current_project_id'] = project.id
+    flash(f"Project '{project.name}' created.", "success")
+    all_phases = get_all_phases()
+    return redirect(url_for('show_phase', project_id=project.id, phase_id=all_phases[0].id if all_phases else 1))
+
+# Legacy single-project URLs: forward to the project selected in the session.
 @app.route('/phase/<int:phase_id>', methods=['GET'])
-def show_phase(phase_id: int):
+def show_current_project_phase(phase_id: int):
+    return redirect(url_for('show_phase', project_id=get_current_project().id, phase_id=phase_id))
+
+@app.route('/phase/<int:phase_id>/action', methods=['POST'])
+def handle_current_project_phase_action(phase_id: int):
+    # 307 keeps the method and form body
+    return redirect(url_for('handle_phase_action', project_id=get_current_project().id, phase_id=phase_id), code=307)
+
+@app.route('/project/<int:project_id>/phase/<int:phase_id>', methods=['GET'])
+def show_phase(project_id: int, phase_id: int):
     phase_config = get_phase_config(phase_id)
     if not phase_config:
         flash(f"Error: Phase {phase_id} configuration not found.", "error")
         return redirect(url_for('index'))
 
-    project = get_or_create_default_project()
+    project = Project.query.get_or_404(project_id)
+    session['current_project_id'] = project.id
     session['current_phase_id'] = phase_id # Update current phase in session
     current_phase_db_data = get_current_phase_data_db(project.id, phase_id)
+    phase_revision = db.session.query(PhaseData.revision).filter_by(project_id=project.id, phase_id_int=phase_id).scalar() or 0
+    return render_phase_page(project, phase_config, current_phase_db_data, phase_revision)
+
+def render_phase_page(project: Project, phase_config, phase_data: Dict[str, Any], phase_revision: int):
+    """The phase form showing `phase_data`; its saves are checked against `phase_revision`."""
+    phase_id = phase_config.id
     all_project_db_data = get_all_project_phase_data_db(project.id)
 
     # Construct the path for the phase-specific template
@@ -167,48 +1213,107 @@ def show_phase(phase_id: int):
     # Basic check if template might exist (more robust checks might involve os.path.exists on template dir)
     # For now, we assume if config exists, template should too, or Flask will error.
 
+    with instrumentation.span('json', 'debug view'):
+        phase_data_json_str = json.dumps(phase_data, indent=2)
+        all_project_data_json_str = json.dumps(all_project_db_data, indent=2)
     return render_template(
         template_name,
+        project=project,
         phase_config=phase_config,
-        phase_data=current_phase_db_data,
-        phase_data_json_str=json.dumps(current_phase_db_data, indent=2), # For debug view
-        all_project_data_json_str=json.dumps(all_project_db_data, indent=2) # For debug view
+        phase_data=phase_data,
+        phase_revision=phase_revision,
+        phase_data_json_str=phase_data_json_str, # For debug view
+        all_project_data_json_str=all_project_data_json_str # For debug view
     )
 
-@app.route('/phase/<int:phase_id>/action', methods=['POST'])
-def handle_phase_action(phase_id: int):
+# Set in the WSGI environ of requests that asgi.py serves natively on its shared event loop
+NATIVE_ASYNC_ENVIRON_KEY = 'engpartner.native_async'
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs blocking work (queries, file writes, template rendering) from an async view. Requests
+    served natively (asgi.py) share one event loop, so there it runs in a worker thread, which
+    sees the request's contexts; under WSGI the request has a loop of its own and it runs inline.
+
+    Natively, the session's transaction is also ended afterwards, so a request waiting on Gemini
+    holds no pooled connection (hundreds of them wait at once). Committing expires loaded objects:
+    read their attributes inside `func`, not on the event loop.
+    """
+    if has_request_context() and request.environ.get(NATIVE_ASYNC_ENVIRON_KEY):
+        return await asyncio.to_thread(_run_and_release_connection, func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+def _run_and_release_connection(func, *args, **kwargs):
+    try:
+        result = func(*args, **kwargs)
+    except BaseException:
+        db.session.rollback()
+        raise
+    if db.session().in_transaction():
+        db.session.commit()
+    return result
+
+# AI actions are awaited rather than blocking: requires Flask's async extra (asgiref).
+# Under a WSGI server, asgiref gives each request its own event loop in its worker thread, so a
+# request still occupies a thread while it waits for Gemini; there the async path only buys
+# concurrency within a request (the sections of a document are generated concurrently).
+# Served through asgi.py this route runs natively on one event loop instead: waiting requests
+# hold no thread, and only their database work borrows one (run_blocking).
+@app.route('/project/<int:project_id>/phase/<int:phase_id>/action', methods=['POST'])
+async def handle_phase_action(project_id: int, phase_id: int):
     phase_config = get_phase_config(phase_id)
     if not phase_config:
         flash(f"Action Error: Phase {phase_id} configuration not found.", "error")
         return redirect(request.referrer or url_for('index'))
 
-    project = get_or_create_default_project()
+    project = await run_blocking(Project.query.get_or_404, project_id)
     action = request.form.get('action')
     # Get existing data for the current phase from DB
-    current_phase_data_from_db = get_current_phase_data_db(project.id, phase_id)
+    current_phase_data_from_db = await run_blocking(get_current_phase_data_db, project_id, phase_id)
 
     # Update core field data from the form for the current phase
     new_field_data = {}
     for field_key in phase_config.fields.keys():
         new_field_data[field_key] = request.form.get(field_key, current_phase_data_from_db.get(field_key, ''))
 
-    # Save the updated form field data to the database
-    update_current_phase_data_db(project.id, phase_id, new_field_data)
+    # Save the form fields, unless someone else changed any of them since the form was loaded
+    # (same compare-and-set as autosave; a form without a revision counts as loaded before any save)
+    entry, conflicts = await run_blocking(patch_phase_data_fields, project_id, phase_id, new_field_data,
+                                          request.form.get('revision', 0, type=int))
+    if conflicts is None:
+        flash("This phase is being saved by others right now. Please submit again.", "warning")
+        return await run_blocking(lambda: render_phase_page(project, phase_config, {**current_phase_data_from_db, **new_field_data},
+                                                            entry.revision if entry else 0)), 503
+    if conflicts:
+        labels = [phase_config.fields[key].label if key in phase_config.fields else key for key in conflicts]
+        flash(f"Not saved: {', '.join(labels)} changed since you opened this page. Your version is shown below; "
+              f"submit again to overwrite the other changes, or reload the page to see them.", "error")
+        # Their changes are kept in the database; resubmitting is based on the revision that has them
+        return await run_blocking(lambda: render_phase_page(project, phase_config, {**current_phase_data_from_db, **new_field_data},
+                                                            entry.revision if entry else 0)), 409
 
     # Fetch the fully updated data (including just-saved form fields) for AI actions
     # This re-fetches to ensure we have the absolute latest, though new_field_data could be merged with existing if careful
-    updated_current_phase_data_for_ai = get_current_phase_data_db(project.id, phase_id)
+    updated_current_phase_data_for_ai = await run_blocking(get_current_phase_data_db, project_id, phase_id)
 
     if action == 'save':
         flash(f"Phase {phase_id} data saved successfully to database!", "success")
+        # Have "Generate Solution" / "Seed" ready before they are clicked (opt-in, see speculation.py)
+        await run_blocking(schedule_speculative_precompute, project_id, phase_id, updated_current_phase_data_for_ai)
 
     elif action == 'generate_solution':
         if not updated_current_phase_data_for_ai:
             flash("Cannot generate solution: No data entered for this phase yet.", "warning")
         else:
-            solution_summary = generate_solution_summary(json.dumps(updated_current_phase_data_for_ai))
+            solution_summary = await claim_speculative_result(project_id, phase_id, speculation.ACTION_SOLUTION_SUMMARY,
+                                                              updated_current_phase_data_for_ai)
+            if solution_summary is None:
+                solution_summary = await generate_solution_summary_async(json.dumps(updated_current_phase_data_for_ai))
             # Save summary to the database for the current phase
-            update_current_phase_data_db(project.id, phase_id, {'_solution_summary': solution_summary})
+            await run_blocking(update_current_phase_data_db, project_id, phase_id, {'_solution_summary': solution_summary})
+            # The seed prompt includes the summary, so speculate on the data as it is now
+            await run_blocking(lambda: schedule_speculative_precompute(project_id, phase_id, get_current_phase_data_db(project_id, phase_id),
+                                                                       actions=[speculation.ACTION_SEED_NEXT_PHASE]))
             flash("AI Solution Summary generated and updated in database.", "info")
 
     elif action == 'generate_doc':
@@ -218,21 +1323,14 @@ def handle_phase_action(phase_id: int):
              flash(f"Document generation skipped: No document outline configured for Phase {phase_id}.", "warning")
         else:
             # For document generation, we need all data for the project
-            all_project_data_from_db = get_all_project_phase_data_db(project.id)
-            full_doc_content = build_document_for_phase(phase_id, updated_current_phase_data_for_ai, all_project_data_from_db)
-
-            doc_filename_base = phase_config.document.name if phase_config.document else f"phase_{phase_id}_doc.md"
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            doc_filename = secure_filename(f"{doc_filename_base.split('.')[0]}_{timestamp}.md")
-            doc_filepath = os.path.join(app.config['UPLOAD_FOLDER'], doc_filename)
+            all_project_data_from_db = await run_blocking(get_all_project_phase_data_db, project_id)
+            full_doc_content = await build_document_for_phase_async(phase_id, updated_current_phase_data_for_ai, all_project_data_from_db)
 
             try:
-                with open(doc_filepath, 'w', encoding='utf-8') as f:
-                    f.write(full_doc_content)
-                # Store filename in the database for the current phase for download link
-                update_current_phase_data_db(project.id, phase_id, {'_generated_doc_filename': doc_filename})
-                flash(f"Document '{doc_filename}' generated! Click download button below.", "success")
+                filename = await run_blocking(lambda: save_document_build(project_id, phase_id, full_doc_content).filename)
+                flash(f"Document '{filename}' generated! Click download button below.", "success")
             except IOError as e:
+                await run_blocking(db.session.rollback)
                 flash(f"Error saving document to server: {e}", "error")
 
     elif action == 'seed_next':
@@ -247,17 +1345,362 @@ def handle_phase_action(phase_id: int):
             if not next_phase_field_keys:
                 flash(f"Cannot seed: Next phase ({next_phase_id}) has no fields configured.", "warning")
             else:
-                seeded_data_for_next = seed_next_phase_data(json.dumps(updated_current_phase_data_for_ai), next_phase_field_keys)
+                seeded_data_for_next = await claim_speculative_result(project_id, phase_id, speculation.ACTION_SEED_NEXT_PHASE,
+                                                                      updated_current_phase_data_for_ai, next_phase_field_keys)
+                if seeded_data_for_next is None:
+                    seeded_data_for_next = await seed_next_phase_data_async(json.dumps(updated_current_phase_data_for_ai), next_phase_field_keys)
                 # Save seeded data to the database for the next phase
-                update_current_phase_data_db(project.id, next_phase_id, seeded_data_for_next)
+                await run_blocking(update_current_phase_data_db, project_id, next_phase_id, seeded_data_for_next)
                 flash(f"Phase {next_phase_id} has been seeded with data from Phase {phase_id} and saved to database!", "info")
                 session['current_phase_id'] = next_phase_id # Navigate user to the next phase
-                return redirect(url_for('show_phase', phase_id=next_phase_id))
+                return redirect(url_for('show_phase', project_id=project_id, phase_id=next_phase_id))
     else:
         flash(f"Unknown action: '{action}'.", "warning")
 
-    return redirect(url_for('show_phase', phase_id=phase_id))
+    return redirect(url_for('show_phase', project_id=project_id, phase_id=phase_id))
+
+# Autosave: the phase page sends only the fields edited since its last save (static/js/autosave.js)
+@app.route('/project/<int:project_id>/phase/<int:phase_id>/data', methods=['PATCH'])
+def patch_phase_data(project_id: int, phase_id: int):
+    """
+    Body: {"revision": <revision the form was loaded at>, "fields": {field_key: text, ...}}.
+    200 with the new revision, or 409 with the fields someone else changed in the meantime.
+    """
+    phase_config = get_phase_config(phase_id)
+    if not phase_config:
+        abort(404)
+    Project.query.get_or_404(project_id)
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('fields'), dict) \
+            or not isinstance(payload.get('revision'), int) or isinstance(payload.get('revision'), bool):
+        return jsonify({'error': "Expected {\"revision\": <int>, \"fields\": {...}}."}), 400
+    fields = payload['fields']
+    unknown_keys = sorted(key for key in fields if key not in phase_config.fields)
+    if unknown_keys:
+        return jsonify({'error': f"Unknown field(s) for phase {phase_id}: {', '.join(unknown_keys)}."}), 400
+    if not all(isinstance(value, str) for value in fields.values()):
+        return jsonify({'error': "Field values must be strings."}), 400
+
+    try:
+        entry, conflicts = patch_phase_data_fields(project_id, phase_id, fields, payload['revision'])
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify({'error': "A database error occurred while saving your data. Please try again later."}), 503
+
+    revision = entry.revision if entry else 0
+    if conflicts is None:
+        response = jsonify({'error': "The phase is being saved by others right now; retrying.", 'revision': revision})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    if conflicts:
+        return jsonify({'error': 'conflict', 'revision': revision, 'conflicts': conflicts}), 409
+    return jsonify({
+        'revision': revision,
+        'saved': sorted(fields),
+        'last_modified': entry.last_modified.isoformat() if entry and entry.last_modified else None,
+    })
+
+REVISIONS_PAGE_SIZE = 50
+
+def get_phase_data_entry_or_404(project_id: int, phase_id: int) -> PhaseData:
+    return PhaseData.query.filter_by(project_id=project_id, phase_id_int=phase_id).first_or_404()
+
+@app.route('/project/<int:project_id>/phase/<int:phase_id>/revisions', methods=['GET'])
+def list_phase_revisions(project_id: int, phase_id: int):
+    phase_config = get_phase_config(phase_id)
+    if not phase_config:
+        abort(404)
+    project = Project.query.get_or_404(project_id)
+    phase_data_entry = get_phase_data_entry_or_404(project_id, phase_id)
+
+    before = request.args.get('before', type=int)
+    query = phase_data_entry.revisions.order_by(PhaseRevision.revision.desc())
+    if before is not None:
+        query = query.filter(PhaseRevision.revision < before)
+    revision_rows = query.limit(REVISIONS_PAGE_SIZE + 1).all()
+    next_before = revision_rows[REVISIONS_PAGE_SIZE - 1].revision if len(revision_rows) > REVISIONS_PAGE_SIZE else None
+
+    return render_template(
+        'revisions.html',
+        project=project,
+        phase_config=phase_config,
+        phase_data_entry=phase_data_entry,
+        revision_rows=revision_rows[:REVISIONS_PAGE_SIZE],
+        next_before=next_before,
+        changed_keys=revisions.changed_keys
+    )
+
+@app.route('/project/<int:project_id>/phase/<int:phase_id>/revisions/<int:revision>', methods=['GET'])
+def get_phase_revision(project_id: int, phase_id: int, revision: int):
+    phase_data_entry = get_phase_data_entry_or_404(project_id, phase_id)
+    data = get_phase_revision_data(phase_data_entry, revision)
+    if data is None:
+        abort(404)
+    return jsonify({'project_id': project_id, 'phase_id': phase_id, 'revision': revision, 'data': data})
+
+@app.route('/project/<int:project_id>/phase/<int:phase_id>/revisions/<int:from_revision>/diff/<int:to_revision>', methods=['GET'])
+def diff_phase_revisions(project_id: int, phase_id: int, from_revision: int, to_revision: int):
+    phase_data_entry = get_phase_data_entry_or_404(project_id, phase_id)
+    old_data = get_phase_revision_data(phase_data_entry, from_revision)
+    new_data = get_phase_revision_data(phase_data_entry, to_revision)
+    if old_data is None or new_data is None:
+        abort(404)
+    return jsonify({
+        'project_id': project_id,
+        'phase_id': phase_id,
+        'from_revision': from_revision,
+        'to_revision': to_revision,
+        'diff': revisions.diff(old_data, new_data)
+    })
 
+@app.route('/project/<int:project_id>/phase/<int:phase_id>/revisions/<int:revision>/restore', methods=['POST'])
+def restore_phase_revision(project_id: int, phase_id: int, revision: int):
+    phase_data_entry = get_phase_data_entry_or_404(project_id, phase_id)
+    data = get_phase_revision_data(phase_data_entry, revision)
+    if data is None:
+        flash(f"Revision {revision} is no longer available.", "error")
+        return redirect(url_for('list_phase_revisions', project_id=project_id, phase_id=phase_id))
+    # Restoring is itself a new revision, so it can be undone too
+    update_current_phase_data_db(project_id, phase_id, data, replace=True)
+    flash(f"Phase {phase_id} restored to revision {revision}.", "success")
+    return redirect(url_for('show_phase', project_id=project_id, phase_id=phase_id))
+
+SEARCH_PAGE_SIZE = 20
+
+@app.route('/search', methods=['GET'])
+def search():
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    project_id = request.args.get('project', type=int)
+
+    hits, has_next = [], False
+    if query:
+        # Fetch one extra row to know whether there is a next page without counting every match
+        hits = search_index.search(db.session, query, SEARCH_PAGE_SIZE + 1,
+                                   offset=(page - 1) * SEARCH_PAGE_SIZE, project_id=project_id)
+        has_next = len(hits) > SEARCH_PAGE_SIZE
+        hits = hits[:SEARCH_PAGE_SIZE]
+
+    project_names = {}
+    if hits:
+        project_ids = {hit['project_id'] for hit in hits}
+        project_names = dict(db.session.query(Project.id, Project.name).filter(Project.id.in_(project_ids)).all())
+    phase_titles = {p.id: p.title for p in get_all_phases()}
+
+    return render_template(
+        'search.html',
+        query=query,
+        hits=hits,
+        page=page,
+        has_next=has_next,
+        project_filter=project_id,
+        project_names=project_names,
+        phase_titles=phase_titles
+    )
+
+@app.route('/documents/<int:document_id>/download')
+def download_document(document_id: int):
+    document = GeneratedDocument.query.get_or_404(document_id)
+    store = get_document_store()
+    blob_path = store.find(document.content_hash)
+    if blob_path is None:
+        flash("Error: Requested file not found on server.", "error")
+        return redirect(request.referrer or url_for('index'))
+
+    # Content-addressed blobs never change, so the hash is a strong ETag and clients may cache forever.
+    # The gzip-encoded variant is different bytes, so it gets its own ETag (hash + "-gz").
+    compressed = blob_path.endswith('.gz')
+    if not compressed or request.accept_encodings['gzip'] > 0: # Quality 0 (gzip;q=0) means "not acceptable"
+        # send_file hands the open file to the server's wsgi.file_wrapper (sendfile(2) under
+        # gunicorn/uWSGI) or to X-Sendfile when USE_X_SENDFILE is on: the bytes never pass through Python.
+        response = send_file(blob_path, mimetype='text/markdown', as_attachment=True,
+                             download_name=document.filename,
+                             etag=f"{document.content_hash}-gz" if compressed else document.content_hash,
+                             max_age=31536000)
+        if compressed:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    # Compressed blob and a client without gzip support: decompress on the fly, chunk by chunk
+    response = Response(stream_with_context(store.iter_chunks(document.content_hash)), mimetype='text/markdown')
+    response.headers['Content-Disposition'] = f'attachment; filename="{document.filename}"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(document.content_hash) # The identity bytes: same ETag as an uncompressed blob
+    response.cache_control.max_age = 31536000
+    return response.make_conditional(request)
+
+# --- Document Preview ---
+def _stored_document_outline(document: GeneratedDocument) -> Optional[List[doc_preview.OutlineSection]]:
+    """The document's sections (cached per content hash, see doc_preview.py), or None if its blob is missing."""
+    store = get_document_store()
+    if store.find(document.content_hash) is None:
+        return None
+    return doc_preview.document_outline(document.content_hash, lambda: store.read_text(document.content_hash))
+
+@app.route('/documents/<int:document_id>/preview')
+def preview_document(document_id: int):
+    """Sanitized HTML preview; the first sections are inline, the rest load as they scroll into view (?all=1 renders all)."""
+    document = GeneratedDocument.query.get_or_404(document_id)
+    outline = _stored_document_outline(document)
+    if outline is None:
+        flash("Error: Requested file not found on server.", "error")
+        return redirect(request.referrer or url_for('index'))
+
+    eager_count = len(outline) if request.args.get('all') else doc_preview.PREVIEW_EAGER_SECTIONS
+    with instrumentation.span('render', 'markdown', sections=min(eager_count, len(outline))):
+        sections = [(section, doc_preview.render_section(section) if section.index < eager_count else None)
+                    for section in outline]
+    return render_template('preview.html',
+                           document=document,
+                           project=db.session.get(Project, document.project_id),
+                           phase_config=get_phase_config(document.phase_id_int),
+                           sections=sections)
+
+@app.route('/documents/<int:document_id>/<content_hash>/sections/<int:index>')
+def preview_document_section(document_id: int, content_hash: str, index: int):
+    """
+    One rendered section as an HTML fragment, for the lazy-loading preview page. The URL carries
+    the document's content hash: ids can be reused after builds are pruned (SQLite), content cannot.
+    """
+    document = GeneratedDocument.query.get_or_404(document_id)
+    if document.content_hash != content_hash:
+        abort(404)
+    outline = _stored_document_outline(document)
+    if outline is None or index >= len(outline):
+        abort(404)
+    section = outline[index]
+    with instrumentation.span('render', 'markdown', sections=1):
+        html = doc_preview.render_section(section)
+    # The URL names the exact content, so the fragment never changes; private: project documents
+    # may be kept by the user's browser but not by shared proxies
+    response = Response(html, mimetype='text/html')
+    response.set_etag(section.content_hash)
+    response.cache_control.private = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+def _iter_file_chunks(path: str, chunk_size: int = 64 * 1024):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def iter_project_export_entries(project: Project):
+    """
+    Yields (archive name, chunks) entries for a project export: the latest document of each
+    phase, all phase data as NDJSON and a manifest. Everything is read lazily while the ZIP streams.
+    """
+    store = get_document_store()
+    manifest = {
+        'project': {'id': project.id, 'name': project.name,
+                    'created_at': project.created_at.isoformat() if project.created_at else None},
+        'exported_at': datetime.datetime.utcnow().isoformat() + 'Z',
+        'documents': [],
+        'phase_data': {'file': 'phase_data.ndjson', 'rows': 0},
+    }
+
+    # Latest build per phase. Phases are few, so one small query each keeps this simple and indexed.
+    phase_ids = [pid for (pid,) in db.session.query(GeneratedDocument.phase_id_int)
+                 .filter_by(project_id=project.id).distinct().order_by(GeneratedDocument.phase_id_int)]
+    exported_phases = set()
+    for phase_id in phase_ids:
+        document = get_latest_generated_document(project.id, phase_id)
+        if document is None or store.find(document.content_hash) is None:
+            continue
+        archive_name = f"documents/phase_{phase_id}/{document.filename}"
+        manifest['documents'].append({'phase_id': phase_id, 'build_no': document.build_no, 'file': archive_name,
+                                      'sha256': document.content_hash, 'size': document.size,
+                                      'created_at': document.created_at.isoformat() if document.created_at else None})
+        exported_phases.add(phase_id)
+        yield archive_name, store.iter_chunks(document.content_hash)
+
+    legacy_documents = [] # Filled by _phase_data_lines while phase_data.ndjson streams, read after it
+    def _phase_data_lines():
+        rows = (PhaseData.query.filter_by(project_id=project.id)
+                .order_by(PhaseData.phase_id_int).yield_per(100))
+        for row in rows:
+            manifest['phase_data']['rows'] += 1
+            # Same line format as the bulk API, so the file can be fed straight back to `flask bulk import`
+            yield bulk_io.export_line(row.project_id, row.phase_id_int, row.data, revision=row.revision,
+                                      last_modified=row.last_modified, project_name=project.name)
+            # Documents generated before the content-addressed store
+            # The filename is user-editable phase data: only its sanitised form names files and archive entries
+            legacy_filename = secure_filename((row.data or {}).get('_generated_doc_filename') or '')
+            if row.phase_id_int not in exported_phases and legacy_filename and not (row.data or {}).get('_generated_doc_id'):
+                legacy_path = os.path.join(app.config['UPLOAD_FOLDER'], legacy_filename)
+                if os.path.isfile(legacy_path):
+                    legacy_documents.append((row.phase_id_int, legacy_filename, legacy_path))
+
+    yield 'phase_data.ndjson', _phase_data_lines()
+    for phase_id, legacy_filename, legacy_path in legacy_documents:
+        archive_name = f"documents/phase_{phase_id}/{legacy_filename}"
+        manifest['documents'].append({'phase_id': phase_id, 'file': archive_name, 'legacy': True})
+        yield archive_name, _iter_file_chunks(legacy_path)
+
+    yield 'manifest.json', [json.dumps(manifest, indent=2, ensure_ascii=False).encode('utf-8')]
+
+@app.route('/project/<int:project_id>/export')
+def export_project(project_id: int):
+    project = Project.query.get_or_404(project_id)
+    archive_name = secure_filename(f"{project.name}_{project.id}_export.zip") or f"project_{project.id}_export.zip"
+    # Streamed: the archive is assembled chunk by chunk as the client reads it
+    response = Response(stream_with_context(zip_stream.iter_zip(iter_project_export_entries(project))),
+                        mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{archive_name}"'
+    return response
+
+# --- Bulk API ---
+BULK_IMPORT_CONTENT_TYPES = {'application/x-ndjson': 'ndjson', 'application/jsonl': 'ndjson', 'application/json': 'json'}
+
+# Exempt from the CSRF token check: a browser cannot send these content types cross-site
+# without a CORS preflight, and anything else is rejected with 415 below.
+@csrf.exempt
+@app.route('/api/bulk/import', methods=['POST'])
+def bulk_import_api():
+    """
+    Imports phase data records (NDJSON or JSON, see bulk_io.py). ?mode=replace replaces instead of merging;
+    ?dry_run=1 only validates; ?match_ids=1 trusts project ids whose names differ.
+    """
+    fmt = BULK_IMPORT_CONTENT_TYPES.get(request.mimetype)
+    if fmt is None:
+        return jsonify({'error': f"Unsupported Content-Type; use one of: {', '.join(BULK_IMPORT_CONTENT_TYPES)}."}), 415
+    mode = request.args.get('mode', 'merge')
+    if mode not in ('merge', 'replace'):
+        return jsonify({'error': "mode must be 'merge' or 'replace'."}), 400
+    chunk_size = max(1, min(request.args.get('chunk_size', bulk_io.BULK_CHUNK_SIZE, type=int), 5000))
+
+    # NDJSON is read from the request stream line by line, never buffered whole
+    report = import_phase_data_records(
+        bulk_io.iter_raw_records(request.stream, fmt),
+        replace=(mode == 'replace'),
+        chunk_size=chunk_size,
+        dry_run=request.args.get('dry_run', '').lower() in ('1', 'true', 'yes'),
+        match_ids=request.args.get('match_ids', '').lower() in ('1', 'true', 'yes'),
+    )
+    status = 200 if not report.error_count else (207 if report.upserted else 400)
+    return jsonify(report.to_dict()), status
+
+@app.route('/api/bulk/export', methods=['GET'])
+def bulk_export_api():
+    """Streams phase data as NDJSON; ?project=<id> (repeatable) limits the export."""
+    project_ids = request.args.getlist('project', type=int)
+    response = Response(stream_with_context(iter_phase_data_export(project_ids or None)),
+                        mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = 'attachment; filename="phase_data.ndjson"'
+    return response
+
+@app.route('/api/speculation/stats', methods=['GET'])
+def speculation_stats_api():
+    """Hit rate of speculative precompute (see speculation.py); ?days=<n> sets the window (default 7)."""
+    days = max(1, min(request.args.get('days', 7, type=int), 365))
+    return jsonify(get_speculation_stats(days))
+
+# Legacy flat-folder downloads for documents generated before the content-addressed store
 @app.route('/download/<filename>')
 def download_file(filename):
     # Sanitize filename again just in case, though it should be secure from generation
@@ -272,6 +1715,256 @@ def download_file(filename):
         # Redirect to where the user was, or a sensible default
         return redirect(request.referrer or url_for('index'))
 
+# --- CLI Commands ---
+@app.cli.group('search')
+def search_cli():
+    """Full-text search index maintenance."""
+
+@search_cli.command('reindex')
+@click.option('--batch-size', default=500, show_default=True, help="PhaseData rows per transaction.")
+def search_reindex_command(batch_size: int):
+    """Rebuilds the search index from all phase data and the latest generated documents."""
+    SearchEntry.query.delete(synchronize_session=False)
+    db.session.commit()
+
+    total = PhaseData.query.count()
+    indexed, last_id = 0, 0
+    while True:
+        rows = PhaseData.query.filter(PhaseData.id > last_id).order_by(PhaseData.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        for row in rows:
+            data = row.data or {}
+            search_index.index_phase_data(db.session, SearchEntry, row.project_id, row.phase_id_int, data,
+                                          field_labels=get_search_field_labels(row.phase_id_int))
+            document = get_latest_generated_document(row.project_id, row.phase_id_int)
+            doc_text = None
+            if document is not None:
+                try:
+                    doc_text = get_document_store().read_text(document.content_hash)
+                except FileNotFoundError:
+                    pass
+            elif data.get('_generated_doc_filename'): # Legacy flat file
+                doc_filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(data['_generated_doc_filename']))
+                if os.path.isfile(doc_filepath):
+                    with open(doc_filepath, 'r', encoding='utf-8') as f:
+                        doc_text = f.read()
+            if doc_text is not None:
+                search_index.index_document_sections(db.session, SearchEntry, row.project_id, row.phase_id_int,
+                                                     split_document_sections(doc_text))
+        db.session.commit()
+        indexed += len(rows)
+        click.echo(f"Indexed {indexed}/{total} phase data rows.")
+    click.echo("Search index rebuilt.")
+
+@app.cli.group('revisions')
+def revisions_cli():
+    """Phase data revision history maintenance."""
+
+@revisions_cli.command('compact')
+@click.option('--keep', default=revisions.REVISION_RETENTION_COUNT, show_default=True, help="Revisions to keep per phase (0 keeps all).")
+@click.option('--max-age-days', default=revisions.REVISION_RETENTION_DAYS, show_default=True, help="Drop revisions older than this (0 disables).")
+@click.option('--batch-size', default=200, show_default=True, help="PhaseData rows per transaction.")
+def revisions_compact_command(keep: int, max_age_days: int, batch_size: int):
+    """Applies the revision retention policy to every phase."""
+    removed, last_id = 0, 0
+    while True:
+        rows = PhaseData.query.filter(PhaseData.id > last_id).order_by(PhaseData.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        for row in rows:
+            removed += compact_phase_revisions(row, keep=keep, max_age_days=max_age_days)
+        db.session.commit()
+    click.echo(f"Removed {removed} revisions.")
+
+@app.cli.group('docs')
+def docs_cli():
+    """Generated document store maintenance."""
+
+@docs_cli.command('gc')
+@click.option('--keep', default=doc_store.DOC_RETENTION_BUILDS, show_default=True, help="Builds to keep per project phase (0 keeps all).")
+@click.option('--grace-seconds', default=doc_store.DOC_GC_GRACE_SECONDS, show_default=True, help="Never delete blobs touched more recently than this.")
+def docs_gc_command(keep: int, grace_seconds: int):
+    """Applies build retention, then deletes blobs that no build references."""
+    pruned = 0
+    if keep > 0:
+        scopes = db.session.query(GeneratedDocument.project_id, GeneratedDocument.phase_id_int).distinct().all()
+        for project_id, phase_id_int in scopes:
+            pruned += len(prune_document_builds(project_id, phase_id_int, keep=keep))
+        db.session.commit()
+    referenced = {content_hash for (content_hash,) in db.session.query(GeneratedDocument.content_hash).distinct()}
+    removed = get_document_store().collect_garbage(referenced, grace_seconds=grace_seconds)
+    click.echo(f"Pruned {pruned} builds; removed {removed} unreferenced blobs.")
+
+@docs_cli.command('regenerate')
+@click.option('--phase', 'phase_ids', type=int, multiple=True, help="Only this phase (repeatable). Default: every phase with a document outline.")
+@click.option('--project', 'project_ids', type=int, multiple=True, help="Only this project id (repeatable).")
+@click.option('--config-version', default=None, help="Rebuild documents not built with this config version. Default: each phase's current version.")
+@click.option('--built-before', type=click.DateTime(), default=None, help="Also rebuild documents built before this time (UTC).")
+@click.option('--include-unbuilt', is_flag=True, help="Also build phases that have data but no document yet.")
+@click.option('--force', is_flag=True, help="Rebuild every selected phase that has data.")
+@click.option('--workers', default=batch_regen.REGEN_WORKERS, show_default=True, help="Worker processes (0 builds in this process).")
+@click.option('--concurrency', default=batch_regen.REGEN_CONCURRENCY, show_default=True, help="Concurrent Gemini calls across all workers.")
+@click.option('--rpm', default=batch_regen.REGEN_RATE_LIMIT_RPM, show_default=True, help="Gemini calls per minute across all workers (0 disables).")
+@click.option('--dry-run', is_flag=True, help="List the selection and estimate tokens and cost; build nothing.")
+@click.option('--resume', 'resume_batch_id', type=int, default=None, help="Continue the pending items of this batch instead of selecting.")
+@click.option('--retry-failed', is_flag=True, help="With --resume, also retry the batch's failed items.")
+def docs_regenerate_command(phase_ids, project_ids, config_version: Optional[str], built_before: Optional[datetime.datetime],
+                            include_unbuilt: bool, force: bool, workers: int, concurrency: int, rpm: float,
+                            dry_run: bool, resume_batch_id: Optional[int], retry_failed: bool):
+    """Rebuilds outdated generated documents across projects on a process pool, with checkpoints."""
+    if resume_batch_id is not None:
+        batch = db.session.get(RegenerationBatch, resume_batch_id)
+        if batch is None:
+            raise click.ClickException(f"Regeneration batch {resume_batch_id} not found.")
+        statuses = [batch_regen.ITEM_PENDING] + ([batch_regen.ITEM_FAILED] if retry_failed else [])
+        items = batch.items.filter(RegenerationItem.status.in_(statuses)).order_by(RegenerationItem.id).all()
+        targets = [(item.project_id, item.phase_id_int) for item in items]
+    else:
+        targets = select_regeneration_targets(list(phase_ids), list(project_ids), config_version=config_version,
+                                              built_before=built_before, include_unbuilt=include_unbuilt, force=force)
+
+    if dry_run:
+        estimate = batch_regen.CostEstimate()
+        loaded_project_id, all_project_data = None, {}
+        for project_id, phase_id_int in targets: # Ordered by project: load each project's data once
+            if project_id != loaded_project_id:
+                loaded_project_id, all_project_data = project_id, get_all_project_phase_data_db(project_id)
+            estimate.add(estimate_document_build(phase_id_int, all_project_data.get(str(phase_id_int), {}), all_project_data))
+        for phase_id_int in sorted({phase_id_int for _, phase_id_int in targets}):
+            count = sum(1 for _, target_phase in targets if target_phase == phase_id_int)
+            click.echo(f"Phase {phase_id_int}: {count} documents (current config version {document_config_version(phase_id_int)})")
+        click.echo(f"{len(targets)} documents, {estimate.sections} sections: ~{estimate.input_tokens:,} input tokens, "
+                   f"~{estimate.cached_input_tokens:,} cached input tokens, ~{estimate.output_tokens:,} output tokens "
+                   f"(estimated), ~${estimate.usd():.2f}. {estimate.errors} cannot be built. (dry run)")
+        return
+
+    if resume_batch_id is not None:
+        if items:
+            for item in items:
+                item.status, item.error, item.finished_at = batch_regen.ITEM_PENDING, None, None
+            batch.status, batch.finished_at = batch_regen.BATCH_RUNNING, None
+            db.session.commit()
+    else:
+        if not targets:
+            click.echo("Nothing to regenerate.")
+            return
+        batch = RegenerationBatch(filters={
+            'phases': list(phase_ids), 'projects': list(project_ids), 'config_version': config_version,
+            'built_before': built_before.isoformat() if built_before else None,
+            'include_unbuilt': include_unbuilt, 'force': force,
+        })
+        db.session.add(batch)
+        db.session.flush()
+        items = [RegenerationItem(batch_id=batch.id, project_id=project_id, phase_id_int=phase_id_int)
+                 for project_id, phase_id_int in targets]
+        db.session.add_all(items)
+        db.session.commit()
+    item_ids = [item.id for item in items]
+    already_done = batch.items.filter(RegenerationItem.status == batch_regen.ITEM_DONE).count()
+    click.echo(f"Batch {batch.id}: {len(item_ids)} documents to build ({already_done} already done), "
+               f"{workers} workers, {concurrency} concurrent calls, {rpm:g} calls/min.")
+
+    # Spawned workers: gRPC clients and pooled database connections do not survive a fork
+    mp_context = multiprocessing.get_context('spawn')
+    rate_limiter = batch_regen.SharedRateLimiter(rpm, mp_context)
+    call_slots = mp_context.Semaphore(max(1, concurrency))
+    progress = batch_regen.ProgressReporter(total=len(item_ids) + already_done, already_done=already_done)
+
+    def _report(result: Dict[str, Any]) -> None:
+        progress.record(result['status'] == batch_regen.ITEM_DONE)
+        line = progress.line()
+        if result['error']:
+            line += f" · project {result['project_id']} phase {result['phase_id']}: {result['error']}"
+        click.echo(line)
+
+    try:
+        if workers <= 0:
+            _regeneration_worker_init(rate_limiter, call_slots)
+            for item_id in item_ids:
+                _report(regenerate_document_item(item_id))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=_regeneration_worker_init,
+                                     initargs=(rate_limiter, call_slots)) as executor:
+                futures = [executor.submit(regenerate_document_item, item_id) for item_id in item_ids]
+                try:
+                    for future in as_completed(futures):
+                        _report(future.result())
+                except KeyboardInterrupt:
+                    for future in futures:
+                        future.cancel()
+                    raise
+    except KeyboardInterrupt:
+        click.echo(f"Interrupted; finished documents are saved. Continue with --resume {batch.id}.", err=True)
+        raise SystemExit(130)
+
+    db.session.expire_all()
+    remaining = batch.items.filter(RegenerationItem.status == batch_regen.ITEM_PENDING).count()
+    failed = batch.items.filter(RegenerationItem.status == batch_regen.ITEM_FAILED).count()
+    if not remaining:
+        batch.status, batch.finished_at = batch_regen.BATCH_FINISHED, datetime.datetime.utcnow()
+        db.session.commit()
+    click.echo(f"Batch {batch.id}: {progress.finished_this_run} documents in {batch_regen.format_duration(progress.elapsed())} "
+               f"({progress.per_minute():.1f}/min), {failed} failed."
+               + (f" Retry with --resume {batch.id} --retry-failed." if failed else ""))
+    if failed:
+        raise SystemExit(1)
+
+@app.cli.group('bulk')
+def bulk_cli():
+    """Bulk phase data import/export."""
+
+@bulk_cli.command('import')
+@click.argument('source', type=click.File('rb'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'json']), default='ndjson', show_default=True)
+@click.option('--replace', is_flag=True, help="Replace each phase's data instead of merging into it.")
+@click.option('--chunk-size', default=bulk_io.BULK_CHUNK_SIZE, show_default=True, help="Records per transaction.")
+@click.option('--dry-run', is_flag=True, help="Validate only; write nothing.")
+@click.option('--match-ids', is_flag=True, help="Write into existing projects by id even when their names differ.")
+def bulk_import_command(source, fmt: str, replace: bool, chunk_size: int, dry_run: bool, match_ids: bool):
+    """Imports phase data records from SOURCE (a file, or - for stdin)."""
+    start = datetime.datetime.utcnow()
+    report = import_phase_data_records(bulk_io.iter_raw_records(source, fmt), replace=replace,
+                                       chunk_size=chunk_size, dry_run=dry_run, match_ids=match_ids)
+    elapsed = (datetime.datetime.utcnow() - start).total_seconds()
+    for error in report.errors:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    if report.error_count > len(report.errors):
+        click.echo(f"... and {report.error_count - len(report.errors)} more errors.", err=True)
+    click.echo(f"{report.records} records, {report.valid} valid, {report.upserted} phase rows written, "
+               f"{report.projects_created} projects created in {elapsed:.1f}s{' (dry run)' if dry_run else ''}.")
+    if report.error_count:
+        raise SystemExit(1)
+
+@bulk_cli.command('export')
+@click.argument('target', type=click.File('wb'), default='-')
+@click.option('--project', 'project_ids', type=int, multiple=True, help="Export only this project id (repeatable).")
+def bulk_export_command(target, project_ids):
+    """Writes all phase data as NDJSON to TARGET (a file, or - for stdout)."""
+    for line in iter_phase_data_export(list(project_ids) or None):
+        target.write(line)
+
+@app.cli.group('speculation')
+def speculation_cli():
+    """Speculative precompute of AI results."""
+
+@speculation_cli.command('stats')
+@click.option('--days', default=7, show_default=True, help="Window to report on.")
+def speculation_stats_command(days: int):
+    """Prints speculative calls and their hit rate as JSON."""
+    click.echo(json.dumps(get_speculation_stats(days), indent=2))
+
+@speculation_cli.command('prune')
+@click.option('--days', default=speculation.SPECULATIVE_RETENTION_DAYS, show_default=True, help="Delete results older than this.")
+def speculation_prune_command(days: int):
+    """Deletes old speculative results; unused ones are never served once the data has moved on."""
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    removed = SpeculativeResult.query.filter(SpeculativeResult.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f"Removed {removed} speculative results.")
+
 # --- Error Handlers ---
 @app.errorhandler(404)
 def page_not_found(e):
@@ -289,8 +1982,9 @@ def handle_exception(e):
     if isinstance(e, HTTPException):
         return e
     # Non-HTTP exceptions are handled here
-    # You could log the error e here if you have logging configured
-    print(f"Unhandled exception: {e}") # Basic logging to console
+    trace = instrumentation.current_trace()
+    app.logger.exception("Unhandled exception on %s %s (request %s)", request.method, request.path,
+                         trace.request_id if trace else '-')
     return render_template('errors/500.html', e=e), 500
 
 # --- Main Execution ---
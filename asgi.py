@@ -0,0 +1,135 @@
+"""
+ASGI entry point for the Engineering Partner app.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5001
+
+The AI action route (NATIVE_ASYNC_ENDPOINTS) is served natively: its view runs as a task on the
+server's event loop, so a request waiting for Gemini holds no thread, and one worker process can
+keep as many AI requests in flight as the rate limits allow. Its database work runs in a small
+thread pool (app.run_blocking). Every other route is short and goes through Flask's WSGI app on
+a pool of ASGI_WSGI_THREADS threads, as under a threaded WSGI server.
+
+Natively served requests go through the same Flask pipeline as WSGI ones: request and app
+contexts, before/after_request hooks (CSRF, instrumentation), error handlers and the session cookie.
+"""
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from flask import request_started
+from flask.globals import request_ctx
+from werkzeug.exceptions import HTTPException
+
+from app import app, NATIVE_ASYNC_ENVIRON_KEY
+
+# Async views served on the event loop; everything else is dispatched to a thread as WSGI
+NATIVE_ASYNC_ENDPOINTS = {'handle_phase_action'}
+# Threads running the WSGI routes (the role of a threaded WSGI server's worker threads)
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', '8'))
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+_wsgi_executor = ThreadPoolExecutor(max_workers=ASGI_WSGI_THREADS, thread_name_prefix='wsgi')
+
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs WSGI apps thread-sensitively, i.e. all requests on one shared thread
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False, executor=_wsgi_executor)
+
+
+def _native_endpoint(scope: Scope) -> Optional[str]:
+    adapter = app.url_map.bind('localhost', script_name=scope.get('root_path') or None)
+    try:
+        endpoint, _ = adapter.match(scope['path'], method=scope['method'])
+    except HTTPException: # 404/405/redirects: leave them to Flask
+        return None
+    return endpoint if endpoint in NATIVE_ASYNC_ENDPOINTS else None
+
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def _dispatch(environ: Dict[str, Any]):
+    """Flask's wsgi_app/full_dispatch_request, with the view awaited instead of run through async_to_sync."""
+    ctx = app.request_context(environ)
+    error = None
+    try:
+        try:
+            ctx.push()
+            try:
+                request_started.send(app, _async_wrapper=app.ensure_sync)
+                rv = app.preprocess_request()
+                if rv is None:
+                    request = request_ctx.request
+                    if request.routing_exception is not None:
+                        app.raise_routing_exception(request)
+                    rv = await app.view_functions[request.url_rule.endpoint](**request.view_args)
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            return app.finalize_request(rv)
+        except Exception as e:
+            error = e
+            return app.handle_exception(e)
+    finally:
+        if error is not None and app.should_ignore_error(error):
+            error = None
+        ctx.pop(error)
+
+
+async def _serve_native(scope: Scope, receive: Receive, send: Send) -> None:
+    body = await _read_body(receive)
+    instance = WsgiToAsgiInstance(app)
+    instance.scope = scope # build_environ reads the headers from it
+    environ = instance.build_environ(scope, io.BytesIO(body))
+    environ[NATIVE_ASYNC_ENVIRON_KEY] = True
+    response = await _dispatch(environ)
+    try:
+        headers = [(name.lower().encode('latin1'), value.encode('latin1'))
+                   for name, value in response.get_wsgi_headers(environ).to_wsgi_list()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        # The action view returns redirects and rendered pages, never streams: send the body whole
+        await send({'type': 'http.response.body', 'body': b''.join(response.iter_encoded())})
+    finally:
+        response.close()
+
+
+async def _lifespan(receive: Receive, send: Send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope: Scope, receive: Receive, send: Send) -> None:
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+    elif scope['type'] == 'http' and _native_endpoint(scope):
+        await _serve_native(scope, receive, send)
+    else:
+        await _PooledWsgiInstance(app)(scope, receive, send)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("asgi.py needs an ASGI server: pip install uvicorn (see requirements.txt).")
+    uvicorn.run(application, host='127.0.0.1', port=5001)
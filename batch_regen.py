@@ -0,0 +1,136 @@
+"""
+Helpers for batch document regeneration (`flask docs regenerate`, see app.py).
+
+A batch rebuilds the documents of many project phases on a process pool. Each worker process
+imports the app itself (spawn, not fork: gRPC clients and database connections do not survive a
+fork), so it has its own Gemini client and connection pool. The workers share:
+
+- a token-bucket rate limit on Gemini calls (SharedRateLimiter, in shared memory)
+- a semaphore capping concurrent Gemini calls across all workers
+
+Progress is checkpointed per document in the regeneration_item table, in the same transaction
+as the build itself, so a killed batch resumes with `--resume <batch id>` where it stopped.
+"""
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+REGEN_WORKERS = int(os.environ.get('REGEN_WORKERS', '4'))
+REGEN_CONCURRENCY = int(os.environ.get('REGEN_CONCURRENCY', '8')) # Concurrent Gemini calls across all workers
+REGEN_RATE_LIMIT_RPM = float(os.environ.get('REGEN_RATE_LIMIT_RPM', '60')) # Gemini calls per minute across all workers
+
+# Dry-run cost estimate, USD per million tokens (defaults: Gemini 1.5 Pro, prompts up to 128k tokens)
+GEMINI_PRICE_INPUT_PER_1M = float(os.environ.get('GEMINI_PRICE_INPUT_PER_1M', '1.25'))
+GEMINI_PRICE_CACHED_INPUT_PER_1M = float(os.environ.get('GEMINI_PRICE_CACHED_INPUT_PER_1M', '0.3125'))
+GEMINI_PRICE_OUTPUT_PER_1M = float(os.environ.get('GEMINI_PRICE_OUTPUT_PER_1M', '5.00'))
+# Output length is unknown before the call; sections are asked for a few hundred words
+ESTIMATED_OUTPUT_TOKENS_PER_SECTION = int(os.environ.get('ESTIMATED_OUTPUT_TOKENS_PER_SECTION', '500'))
+
+ITEM_PENDING = 'pending'
+ITEM_DONE = 'done'
+ITEM_FAILED = 'failed'
+
+BATCH_RUNNING = 'running'
+BATCH_FINISHED = 'finished'
+
+
+class SharedRateLimiter:
+    """
+    Token bucket allowing `rpm` calls per minute across processes; the same interface as
+    gemini_client's per-process limiter. Create it from the pool's multiprocessing context
+    and hand it to the workers through the pool initializer.
+    """
+    def __init__(self, rpm: float, mp_context):
+        self.rpm = rpm
+        self.capacity = max(rpm, 1.0)
+        self._tokens = mp_context.Value('d', self.capacity, lock=False)
+        self._updated = mp_context.Value('d', time.monotonic(), lock=False) # CLOCK_MONOTONIC is system-wide
+        self._lock = mp_context.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens.value = min(self.capacity, self._tokens.value + (now - self._updated.value) * self.rpm / 60.0)
+        self._updated.value = now
+
+    def reserve(self) -> float:
+        if self.rpm <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self._tokens.value -= 1
+            tokens = self._tokens.value
+        return 0.0 if tokens >= 0 else -tokens * 60.0 / self.rpm
+
+    def headroom(self) -> float:
+        if self.rpm <= 0:
+            return 1.0
+        with self._lock:
+            self._refill()
+            return max(self._tokens.value, 0.0) / self.capacity
+
+
+@dataclass
+class CostEstimate:
+    documents: int = 0
+    sections: int = 0
+    input_tokens: int = 0
+    cached_input_tokens: int = 0
+    output_tokens: int = 0
+    errors: int = 0
+
+    def add(self, build_estimate: Dict[str, Any]) -> None:
+        """Adds one doc_generator.estimate_document_build() result."""
+        if build_estimate.get('error'):
+            self.errors += 1
+            return
+        self.documents += 1
+        self.sections += build_estimate['sections']
+        self.input_tokens += build_estimate['input_tokens']
+        self.cached_input_tokens += build_estimate['cached_input_tokens']
+        self.output_tokens += build_estimate['sections'] * ESTIMATED_OUTPUT_TOKENS_PER_SECTION
+
+    def usd(self) -> float:
+        return (self.input_tokens * GEMINI_PRICE_INPUT_PER_1M
+                + self.cached_input_tokens * GEMINI_PRICE_CACHED_INPUT_PER_1M
+                + self.output_tokens * GEMINI_PRICE_OUTPUT_PER_1M) / 1_000_000
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '?'
+    seconds = int(round(seconds))
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours}h{minutes:02d}m" if hours else (f"{minutes}m{seconds:02d}s" if minutes else f"{seconds}s")
+
+
+class ProgressReporter:
+    """Throughput and ETA of the documents finished in this run (resumed work counts as already done)."""
+    def __init__(self, total: int, already_done: int = 0):
+        self.total = total
+        self.completed = already_done
+        self.finished_this_run = 0
+        self.failed = 0
+        self._started = time.monotonic()
+
+    def record(self, ok: bool) -> None:
+        self.completed += 1
+        self.finished_this_run += 1
+        if not ok:
+            self.failed += 1
+
+    def per_minute(self) -> float:
+        elapsed = time.monotonic() - self._started
+        return self.finished_this_run / elapsed * 60 if elapsed > 0 else 0.0
+
+    def eta_seconds(self) -> Optional[float]:
+        rate = self.per_minute()
+        return (self.total - self.completed) / rate * 60 if rate else None
+
+    def line(self) -> str:
+        return (f"[{self.completed}/{self.total}] {self.per_minute():.1f} docs/min · "
+                f"ETA {format_duration(self.eta_seconds())} · {self.failed} failed")
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
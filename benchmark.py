@@ -0,0 +1,273 @@
+"""
+Performance benchmarks for the Engineering Partner app.
+
+Runs entirely offline against the fake Gemini backend (GEMINI_BACKEND=fake), so no API
+key or quota is needed. Usage:
+
+    python benchmark.py ai-concurrency --users 200 --workers 8 --latency 0.5
+    python benchmark.py ai-http --users 200 --workers 8 --latency 0.5   (needs uvicorn)
+    python benchmark.py db-writes --threads 16 --writes 50 [--postgres-url postgresql://...]
+"""
+import os
+import sys
+import time
+import json
+import asyncio
+import socket
+import argparse
+import tempfile
+import subprocess
+import http.client
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+
+# Must be set before gemini_client is imported: the backend is chosen at import time.
+os.environ.setdefault("GEMINI_BACKEND", "fake")
+
+
+def _report(label: str, requests: int, elapsed: float, latency: float) -> None:
+    throughput = requests / elapsed if elapsed else 0.0
+    # Average number of AI calls in flight = throughput x per-call latency (Little's law).
+    concurrent_capacity = throughput * latency
+    print(f"{label:<28} {requests:>6} req  {elapsed:>8.2f}s  {throughput:>9.1f} req/s  ~{concurrent_capacity:>7.1f} concurrent")
+
+
+def bench_ai_concurrency(args: argparse.Namespace) -> None:
+    os.environ["GEMINI_FAKE_LATENCY"] = str(args.latency)
+    import gemini_client
+    gemini_client._MODEL.latency = args.latency
+
+    payload = json.dumps({"objective": "Benchmark payload", "constraints": "None"})
+    print(f"Simulating {args.users} concurrent 'Generate Solution' requests, {args.latency}s Gemini latency each.")
+
+    # Before: every call pins a thread for its whole duration; capacity is capped by the worker count.
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(lambda _: gemini_client.generate_solution_summary(payload), range(args.users)))
+    _report(f"sync ({args.workers} workers)", args.users, time.perf_counter() - start, args.latency)
+
+    # After: all calls are awaited on one event loop in a single thread. This measures the client
+    # library, not the HTTP view; `ai-http` measures the view under a WSGI server and under asgi.py.
+    async def _run_async() -> None:
+        await asyncio.gather(*(gemini_client.generate_solution_summary_async(payload) for _ in range(args.users)))
+
+    start = time.perf_counter()
+    asyncio.run(_run_async())
+    _report("async (1 thread)", args.users, time.perf_counter() - start, args.latency)
+
+
+class _PooledWSGIServer(WSGIServer):
+    """wsgiref server handling requests on a fixed pool of threads, like a threaded WSGI server's workers."""
+    request_queue_size = 1024
+    workers = 8
+
+    def server_activate(self) -> None:
+        super().server_activate()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+
+    def process_request(self, request, client_address) -> None:
+        self._pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def _ai_http_server(args: argparse.Namespace) -> None:
+    """Serves the app on args.port in this process; DATABASE_URL and GEMINI_FAKE_LATENCY come from the environment."""
+    import app as app_module
+
+    app_module.app.config["WTF_CSRF_ENABLED"] = False
+    with app_module.app.app_context():
+        app_module.db.create_all()
+        app_module.db.session.add_all(app_module.Project(name=f"Benchmark {n}") for n in range(args.users))
+        app_module.db.session.commit()
+
+    if args.server == "asgi":
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.application, host="127.0.0.1", port=args.port, log_level="warning", backlog=2048)
+    else:
+        _PooledWSGIServer.workers = args.workers
+        make_server("127.0.0.1", args.port, app_module.app, server_class=_PooledWSGIServer,
+                    handler_class=_QuietHandler).serve_forever()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, server: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and server.poll() is None:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"benchmark server on port {port} did not start")
+
+
+def _post_generate_solution(port: int, project_id: int) -> int:
+    body = urlencode({"action": "generate_solution", "project_name": f"Benchmark {project_id}",
+                      "objective": "Benchmark payload", "revision": 0})
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+    try:
+        connection.request("POST", f"/project/{project_id}/phase/1/action", body,
+                           {"Content-Type": "application/x-www-form-urlencoded"})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def bench_ai_http(args: argparse.Namespace) -> None:
+    print(f"{args.users} concurrent HTTP clients posting 'Generate Solution', {args.latency}s Gemini latency each.")
+    # Before: the WSGI app on a fixed pool of worker threads; every request holds one while Gemini answers.
+    # After: asgi.py under uvicorn; the action view runs on one event loop and waits without a thread.
+    profiles = [("wsgi", f"WSGI ({args.workers} threads)"), ("asgi", "ASGI native (uvicorn)")]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for server_type, label in profiles:
+            port = _free_port()
+            env = dict(os.environ, DATABASE_URL="sqlite:///" + os.path.join(tmp_dir, f"{server_type}.db"),
+                       GEMINI_FAKE_LATENCY=str(args.latency), SLOW_REQUEST_MS="1000000")
+            # Request logs go to a file: an undrained pipe would fill up and stall the server
+            server_log = open(os.path.join(tmp_dir, f"{server_type}.log"), "w+")
+            server = subprocess.Popen(
+                [sys.executable, __file__, "_ai-http-server", "--server", server_type, "--port", str(port),
+                 "--users", str(args.users), "--workers", str(args.workers)],
+                env=env, stdout=subprocess.DEVNULL, stderr=server_log, text=True
+            )
+            try:
+                _wait_for_port(port, server)
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=args.users) as clients:
+                    statuses = list(clients.map(lambda project_id: _post_generate_solution(port, project_id),
+                                                range(1, args.users + 1)))
+                elapsed = time.perf_counter() - start
+            except RuntimeError:
+                server_log.seek(0)
+                print(f"{label:<28} failed: {server_log.read().strip().splitlines()[-1:] or 'no output'}")
+                continue
+            finally:
+                server.terminate()
+                server.wait()
+                server_log.close()
+            failed = sum(status != 302 for status in statuses)
+            _report(label, args.users - failed, elapsed, args.latency)
+            if failed:
+                print(f"{'':<28} {failed} requests failed")
+
+
+def _db_write_worker(args: argparse.Namespace) -> None:
+    """Runs one concurrent-write profile in this process; DATABASE_URL and pragmas come from the environment."""
+    import app as app_module
+
+    with app_module.app.app_context():
+        app_module.db.create_all()
+        app_module.get_or_create_default_project()
+
+    errors = []
+
+    def _writer(thread_no: int) -> None:
+        for write_no in range(args.writes):
+            with app_module.app.test_request_context():
+                try:
+                    app_module.update_current_phase_data_db(1, 1 + thread_no % 9, {"objective": f"t{thread_no} w{write_no}"})
+                except Exception as e:
+                    errors.append(type(e).__name__)
+                finally:
+                    app_module.db.session.remove()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(_writer, range(args.threads)))
+    elapsed = time.perf_counter() - start
+    total = args.threads * args.writes
+    print(json.dumps({"writes": total, "errors": len(errors), "elapsed": elapsed}))
+
+
+def bench_db_writes(args: argparse.Namespace) -> None:
+    profiles = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        profiles.append(("sqlite rollback journal", {
+            "DATABASE_URL": "sqlite:///" + os.path.join(tmp_dir, "journal.db"),
+            "SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", # sqlite3 defaults (5s driver timeout)
+        }))
+        profiles.append(("sqlite WAL + busy_timeout", {
+            "DATABASE_URL": "sqlite:///" + os.path.join(tmp_dir, "wal.db"),
+        }))
+        if args.postgres_url:
+            profiles.append(("postgresql pooled", {"DATABASE_URL": args.postgres_url}))
+
+        print(f"{args.threads} threads x {args.writes} phase saves each.")
+        for label, overrides in profiles:
+            # Each profile runs in a fresh interpreter: app.py reads its database settings at import time.
+            env = dict(os.environ, **overrides)
+            result = subprocess.run(
+                [sys.executable, __file__, "_db-writes-worker", "--threads", str(args.threads), "--writes", str(args.writes)],
+                env=env, capture_output=True, text=True
+            )
+            lines = result.stdout.strip().splitlines()
+            if result.returncode != 0 or not lines:
+                print(f"{label:<28} failed: {result.stderr.strip().splitlines()[-1:] or 'no output'}")
+                continue
+            stats = json.loads(lines[-1])
+            ok = stats["writes"] - stats["errors"]
+            print(f"{label:<28} {ok:>6} ok  {stats['errors']:>5} failed  {stats['elapsed']:>8.2f}s  {ok / stats['elapsed']:>8.1f} writes/s")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Engineering Partner performance benchmarks.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    ai_parser = subparsers.add_parser("ai-concurrency", help="Concurrent Gemini client calls: sync worker pool vs one async event loop (library level, not HTTP).")
+    ai_parser.add_argument("--users", type=int, default=200, help="Number of simultaneous requests.")
+    ai_parser.add_argument("--workers", type=int, default=8, help="Sync worker threads (stands in for WSGI workers).")
+    ai_parser.add_argument("--latency", type=float, default=0.5, help="Simulated Gemini latency per call in seconds.")
+    ai_parser.set_defaults(func=bench_ai_concurrency)
+
+    http_parser = subparsers.add_parser("ai-http", help="Concurrent HTTP clients on the AI action view: WSGI thread pool vs native ASGI (asgi.py).")
+    http_parser.add_argument("--users", type=int, default=200, help="Number of simultaneous HTTP clients.")
+    http_parser.add_argument("--workers", type=int, default=8, help="WSGI worker threads for the 'before' server.")
+    http_parser.add_argument("--latency", type=float, default=0.5, help="Simulated Gemini latency per call in seconds.")
+    http_parser.set_defaults(func=bench_ai_http)
+
+    http_server_parser = subparsers.add_parser("_ai-http-server")
+    http_server_parser.add_argument("--server", choices=["wsgi", "asgi"], required=True)
+    http_server_parser.add_argument("--port", type=int, required=True)
+    http_server_parser.add_argument("--users", type=int, required=True)
+    http_server_parser.add_argument("--workers", type=int, required=True)
+    http_server_parser.set_defaults(func=_ai_http_server)
+
+    db_parser = subparsers.add_parser("db-writes", help="Concurrent phase saves: SQLite rollback journal vs WAL, optionally PostgreSQL.")
+    db_parser.add_argument("--threads", type=int, default=16, help="Concurrent writer threads.")
+    db_parser.add_argument("--writes", type=int, default=50, help="Saves per thread.")
+    db_parser.add_argument("--postgres-url", default=None, help="Also benchmark this PostgreSQL DATABASE_URL.")
+    db_parser.set_defaults(func=bench_db_writes)
+
+    worker_parser = subparsers.add_parser("_db-writes-worker")
+    worker_parser.add_argument("--threads", type=int, required=True)
+    worker_parser.add_argument("--writes", type=int, required=True)
+    worker_parser.set_defaults(func=_db_write_worker)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
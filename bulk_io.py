@@ -0,0 +1,155 @@
+"""
+Parsing and validation for bulk phase data import/export.
+
+A record describes the data of one phase of one project, in the same shape the exports write:
+
+    {"project_id": 12, "project_name": "Billing Revamp", "phase_id": 3,
+     "data": {"system_context": "...", "tech_stack_summary": "..."}}
+
+project_id refers to an existing project; with a project_name, only if that project has
+the same name. Otherwise project_name is used to find or create the project (see
+app.resolve_bulk_projects). Field keys are
+validated against the phase's PhaseSchema.fields; underscore-prefixed app artifacts are
+dropped except for the few that are portable between databases.
+"""
+import io
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+from config import get_phase_config
+
+BULK_CHUNK_SIZE = 500 # Records per transaction / multi-row upsert
+MAX_REPORTED_ERRORS = 100
+
+# Artifacts that still make sense in another database (document ids and filenames do not).
+PORTABLE_ARTIFACT_KEYS = {'_solution_summary'}
+
+
+class BulkRecordError(ValueError):
+    pass
+
+
+@dataclass
+class BulkRecord:
+    line_no: int
+    phase_id: int
+    data: Dict[str, Any]
+    project_id: Optional[int] = None
+    project_name: Optional[str] = None
+
+
+@dataclass
+class BulkImportReport:
+    records: int = 0
+    valid: int = 0
+    upserted: int = 0
+    projects_created: int = 0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    error_count: int = 0
+
+    def add_error(self, line_no: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_no, 'error': message})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'records': self.records,
+            'valid': self.valid,
+            'upserted': self.upserted,
+            'projects_created': self.projects_created,
+            'error_count': self.error_count,
+            'errors': sorted(self.errors, key=lambda error: error['line']),
+        }
+
+
+def iter_raw_records(stream: IO, fmt: str = 'ndjson') -> Iterator[Tuple[int, Any]]:
+    """
+    Yields (line/position number, decoded JSON value) from a binary or text stream.
+    NDJSON is read line by line; JSON accepts a list or {"records": [...]} and is loaded whole.
+    Undecodable NDJSON lines are yielded as the JSONDecodeError so the caller can report them.
+    """
+    if not isinstance(stream, io.TextIOBase):
+        if isinstance(stream, io.RawIOBase):
+            stream = io.BufferedReader(stream)
+        stream = io.TextIOWrapper(stream, encoding='utf-8')
+
+    if fmt == 'json':
+        payload = json.load(stream)
+        records = payload.get('records', []) if isinstance(payload, dict) else payload
+        if not isinstance(records, list):
+            raise BulkRecordError("JSON input must be a list of records or an object with a 'records' list.")
+        for position, record in enumerate(records, start=1):
+            yield position, record
+        return
+
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, e
+
+
+def validate_record(line_no: int, raw: Any) -> BulkRecord:
+    """Checks one decoded record against phases.yaml and returns it cleaned; raises BulkRecordError."""
+    if isinstance(raw, json.JSONDecodeError):
+        raise BulkRecordError(f"Invalid JSON: {raw.msg}")
+    if not isinstance(raw, dict):
+        raise BulkRecordError("Record must be a JSON object.")
+
+    phase_id = raw.get('phase_id')
+    if not isinstance(phase_id, int) or isinstance(phase_id, bool):
+        raise BulkRecordError("'phase_id' must be an integer.")
+    phase_config = get_phase_config(phase_id)
+    if not phase_config:
+        raise BulkRecordError(f"Phase {phase_id} is not configured.")
+
+    project_id = raw.get('project_id')
+    project_name = raw.get('project_name')
+    if project_id is not None and (not isinstance(project_id, int) or isinstance(project_id, bool)):
+        raise BulkRecordError("'project_id' must be an integer.")
+    if project_name is not None and (not isinstance(project_name, str) or not project_name.strip()):
+        raise BulkRecordError("'project_name' must be a non-empty string.")
+    if project_id is None and project_name is None:
+        raise BulkRecordError("Either 'project_id' or 'project_name' is required.")
+
+    data = raw.get('data')
+    if not isinstance(data, dict):
+        raise BulkRecordError("'data' must be an object of field values.")
+    unknown_keys = sorted(k for k in data if not k.startswith('_') and k not in phase_config.fields)
+    if unknown_keys:
+        raise BulkRecordError(f"Unknown field(s) for phase {phase_id}: {', '.join(unknown_keys)}.")
+    clean_data = {k: v for k, v in data.items() if not k.startswith('_') or k in PORTABLE_ARTIFACT_KEYS}
+
+    return BulkRecord(line_no=line_no, phase_id=phase_id, data=clean_data,
+                      project_id=project_id, project_name=project_name.strip() if project_name else None)
+
+
+def export_line(project_id: int, phase_id: int, data: Dict[str, Any], revision: Optional[int] = None,
+                last_modified=None, project_name: Optional[str] = None) -> bytes:
+    """One NDJSON export line; the same shape validate_record accepts, so exports re-import as-is."""
+    record = {'project_id': project_id}
+    if project_name is not None:
+        record['project_name'] = project_name
+    record.update({
+        'phase_id': phase_id,
+        'revision': revision,
+        'last_modified': last_modified.isoformat() if last_modified else None,
+        'data': data or {},
+    })
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    chunk: List[Any] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
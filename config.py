@@ -136,6 +136,40 @@ elif 'sqlite' in SQLALCHEMY_DATABASE_URI:
 else:
     print(f"INFO: Using configured DATABASE_URL: {SQLALCHEMY_DATABASE_URI}")
 
+# Database Engine / Connection Pool Configuration
+# Pool sizing applies per process. For PostgreSQL keep pool_size + max_overflow (times worker count) under max_connections.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800')) # Seconds; recycle before server/proxy idle timeouts drop connections
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', '30')) # Seconds to wait for a free pooled connection
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '30000')) # PostgreSQL only; 0 disables
+
+# SQLite pragmas, applied to every new connection (see app.py).
+# WAL lets readers proceed while a write is in progress, and NORMAL sync is safe under WAL.
+# busy_timeout makes concurrent writers wait for the lock instead of failing with "database is locked".
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+def get_engine_options(database_uri: str) -> Dict[str, Any]:
+    """Builds SQLALCHEMY_ENGINE_OPTIONS for the given database URI."""
+    engine_options: Dict[str, Any] = {
+        'pool_pre_ping': True, # Transparently replace connections dropped by the server
+        'pool_recycle': DB_POOL_RECYCLE,
+    }
+    if database_uri.startswith('sqlite'):
+        if ':memory:' not in database_uri and database_uri not in ('sqlite://', 'sqlite:///'):
+            engine_options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+        # The sqlite3 driver's own lock wait, in seconds; kept in line with busy_timeout.
+        engine_options['connect_args'] = {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000}
+    else:
+        engine_options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+        if database_uri.startswith('postgres') and DB_STATEMENT_TIMEOUT_MS > 0:
+            engine_options['connect_args'] = {'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'}
+    return engine_options
+
+SQLALCHEMY_ENGINE_OPTIONS = get_engine_options(SQLALCHEMY_DATABASE_URI)
+
 # Check for Gemini API Key
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
 if not GEMINI_API_KEY:
@@ -1,39 +1,42 @@
 import json
-import os  # For environment variable access in test block
-from typing import Dict, List, Any, Optional
+import os  # For environment variable access (also used in test block)
+import asyncio
+import hashlib
+from typing import Dict, List, Any, Optional, Tuple
 
 # Assuming your config.py and gemini_client.py are in the same directory (root)
 from config import get_phase_config, PhaseSchema # PhaseSchema for type hinting
-from gemini_client import generate_document_section
+from markdown_sections import split_markdown_sections
+from gemini_client import (
+    MODEL_NAME, document_prompt_template, generate_document_section, generate_document_section_async, document_build_context,
+    document_build_context_async, estimate_document_build_tokens
+)
 
-def build_document_for_phase(
+# Maximum number of outline sections generated concurrently by the async builder.
+DOC_SECTION_CONCURRENCY = int(os.environ.get("DOC_SECTION_CONCURRENCY", "4"))
+
+def _prepare_document_build(
     phase_id: int,
     current_phase_data: Dict[str, Any],
-    all_project_data: Dict[str, Dict[str, Any]] # Keys are string phase IDs e.g. "1", "2"
-) -> str:
+    all_project_data: Dict[str, Dict[str, Any]]
+) -> Tuple[Optional[PhaseSchema], str, str, str]:
     """
-    Builds a complete Markdown document for a given phase by iterating through its
-    defined outline and generating content for each section using an AI model.
+    Resolves the phase outline and serialises the prompt context shared by every section.
 
-    Args:
-        phase_id: The integer ID of the current phase.
-        current_phase_data: Data specific to the current phase.
-        all_project_data: Data from all phases, where keys are string phase IDs.
-                          This provides historical context.
     Returns:
-        A string containing the full Markdown document or an error message string.
+        A tuple of (phase_config, document header or error document, current phase JSON,
+        historical data JSON). phase_config is None when the document cannot be built,
+        in which case the second element is the error document to return.
     """
     phase_config: Optional[PhaseSchema] = get_phase_config(phase_id)
 
     if not phase_config:
-        return f"# Error: Document Generation Failed\n\nPhase {phase_id} configuration not found."
+        return None, f"# Error: Document Generation Failed\n\nPhase {phase_id} configuration not found.", "", ""
     if not phase_config.document or not phase_config.document.outline:
-        return f"# Error: Document Generation Failed\n\nDocument outline not configured for Phase {phase_id}: {phase_config.title}."
-
-    full_document_parts: List[str] = []
+        return None, f"# Error: Document Generation Failed\n\nDocument outline not configured for Phase {phase_id}: {phase_config.title}.", "", ""
 
     doc_main_title = phase_config.document.name.replace('.md', '').replace('_', ' ').title()
-    full_document_parts.append(f"# {phase_config.title}: {doc_main_title}\n")
+    document_header = f"# {phase_config.title}: {doc_main_title}\n"
 
     current_phase_data_json_str = json.dumps(current_phase_data, indent=2) if current_phase_data else "{}"
 
@@ -44,22 +47,131 @@ def build_document_for_phase(
     }
     all_project_data_json_str = json.dumps(historical_data_for_prompt, indent=2) if historical_data_for_prompt else "{}"
 
-    for section_title_from_outline in phase_config.document.outline:
-        full_document_parts.append(f"\n{section_title_from_outline}\n")
+    return phase_config, document_header, current_phase_data_json_str, all_project_data_json_str
 
-        clean_prompt_section_title = section_title_from_outline.lstrip('#').lstrip()
+def document_config_version(phase_id: int) -> Optional[str]:
+    """
+    Short hash of everything a phase's document depends on besides the project data: the
+    document name and outline from phases.yaml, the model every section is generated with
+    (cached or not, see gemini_client.MODEL_NAME) and the section prompt templates. Stored on
+    each build (GeneratedDocument.config_version) so outdated builds can be found after a change.
+    """
+    phase_config = get_phase_config(phase_id)
+    if not phase_config or not phase_config.document:
+        return None
+    payload = json.dumps({
+        'name': phase_config.document.name,
+        'outline': phase_config.document.outline,
+        'model': MODEL_NAME,
+        'prompt_template': hashlib.sha256(document_prompt_template().encode('utf-8')).hexdigest(),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:12]
+
+def estimate_document_build(
+    phase_id: int,
+    current_phase_data: Dict[str, Any],
+    all_project_data: Dict[str, Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Offline prompt token estimate of build_document_for_phase(_async) for this data (see gemini_client)."""
+    phase_config, error_document, current_phase_data_json_str, all_project_data_json_str = \
+        _prepare_document_build(phase_id, current_phase_data, all_project_data)
+    if not phase_config:
+        return {'error': error_document}
+    section_titles = [_prompt_section_title(title) for title in phase_config.document.outline]
+    return estimate_document_build_tokens(section_titles, current_phase_data_json_str, all_project_data_json_str)
 
-        generated_section_content = generate_document_section(
-            section_title=clean_prompt_section_title,
-            current_phase_data_json_str=current_phase_data_json_str,
-            all_project_data_json_str=all_project_data_json_str
-        )
+def _prompt_section_title(section_title_from_outline: str) -> str:
+    return section_title_from_outline.lstrip('#').lstrip()
 
+def _assemble_document(document_header: str, outline: List[str], section_contents: List[str]) -> str:
+    full_document_parts: List[str] = [document_header]
+    for section_title_from_outline, generated_section_content in zip(outline, section_contents):
+        full_document_parts.append(f"\n{section_title_from_outline}\n")
         full_document_parts.append(generated_section_content)
         full_document_parts.append("\n")
-
     return "".join(full_document_parts)
 
+def split_document_sections(markdown_text: str) -> List[Tuple[str, str]]:
+    """
+    Splits a Markdown document into (heading, body) pairs at every heading line outside code
+    fences (see markdown_sections.py). Text before the first heading is returned with an empty heading.
+    """
+    sections: List[Tuple[str, str]] = []
+    for section in split_markdown_sections(markdown_text):
+        body = section.markdown
+        if section.level: # Drop the heading line itself
+            body = body.split('\n', 1)[1] if '\n' in body else ''
+        sections.append((section.title, body.strip()))
+    return sections
+
+def build_document_for_phase(
+    phase_id: int,
+    current_phase_data: Dict[str, Any],
+    all_project_data: Dict[str, Dict[str, Any]] # Keys are string phase IDs e.g. "1", "2"
+) -> str:
+    """
+    Builds a complete Markdown document for a given phase by iterating through its
+    defined outline and generating content for each section using an AI model.
+
+    Args:
+        phase_id: The integer ID of the current phase.
+        current_phase_data: Data specific to the current phase.
+        all_project_data: Data from all phases, where keys are string phase IDs.
+                          This provides historical context.
+    Returns:
+        A string containing the full Markdown document or an error message string.
+    """
+    phase_config, document_header, current_phase_data_json_str, all_project_data_json_str = \
+        _prepare_document_build(phase_id, current_phase_data, all_project_data)
+    if not phase_config:
+        return document_header
+
+    section_titles = [_prompt_section_title(title) for title in phase_config.document.outline]
+    section_contents: List[str] = []
+    # One shared (and, when worthwhile, cached) context prefix for every section of this build
+    with document_build_context(section_titles, current_phase_data_json_str, all_project_data_json_str) as context:
+        for clean_prompt_section_title in section_titles:
+            section_contents.append(generate_document_section(
+                section_title=clean_prompt_section_title,
+                current_phase_data_json_str=current_phase_data_json_str,
+                all_project_data_json_str=all_project_data_json_str,
+                context=context
+            ))
+
+    return _assemble_document(document_header, phase_config.document.outline, section_contents)
+
+async def build_document_for_phase_async(
+    phase_id: int,
+    current_phase_data: Dict[str, Any],
+    all_project_data: Dict[str, Dict[str, Any]]
+) -> str:
+    """
+    Async variant of build_document_for_phase. Sections are generated concurrently
+    (at most DOC_SECTION_CONCURRENCY at a time) and assembled in outline order, so a
+    document takes roughly as long as its slowest batch of sections instead of the sum of all of them.
+    """
+    phase_config, document_header, current_phase_data_json_str, all_project_data_json_str = \
+        _prepare_document_build(phase_id, current_phase_data, all_project_data)
+    if not phase_config:
+        return document_header
+
+    # Created per build: asyncio primitives are bound to the running event loop.
+    semaphore = asyncio.Semaphore(max(1, DOC_SECTION_CONCURRENCY))
+    section_titles = [_prompt_section_title(title) for title in phase_config.document.outline]
+
+    async with document_build_context_async(section_titles, current_phase_data_json_str, all_project_data_json_str) as context:
+        async def _generate(clean_prompt_section_title: str) -> str:
+            async with semaphore:
+                return await generate_document_section_async(
+                    section_title=clean_prompt_section_title,
+                    current_phase_data_json_str=current_phase_data_json_str,
+                    all_project_data_json_str=all_project_data_json_str,
+                    context=context
+                )
+
+        section_contents = await asyncio.gather(*(_generate(title) for title in section_titles))
+    return _assemble_document(document_header, phase_config.document.outline, list(section_contents))
+
 if __name__ == '__main__':
     print("Testing Document Generator...")
 
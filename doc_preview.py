@@ -0,0 +1,114 @@
+"""
+Sanitized HTML previews of generated Markdown documents.
+
+Documents are rendered section by section: the Markdown is split at heading lines outside
+code fences (markdown_sections.py) and each section is converted with Python-Markdown, then
+sanitized with nh3 (only the tags and attributes Markdown produces, no scripts, styles or event handlers,
+links forced to rel="noopener noreferrer"). Rendered sections are cached in an LRU keyed by the
+SHA-256 of the section's Markdown, so
+
+- re-opening a document, or a section requested by the lazy-loading preview page, costs a
+  dictionary lookup instead of a render
+- a regenerated or partially streamed document only renders the sections whose text
+  changed; identical sections of other builds are already in the cache
+
+Section outlines (titles and hashes, without HTML) are cached per document content hash in
+a second, smaller LRU so that fetching section n of a stored document does not re-split it.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List
+
+import markdown
+import nh3
+
+from markdown_sections import OutlineSection, split_markdown_sections # OutlineSection re-exported for callers
+
+PREVIEW_SECTION_CACHE_SIZE = int(os.environ.get('PREVIEW_SECTION_CACHE_SIZE', '4096')) # Rendered sections kept
+PREVIEW_DOCUMENT_CACHE_SIZE = int(os.environ.get('PREVIEW_DOCUMENT_CACHE_SIZE', '128')) # Document outlines kept
+# Sections rendered into the preview page itself; the rest load as they scroll into view
+PREVIEW_EAGER_SECTIONS = int(os.environ.get('PREVIEW_EAGER_SECTIONS', '5'))
+
+MARKDOWN_EXTENSIONS = ['extra', 'sane_lists'] # extra: tables, fenced code, definition lists, abbreviations
+
+ALLOWED_TAGS = {
+    'a', 'abbr', 'b', 'blockquote', 'br', 'code', 'dd', 'del', 'div', 'dl', 'dt', 'em', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6', 'hr', 'i', 'img', 'ins', 'kbd', 'li', 'ol', 'p', 'pre', 'span', 'strong', 'sub', 'sup',
+    'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'ul',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'abbr': {'title'},
+    'img': {'src', 'alt', 'title'},
+    'td': {'align'},
+    'th': {'align'},
+    'code': {'class'}, # language-* from fenced code blocks
+}
+ALLOWED_URL_SCHEMES = {'http', 'https', 'mailto'}
+
+
+class LRUCache:
+    """A small thread-safe LRU with hit/miss counters."""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = compute() # Outside the lock: rendering must not serialise other lookups
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+_section_cache = LRUCache(PREVIEW_SECTION_CACHE_SIZE)
+_outline_cache = LRUCache(PREVIEW_DOCUMENT_CACHE_SIZE)
+
+
+def render_markdown(markdown_text: str) -> str:
+    """Markdown to sanitized HTML, uncached."""
+    html = markdown.markdown(markdown_text, extensions=MARKDOWN_EXTENSIONS, output_format='html')
+    return nh3.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES,
+                     url_schemes=ALLOWED_URL_SCHEMES, link_rel='noopener noreferrer')
+
+
+def render_section(section: OutlineSection) -> str:
+    """Sanitized HTML of one section, from the cache when this exact text was rendered before."""
+    return _section_cache.get_or_compute(section.content_hash, lambda: render_markdown(section.markdown))
+
+
+def document_outline(document_hash: str, load_text: Callable[[], str]) -> List[OutlineSection]:
+    """The sections of the document with this content hash; `load_text` is only called on a cache miss."""
+    return _outline_cache.get_or_compute(document_hash, lambda: split_markdown_sections(load_text()))
+
+
+def render_document(markdown_text: str) -> List[str]:
+    """
+    HTML of every section of `markdown_text`, in order. Only sections whose text has not been
+    rendered before are converted, so calling this again on a grown or regenerated document
+    (e.g. while it streams in) re-renders just the changed sections.
+    """
+    return [render_section(section) for section in split_markdown_sections(markdown_text)]
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    return {'sections': _section_cache.stats(), 'documents': _outline_cache.stats()}
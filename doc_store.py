@@ -0,0 +1,148 @@
+"""
+Content-addressed storage for generated documents.
+
+Blobs are stored once per distinct content under a sharded path derived from the SHA-256 of
+the (uncompressed) content:
+
+    <root>/ab/cd/abcd1234...        plain
+    <root>/ab/cd/abcd1234....gz     gzip-compressed (DOC_STORE_COMPRESS=gzip)
+
+Regenerating an identical document therefore costs no extra disk space, and no directory
+ever holds more than a small slice of the blobs. Which build of which project/phase points
+at which blob is recorded in the GeneratedDocument table (see app.py); blobs that no row
+references any more are removed by garbage collection (`flask docs gc`).
+"""
+import os
+import gzip
+import hashlib
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import IO, Iterable, Iterator, Optional, Set
+
+DOC_STORE_ROOT = os.environ.get('DOC_STORE_ROOT', os.path.join('generated_docs', 'store'))
+DOC_STORE_COMPRESS = os.environ.get('DOC_STORE_COMPRESS', '').lower() == 'gzip'
+# Builds kept per (project, phase); older builds are dropped after each new build (0 keeps all).
+DOC_RETENTION_BUILDS = int(os.environ.get('DOC_RETENTION_BUILDS', '10'))
+# Unreferenced blobs younger than this are left alone by GC, so a build that has just
+# reused (deduplicated) a blob but not yet committed its metadata row cannot lose it.
+DOC_GC_GRACE_SECONDS = int(os.environ.get('DOC_GC_GRACE_SECONDS', '3600'))
+
+_GZIP_SUFFIX = '.gz'
+_READ_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class StoredBlob:
+    content_hash: str
+    size: int # Uncompressed size in bytes
+    stored_size: int # Size on disk
+    compressed: bool
+    created: bool # False when an identical blob was already stored
+
+
+class DocumentStore:
+    def __init__(self, root: str = DOC_STORE_ROOT, compress: bool = DOC_STORE_COMPRESS):
+        self.root = root
+        self.compress = compress
+
+    def _shard_dir(self, content_hash: str) -> str:
+        return os.path.join(self.root, content_hash[:2], content_hash[2:4])
+
+    def blob_path(self, content_hash: str, compressed: bool) -> str:
+        return os.path.join(self._shard_dir(content_hash), content_hash + (_GZIP_SUFFIX if compressed else ''))
+
+    def find(self, content_hash: str) -> Optional[str]:
+        """Returns the path of the stored blob (either encoding), or None."""
+        for compressed in (self.compress, not self.compress):
+            path = self.blob_path(content_hash, compressed)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def put(self, content: str) -> StoredBlob:
+        """Stores `content` unless an identical blob already exists."""
+        data = content.encode('utf-8')
+        content_hash = hashlib.sha256(data).hexdigest()
+
+        existing_path = self.find(content_hash)
+        if existing_path:
+            os.utime(existing_path) # Refresh the GC grace period for the reused blob
+            return StoredBlob(content_hash, len(data), os.path.getsize(existing_path),
+                              existing_path.endswith(_GZIP_SUFFIX), created=False)
+
+        payload = gzip.compress(data, mtime=0) if self.compress else data
+        path = self.blob_path(content_hash, self.compress)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file in the same directory and rename, so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return StoredBlob(content_hash, len(data), len(payload), self.compress, created=True)
+
+    def open(self, content_hash: str) -> IO[bytes]:
+        """Opens the blob for reading as uncompressed bytes."""
+        path = self.find(content_hash)
+        if path is None:
+            raise FileNotFoundError(content_hash)
+        return gzip.open(path, 'rb') if path.endswith(_GZIP_SUFFIX) else open(path, 'rb')
+
+    def iter_chunks(self, content_hash: str, chunk_size: int = _READ_CHUNK_SIZE) -> Iterator[bytes]:
+        """Yields the uncompressed content in chunks without loading it all into memory."""
+        with self.open(content_hash) as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def read_text(self, content_hash: str) -> str:
+        with self.open(content_hash) as f:
+            return f.read().decode('utf-8')
+
+    def delete(self, content_hash: str) -> bool:
+        deleted = False
+        for compressed in (False, True):
+            path = self.blob_path(content_hash, compressed)
+            if os.path.isfile(path):
+                os.remove(path)
+                deleted = True
+        return deleted
+
+    def iter_hashes(self) -> Iterator[str]:
+        """Yields the hash of every stored blob."""
+        if not os.path.isdir(self.root):
+            return
+        for dir_path, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.startswith('.tmp-'):
+                    continue
+                yield filename[:-len(_GZIP_SUFFIX)] if filename.endswith(_GZIP_SUFFIX) else filename
+
+    def collect_garbage(self, referenced_hashes: Set[str], candidates: Optional[Iterable[str]] = None,
+                        grace_seconds: int = DOC_GC_GRACE_SECONDS) -> int:
+        """
+        Deletes blobs whose hash is not in `referenced_hashes` and that were not written or
+        reused within the grace period. Checks `candidates` only, or every blob when None.
+        Returns the number of blobs removed.
+        """
+        cutoff = time.time() - grace_seconds
+        removed = 0
+        for content_hash in list(self.iter_hashes() if candidates is None else candidates):
+            if content_hash in referenced_hashes:
+                continue
+            path = self.find(content_hash)
+            if path and os.path.getmtime(path) <= cutoff and self.delete(content_hash):
+                removed += 1
+        if candidates is None:
+            # Drop emptied shard directories
+            for dir_path, _, _ in os.walk(self.root, topdown=False):
+                if dir_path != self.root and not os.listdir(dir_path):
+                    os.rmdir(dir_path)
+        return removed
@@ -1,12 +1,35 @@
 import os
 import json
+import time
+import asyncio
+import datetime
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Iterator, AsyncIterator, List, Optional
 import google.generativeai as genai
+from google.generativeai import caching as genai_caching
 import backoff
 import google.api_core.exceptions as gexc # For more specific Gemini exceptions
+import logging
+import instrumentation
+import token_budget
 
 # --- Configuration ---
+# "google" talks to the real Gemini API; "fake" is an offline backend with simulated latency,
+# useful for local development, load testing and benchmarks without spending quota.
+GEMINI_BACKEND = os.environ.get("GEMINI_BACKEND", "google").lower()
+GEMINI_FAKE_LATENCY = float(os.environ.get("GEMINI_FAKE_LATENCY", "0.5")) # Seconds per simulated call
+# Extra simulated seconds per 1000 uncached prompt tokens, so the fake shows what context caching saves
+GEMINI_FAKE_LATENCY_PER_1K_TOKENS = float(os.environ.get("GEMINI_FAKE_LATENCY_PER_1K_TOKENS", "0"))
+# Gemini calls per minute for this process (0 = unlimited). Calls over the limit wait for a slot;
+# speculative calls (speculation.py) only start while enough of the budget is unused.
+GEMINI_RATE_LIMIT_RPM = float(os.environ.get("GEMINI_RATE_LIMIT_RPM", "0"))
+
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
+if GEMINI_BACKEND == "fake":
+    print(f"INFO: Using offline fake Gemini backend (simulated latency {GEMINI_FAKE_LATENCY}s per call).")
+elif not GEMINI_API_KEY:
     print("Warning: GEMINI_API_KEY environment variable not set. Gemini client will not function.")
     # Depending on strictness, you might raise an error here or allow the app to run with Gemini features disabled.
 else:
@@ -16,11 +39,231 @@ else:
         print(f"Error configuring Gemini API: {e}")
         GEMINI_API_KEY = None # Disable client if configuration fails
 
-# Model selection - consider making this configurable if needed
-# Using "gemini-1.5-flash-latest" as it's generally faster and more cost-effective for many tasks.
-# For tasks requiring maximum capability, "gemini-1.5-pro-latest" could be used.
-MODEL_NAME = "gemini-1.5-pro-latest" # Updated as per requirement for a high-capability model (approximating "Gemini 2.5")
-_MODEL = genai.GenerativeModel(MODEL_NAME) if GEMINI_API_KEY else None
+logger = logging.getLogger('engpartner.gemini') # Token usage and prompt trimming (JSON lines)
+
+# Model selection. One explicitly versioned model serves every call, cached or not, so a document
+# never mixes output from two models and a "-latest" alias cannot change under a running build.
+# (Context caching also only works with versioned models.)
+MODEL_NAME = os.environ.get("GEMINI_MODEL_NAME", "models/gemini-1.5-pro-002")
+
+# Smallest context the cached-content API accepts, by model family (longest matching prefix wins)
+_CACHE_MIN_TOKENS_BY_MODEL = {
+    "models/gemini-1.5-": 32768,
+}
+
+def _cache_min_tokens(model_name: str) -> int:
+    prefixes = [prefix for prefix in _CACHE_MIN_TOKENS_BY_MODEL if model_name.startswith(prefix)]
+    return _CACHE_MIN_TOKENS_BY_MODEL[max(prefixes, key=len)] if prefixes else 32768 # Unknown model: assume the 1.5 minimum
+
+# Input context window by model family (longest matching prefix wins)
+_CONTEXT_WINDOW_BY_MODEL = {
+    "models/gemini-1.5-pro-": 2097152,
+    "models/gemini-1.5-flash-": 1048576,
+}
+_RESPONSE_TOKEN_RESERVE = 8192 # Room left in the window for the section instruction and the reply
+
+def _context_window(model_name: str) -> int:
+    prefixes = [prefix for prefix in _CONTEXT_WINDOW_BY_MODEL if model_name.startswith(prefix)]
+    return _CONTEXT_WINDOW_BY_MODEL[max(prefixes, key=len)] if prefixes else 1048576 # Unknown model: assume the smaller window
+
+# Context caching for document builds: the phase context shared by every section is uploaded once
+# per build and each section call sends only its instruction. Contexts below the model's minimum
+# are never offered to the API; builds whose cache cannot be created (or stops working) fall back
+# to sending full prompts.
+CONTEXT_CACHE_ENABLED = os.environ.get("CONTEXT_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+CONTEXT_CACHE_MIN_TOKENS = int(os.environ.get("CONTEXT_CACHE_MIN_TOKENS", str(_cache_min_tokens(MODEL_NAME))))
+CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get("CONTEXT_CACHE_TTL_SECONDS", "600")) # Safety net; deleted after the build
+# Budget for a context that is sent once into the cache. PROMPT_TOKEN_LIMIT_SECTION bounds prompts sent
+# in full on every section call and is below the cache minimum, so a cached context is budgeted against
+# the model's window instead; the section limit still applies whenever full prompts are sent.
+CONTEXT_CACHE_TOKEN_LIMIT = int(os.environ.get("CONTEXT_CACHE_TOKEN_LIMIT",
+                                               str(_context_window(MODEL_NAME) - _RESPONSE_TOKEN_RESERVE)))
+
+
+class _FakePart:
+    def __init__(self, text: str):
+        self.text = text
+
+
+def _fake_token_count(text: str) -> int:
+    # Stand-in tokenizer (~4 UTF-8 bytes per token), deliberately different from
+    # token_budget's estimator so calibration has something to learn.
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+class _FakeUsageMetadata:
+    def __init__(self, prompt: str, text: str, cached_tokens: int = 0):
+        self.prompt_token_count = _fake_token_count(prompt) # Includes the cached part, as Gemini reports it
+        self.cached_content_token_count = cached_tokens
+        self.candidates_token_count = _fake_token_count(text)
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class _FakeResponse:
+    """Mimics the parts of a GenerateContentResponse that this module reads."""
+    def __init__(self, text: str, prompt: str = "", cached_tokens: int = 0):
+        part = _FakePart(text)
+        content = type("_FakeContent", (), {"parts": [part]})()
+        self.candidates = [type("_FakeCandidate", (), {"content": content})()]
+        self.prompt_feedback = None
+        self.text = text
+        self.usage_metadata = _FakeUsageMetadata(prompt, text, cached_tokens)
+
+
+class _FakeCachedContent:
+    """Offline stand-in for genai.caching.CachedContent: holds the cached text until deleted or expired."""
+    _count = 0
+    _lock = threading.Lock()
+
+    def __init__(self, model: str, text: str, ttl_seconds: float):
+        with self._lock:
+            _FakeCachedContent._count += 1
+            self.name = f"cachedContents/fake-{_FakeCachedContent._count}"
+        self.model = model
+        self.text = text
+        self.token_count = _fake_token_count(text)
+        self._expires = time.monotonic() + ttl_seconds
+        self._deleted = False
+
+    @classmethod
+    def create(cls, model: str, *, contents=None, ttl=None, display_name=None, **kwargs) -> "_FakeCachedContent":
+        text = "".join(str(part) for content in contents or [] for part in content["parts"])
+        if _fake_token_count(text) < _cache_min_tokens(model): # Like the real API
+            raise gexc.InvalidArgument(f"Cached content is too small; the minimum is {_cache_min_tokens(model)} tokens.")
+        ttl_seconds = ttl.total_seconds() if isinstance(ttl, datetime.timedelta) else float(ttl or 3600)
+        return cls(model, text, ttl_seconds)
+
+    def is_live(self) -> bool:
+        return not self._deleted and time.monotonic() < self._expires
+
+    def delete(self) -> None:
+        self._deleted = True
+
+
+class _FakeGenerativeModel:
+    """Offline stand-in for genai.GenerativeModel with a fixed per-call latency."""
+    def __init__(self, model_name: str, latency: float, cached_content: Optional[_FakeCachedContent] = None):
+        self.model_name = model_name
+        self.latency = latency
+        self.cached_content = cached_content
+
+    @classmethod
+    def from_cached_content(cls, cached_content: _FakeCachedContent, **kwargs) -> "_FakeGenerativeModel":
+        return cls(cached_content.model, GEMINI_FAKE_LATENCY, cached_content)
+
+    def _prepare(self, prompt: str):
+        """(prompt as the model sees it, cached tokens, simulated latency)."""
+        cached_tokens = 0
+        if self.cached_content is not None:
+            if not self.cached_content.is_live():
+                raise gexc.NotFound(f"CachedContent not found (or expired): {self.cached_content.name}")
+            prompt = self.cached_content.text + prompt
+            cached_tokens = self.cached_content.token_count
+        uncached_tokens = _fake_token_count(prompt) - cached_tokens
+        return prompt, cached_tokens, self.latency + uncached_tokens / 1000 * GEMINI_FAKE_LATENCY_PER_1K_TOKENS
+
+    def _fake_text(self, prompt: str) -> str:
+        marker = "requires *only* the following field keys: "
+        if marker in prompt:
+            keys_json = prompt.split(marker, 1)[1].split("\n", 1)[0].rstrip(".")
+            keys = json.loads(keys_json)
+            return json.dumps({key: f"Fake seeded value for '{key}'." for key in keys})
+        return f"Fake response ({len(prompt)} prompt characters)."
+
+    def generate_content(self, prompt, **kwargs) -> _FakeResponse:
+        prompt, cached_tokens, latency = self._prepare(prompt)
+        time.sleep(latency)
+        return _FakeResponse(self._fake_text(prompt), prompt, cached_tokens)
+
+    async def generate_content_async(self, prompt, **kwargs) -> _FakeResponse:
+        prompt, cached_tokens, latency = self._prepare(prompt)
+        await asyncio.sleep(latency)
+        return _FakeResponse(self._fake_text(prompt), prompt, cached_tokens)
+
+
+if GEMINI_BACKEND == "fake":
+    _MODEL = _FakeGenerativeModel(MODEL_NAME, GEMINI_FAKE_LATENCY)
+    _MODEL_CLASS, _CACHED_CONTENT_CLASS = _FakeGenerativeModel, _FakeCachedContent
+else:
+    _MODEL = genai.GenerativeModel(MODEL_NAME) if GEMINI_API_KEY else None
+    _MODEL_CLASS, _CACHED_CONTENT_CLASS = genai.GenerativeModel, genai_caching.CachedContent
+
+
+class _RateLimiter:
+    """Token bucket allowing `rpm` calls per minute, in bursts of up to `rpm` calls."""
+    def __init__(self, rpm: float):
+        self.rpm = rpm
+        self.capacity = max(rpm, 1.0)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rpm / 60.0)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Takes the next slot and returns how many seconds the caller must wait before using it."""
+        if self.rpm <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens * 60.0 / self.rpm
+
+    def headroom(self) -> float:
+        """Unused fraction of the budget: 1.0 when idle (or unlimited), 0.0 when calls are waiting."""
+        if self.rpm <= 0:
+            return 1.0
+        with self._lock:
+            self._refill()
+            return max(self.tokens, 0.0) / self.capacity
+
+
+_RATE_LIMITER = _RateLimiter(GEMINI_RATE_LIMIT_RPM)
+_CALL_SLOTS = None # Optional semaphore capping concurrent calls across processes (batch workers)
+
+def rate_limit_headroom() -> float:
+    return _RATE_LIMITER.headroom()
+
+def use_shared_limits(rate_limiter, call_slots=None) -> None:
+    """
+    Replaces this process's rate limiter (anything with reserve() and headroom()) and optionally caps
+    concurrent calls with a multiprocessing semaphore; batch regeneration workers share both.
+    """
+    global _RATE_LIMITER, _CALL_SLOTS
+    _RATE_LIMITER = rate_limiter
+    _CALL_SLOTS = call_slots
+
+@contextmanager
+def _call_slot() -> Iterator[None]:
+    if _CALL_SLOTS is None:
+        yield
+        return
+    _CALL_SLOTS.acquire()
+    try:
+        yield
+    finally:
+        _CALL_SLOTS.release()
+
+@asynccontextmanager
+async def _call_slot_async() -> AsyncIterator[None]:
+    if _CALL_SLOTS is None:
+        yield
+        return
+    slots = _CALL_SLOTS
+    acquired = asyncio.get_running_loop().run_in_executor(None, slots.acquire) # Never blocks the event loop
+    try:
+        await asyncio.shield(acquired)
+    except asyncio.CancelledError:
+        # The executor thread still takes the slot; hand it back once it has
+        acquired.add_done_callback(lambda future: future.cancelled() or future.exception() or slots.release())
+        raise
+    try:
+        yield
+    finally:
+        slots.release()
 
 # Default Generation Configuration
 DEFAULT_GENERATION_CONFIG = {
@@ -54,57 +297,137 @@ RETRYABLE_GEMINI_EXCEPTIONS = (
     # but be mindful this might just delay hitting a hard limit.
 )
 
-@backoff.on_exception(backoff.expo,
-                      RETRYABLE_GEMINI_EXCEPTIONS,
-                      max_tries=5, # Maximum number of retries
-                      max_time=120, # Maximum total time to spend retrying in seconds
-                      jitter=backoff.full_jitter) # Adds randomness to backoff
-def _call_gemini_api(prompt: str, generation_config: dict = None, safety_settings: list = None) -> str:
-    if not _MODEL:
-        return "Error: Gemini model not initialized. Check API key and configuration."
-
-    try:
-        current_gen_config = generation_config or DEFAULT_GENERATION_CONFIG
-        current_safety_settings = safety_settings or DEFAULT_SAFETY_SETTINGS
-
-        response = _MODEL.generate_content(
-            prompt,
-            generation_config=current_gen_config,
-            safety_settings=current_safety_settings
-        )
-
-        # Check for empty candidates or parts, which can happen if content is blocked or empty
-        if not response.candidates or not response.candidates[0].content.parts:
-            block_reason = "Unknown (response was empty or no content parts)"
-            if response.prompt_feedback and response.prompt_feedback.block_reason:
-                block_reason = response.prompt_feedback.block_reason.name # Use .name for enum
-            # print(f"Warning: Gemini response blocked or empty. Reason: {block_reason}") # For server logs
-            return f"Content generation blocked or result was empty. Reason: {block_reason}. Please revise your input or try again."
-
-        return response.text # .text provides a convenient way to get the combined text
-
-    except ValueError as ve: # Handles cases like invalid API key format during generation, or blocked prompts
+# Shared by the sync and async paths so both retry the same way.
+# backoff detects coroutine functions and sleeps with asyncio.sleep, so async retries never block a thread.
+_retry_on_transient_errors = backoff.on_exception(backoff.expo,
+                                                  RETRYABLE_GEMINI_EXCEPTIONS,
+                                                  max_tries=5, # Maximum number of retries
+                                                  max_time=120, # Maximum total time to spend retrying in seconds
+                                                  jitter=backoff.full_jitter) # Adds randomness to backoff
+
+@_retry_on_transient_errors
+def _generate_content_with_retry(model, prompt: str, generation_config: dict, safety_settings: list):
+    return model.generate_content(prompt, generation_config=generation_config, safety_settings=safety_settings)
+
+@_retry_on_transient_errors
+async def _generate_content_with_retry_async(model, prompt: str, generation_config: dict, safety_settings: list):
+    return await model.generate_content_async(prompt, generation_config=generation_config, safety_settings=safety_settings)
+
+def _response_to_text(response) -> str:
+    # Check for empty candidates or parts, which can happen if content is blocked or empty
+    if not response.candidates or not response.candidates[0].content.parts:
+        block_reason = "Unknown (response was empty or no content parts)"
+        if response.prompt_feedback and response.prompt_feedback.block_reason:
+            block_reason = response.prompt_feedback.block_reason.name # Use .name for enum
+        # print(f"Warning: Gemini response blocked or empty. Reason: {block_reason}") # For server logs
+        return f"Content generation blocked or result was empty. Reason: {block_reason}. Please revise your input or try again."
+
+    return response.text # .text provides a convenient way to get the combined text
+
+def _error_to_text(error: Exception) -> str:
+    if isinstance(error, ValueError): # Handles cases like invalid API key format during generation, or blocked prompts
         # This can also be triggered if the prompt itself is blocked by safety settings before even sending.
-        # print(f"ValueError during Gemini API call: {ve}") # For server logs
         # Attempt to get more specific feedback if available
         block_reason_detail = "Input may be inappropriate or violate safety policies."
-        if hasattr(ve, 'args') and len(ve.args) > 0 and "response" in ve.args[0]:
+        if hasattr(error, 'args') and len(error.args) > 0 and "response" in str(error.args[0]):
              # This is a bit of a heuristic, actual error structure can vary
-            block_reason_detail = f"Input may be blocked by safety settings. ({ve})"
+            block_reason_detail = f"Input may be blocked by safety settings. ({error})"
 
         return f"Content generation failed due to an input error or safety blocking. Detail: {block_reason_detail}"
-    except gexc.GoogleAPIError as api_error: # Catch other Google API specific errors
-        # print(f"A Google API error occurred: {api_error}") # For server logs
-        # You might want to re-raise specific types of API errors if they shouldn't be masked
-        return f"A Google API error occurred: {type(api_error).__name__} - {str(api_error)[:100]}..." # Return a user-friendly message
-    except Exception as e: # Catch-all for other unexpected errors during the API call
-        # print(f"An unexpected error occurred in _call_gemini_api: {e}") # For server logs
-        return f"An unexpected error occurred while communicating with the AI model: {type(e).__name__}"
+    if isinstance(error, gexc.GoogleAPIError): # Other Google API specific errors, including retryable ones that ran out of tries
+        return f"A Google API error occurred: {type(error).__name__} - {str(error)[:100]}..." # Return a user-friendly message
+    # Catch-all for other unexpected errors during the API call
+    return f"An unexpected error occurred while communicating with the AI model: {type(error).__name__}"
+
+# Prefixes of the messages above, returned in place of generated text
+_ERROR_TEXT_PREFIXES = ("Error:", "Content generation", "A Google API error", "An unexpected error")
+
+def is_error_result(result) -> bool:
+    """True for the error text / error dict the public functions return instead of a result."""
+    if isinstance(result, dict):
+        return any(key in result for key in ("error", "_raw_ai_response_error", "_unexpected_error"))
+    return not isinstance(result, str) or result.startswith(_ERROR_TEXT_PREFIXES)
+
+def _record_usage(action: str, prompt: str, estimated_tokens: int, response, span) -> None:
+    """
+    Logs estimated vs actual prompt tokens and feeds the actual count into the estimator's calibration.
+    `prompt` is the whole prompt as the model sees it, including any cached prefix.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    actual_tokens = getattr(usage, "prompt_token_count", None) if usage is not None else None
+    cached_tokens = getattr(usage, "cached_content_token_count", None) if usage is not None else None
+    output_tokens = getattr(usage, "candidates_token_count", None) if usage is not None else None
+    token_budget.observe_usage(prompt, actual_tokens)
+    if span is not None:
+        span.attrs.update(estimated_tokens=estimated_tokens, actual_tokens=actual_tokens,
+                          cached_tokens=cached_tokens, output_tokens=output_tokens)
+    logger.info(json.dumps({
+        "event": "gemini_usage", "action": action,
+        "estimated_prompt_tokens": estimated_tokens, "actual_prompt_tokens": actual_tokens,
+        "cached_prompt_tokens": cached_tokens or 0,
+        "output_tokens": output_tokens, "calibration_ratio": round(token_budget.calibration_ratio(), 4),
+    }))
+
+# Rate-limited, traced and retried model calls; they raise, the _call_gemini_api wrappers turn errors into text.
+# `cached_prefix` is the part of the prompt already held by a cached-content model (for usage accounting).
+def _generate(model, prompt: str, generation_config: dict = None, safety_settings: list = None,
+              action: str = "generate", estimated_tokens: int = None, cached_prefix: str = ""):
+    wait = _RATE_LIMITER.reserve()
+    if wait:
+        time.sleep(wait)
+    with _call_slot(), instrumentation.span('gemini', action, prompt_chars=len(cached_prefix) + len(prompt)) as span:
+        response = _generate_content_with_retry(
+            model,
+            prompt,
+            generation_config or DEFAULT_GENERATION_CONFIG,
+            safety_settings or DEFAULT_SAFETY_SETTINGS
+        )
+    _record_usage(action, cached_prefix + prompt, estimated_tokens, response, span)
+    return response
+
+async def _generate_async(model, prompt: str, generation_config: dict = None, safety_settings: list = None,
+                          action: str = "generate", estimated_tokens: int = None, cached_prefix: str = ""):
+    wait = _RATE_LIMITER.reserve()
+    if wait:
+        await asyncio.sleep(wait)
+    async with _call_slot_async():
+        with instrumentation.span('gemini', action, prompt_chars=len(cached_prefix) + len(prompt)) as span:
+            response = await _generate_content_with_retry_async(
+                model,
+                prompt,
+                generation_config or DEFAULT_GENERATION_CONFIG,
+                safety_settings or DEFAULT_SAFETY_SETTINGS
+            )
+    _record_usage(action, cached_prefix + prompt, estimated_tokens, response, span)
+    return response
+
+def _call_gemini_api(prompt: str, generation_config: dict = None, safety_settings: list = None,
+                     action: str = "generate", estimated_tokens: int = None) -> str:
+    if not _MODEL:
+        return "Error: Gemini model not initialized. Check API key and configuration."
 
+    try:
+        return _response_to_text(_generate(_MODEL, prompt, generation_config, safety_settings, action, estimated_tokens))
+    except Exception as e:
+        # print(f"Error during Gemini API call: {e}") # For server logs
+        return _error_to_text(e)
 
-def generate_solution_summary(phase_data_json_str: str) -> str:
-    if not _MODEL: return "Error: AI model not available."
-    prompt = f"""
+async def _call_gemini_api_async(prompt: str, generation_config: dict = None, safety_settings: list = None,
+                                 action: str = "generate", estimated_tokens: int = None) -> str:
+    if not _MODEL:
+        return "Error: Gemini model not initialized. Check API key and configuration."
+
+    try:
+        return _response_to_text(await _generate_async(_MODEL, prompt, generation_config, safety_settings, action, estimated_tokens))
+    except Exception as e:
+        # print(f"Error during async Gemini API call: {e}") # For server logs
+        return _error_to_text(e)
+
+
+# --- Prompt Builders ---
+# Shared by the sync and async public functions below.
+def _solution_summary_prompt(phase_data_json_str: str) -> str:
+    return f"""
 You are an expert engineering assistant.
 Given the following JSON data for a development phase:
 {phase_data_json_str}
@@ -114,20 +437,25 @@ Focus on actionable advice or a concise overview.
 The summary should be well-structured and easy to read.
 Avoid conversational fluff. Be direct and professional.
 """
-    return _call_gemini_api(prompt)
 
-def generate_document_section(section_title: str, current_phase_data_json_str: str, all_project_data_json_str: str) -> str:
-    if not _MODEL: return "Error: AI model not available."
-    prompt = f"""
+# A document section prompt is the phase context followed by the section instruction. The context
+# comes first and does not mention the section, so it is byte-identical for every section of a
+# build and can be cached once (see DocumentContext).
+def _document_context_prompt(current_phase_data_json_str: str, all_project_data_json_str: str) -> str:
+    return f"""
 You are an expert engineering documentation writer.
-You are writing a specific section for a larger technical document.
-The current section title to generate content for is: "{section_title}"
+You are writing one section at a time of a larger technical document.
 
 The data for the current development phase is:
 {current_phase_data_json_str}
 
 For broader context, historical data from all previous phases of this project is:
 {all_project_data_json_str}
+"""
+
+def _document_section_instruction(section_title: str) -> str:
+    return f"""
+The current section title to generate content for is: "{section_title}"
 
 Generate the content ONLY for the section titled "{section_title}".
 Ensure the content is highly relevant to this section title and leverages the provided current and historical data.
@@ -136,15 +464,16 @@ Do NOT repeat the section title (e.g., "## {section_title}") in your response; o
 If the data provided is insufficient for a meaningful response for this specific section, state that clearly (e.g., "Insufficient data provided to generate content for this section.").
 Be professional and adhere to a technical writing style.
 """
-    return _call_gemini_api(prompt)
 
-def seed_next_phase_data(current_phase_data_json_str: str, next_phase_field_keys: list) -> dict:
-    if not _MODEL: return {"error": "AI model not available."}
+def document_prompt_template() -> str:
+    """The document prompts with placeholders for their inputs; any wording change changes this text."""
+    return _document_context_prompt("{current_phase_data}", "{all_project_data}") + _document_section_instruction("{section_title}")
 
+def _seed_next_phase_prompt(current_phase_data_json_str: str, next_phase_field_keys: list) -> str:
     # Convert list to a JSON string representation for the prompt
     next_phase_field_keys_json_array = json.dumps(next_phase_field_keys)
 
-    prompt = f"""
+    return f"""
 You are an AI assistant helping to transition data from one engineering phase to the next.
 Given the data from the current phase:
 {current_phase_data_json_str}
@@ -163,8 +492,42 @@ Example of the EXACT desired output format if next_phase_field_keys were ["summa
   "key_risks": "Identified potential risks based on current data."
 }}
 """
-    raw_json_str = _call_gemini_api(prompt)
 
+def _budgeted_documents(action: str, build, documents: list, limit: Optional[int] = None):
+    """
+    Keeps the prompt `build(*documents)` for `action` under `limit` (by default the action's
+    token limit, token_budget.PROMPT_TOKEN_LIMITS) by trimming its JSON `documents` if needed.
+    Documents are listed in trimming priority.
+
+    Returns (documents, estimated prompt tokens, error). documents is None, with a
+    user-facing error, when even the trimmed prompt is over the limit.
+    """
+    limit = token_budget.PROMPT_TOKEN_LIMITS[action] if limit is None else limit
+    prompt = build(*documents)
+    estimated_tokens = token_budget.estimate_tokens(prompt)
+    if estimated_tokens <= limit:
+        return documents, estimated_tokens, None
+
+    overhead_tokens = token_budget.estimate_tokens(build(*([""] * len(documents))))
+    trimmed_documents, report = token_budget.trim_json_documents(documents, limit - overhead_tokens)
+    prompt = build(*trimmed_documents)
+    trimmed_tokens = token_budget.estimate_tokens(prompt)
+    logger.info(json.dumps({
+        "event": "prompt_trimmed", "action": action, "limit": limit,
+        "estimated_before": estimated_tokens, "estimated_after": trimmed_tokens,
+        "dropped_keys": report.dropped_keys, "truncated_fields": report.truncated_fields,
+    }))
+    if trimmed_tokens > limit:
+        return None, trimmed_tokens, (f"Error: The input for this AI request is too large (~{trimmed_tokens} tokens, "
+                                      f"limit {limit}) even after trimming. Please shorten the phase data and try again.")
+    return trimmed_documents, trimmed_tokens, None
+
+def _budgeted_prompt(action: str, build, documents: list):
+    """Like _budgeted_documents, but returns (prompt, estimated tokens, error)."""
+    documents, estimated_tokens, error = _budgeted_documents(action, build, documents)
+    return (None if error else build(*documents)), estimated_tokens, error
+
+def _parse_seeded_data(raw_json_str: str, next_phase_field_keys: list) -> dict:
     try:
         # Basic cleaning of common non-JSON artifacts
         cleaned_json_str = raw_json_str.strip()
@@ -210,11 +573,246 @@ Example of the EXACT desired output format if next_phase_field_keys were ["summa
         error_payload["_unexpected_error"] = str(e)
         return error_payload
 
+
+# --- Document Build Context ---
+@dataclass
+class DocumentContext:
+    """
+    The section-independent part of a document build's prompts, prepared (and trimmed) once per
+    build. cached_model is set while the prefix is held by Gemini's cached-content API.
+    A context budgeted for the cache carries `uncached`, the same data within the section
+    limit, which is what is sent if the cache cannot be created or stops working.
+    """
+    prefix: Optional[str] # None when the context is too large to send
+    prefix_tokens: int = 0
+    error: Optional[str] = None
+    cache: Any = None
+    cached_model: Any = None
+    uncached: Optional["DocumentContext"] = None
+
+    @property
+    def full_prompt_context(self) -> "DocumentContext":
+        """The context to use for prompts sent in full."""
+        return self.uncached or self
+
+def _prepare_document_context(current_phase_data_json_str: str, all_project_data_json_str: str,
+                              section_titles: List[str]) -> DocumentContext:
+    """
+    The context for a build of `section_titles`. When caching is possible, it is budgeted against
+    CONTEXT_CACHE_TOKEN_LIMIT and kept if that makes it large enough to cache; otherwise (and for
+    the fallback) against the section limit.
+    """
+    if CONTEXT_CACHE_ENABLED and len(section_titles) > 1:
+        context = _budgeted_document_context(current_phase_data_json_str, all_project_data_json_str,
+                                             section_titles, CONTEXT_CACHE_TOKEN_LIMIT)
+        if _context_cacheable(context, len(section_titles)):
+            context.uncached = _budgeted_document_context(current_phase_data_json_str, all_project_data_json_str,
+                                                          section_titles)
+            return context
+    return _budgeted_document_context(current_phase_data_json_str, all_project_data_json_str, section_titles)
+
+def _budgeted_document_context(current_phase_data_json_str: str, all_project_data_json_str: str,
+                               section_titles: List[str], limit: Optional[int] = None) -> DocumentContext:
+    # Budgeted with the longest section instruction, so every section's full prompt fits the limit.
+    # Historical data is listed first so it is trimmed before the current phase's own data.
+    longest_instruction = max((_document_section_instruction(title) for title in section_titles), key=len,
+                              default=_document_section_instruction(""))
+    documents, _, error = _budgeted_documents(
+        "document_section",
+        lambda all_json, current_json: _document_context_prompt(current_json, all_json) + longest_instruction,
+        [all_project_data_json_str, current_phase_data_json_str],
+        limit=limit
+    )
+    if error:
+        return DocumentContext(prefix=None, error=error)
+    prefix = _document_context_prompt(documents[1], documents[0])
+    return DocumentContext(prefix=prefix, prefix_tokens=token_budget.estimate_tokens(prefix))
+
+def _context_cacheable(context: DocumentContext, section_count: int) -> bool:
+    # Never below the model's own minimum: the API would reject the cache (and the batch
+    # dry-run estimate would count cached tokens that are really sent in full)
+    min_tokens = max(CONTEXT_CACHE_MIN_TOKENS, _cache_min_tokens(MODEL_NAME))
+    return (CONTEXT_CACHE_ENABLED and context.prefix is not None
+            and section_count > 1 and context.prefix_tokens >= min_tokens)
+
+def _context_cache_worthwhile(context: DocumentContext, section_count: int) -> bool:
+    return _MODEL is not None and _context_cacheable(context, section_count)
+
+def _open_context_cache(context: DocumentContext) -> None:
+    """Uploads the context prefix as cached content (a blocking API call). On failure the build sends full prompts."""
+    try:
+        context.cache = _CACHED_CONTENT_CLASS.create(
+            MODEL_NAME,
+            display_name="engpartner-document-build",
+            contents=[{"role": "user", "parts": [context.prefix]}],
+            ttl=datetime.timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS)
+        )
+        context.cached_model = _MODEL_CLASS.from_cached_content(context.cache)
+        logger.info(json.dumps({"event": "context_cache_created", "cache": context.cache.name,
+                                "estimated_tokens": context.prefix_tokens}))
+    except Exception as e:
+        context.cache = context.cached_model = None
+        logger.info(json.dumps({"event": "context_cache_unavailable", "reason": f"{type(e).__name__}: {str(e)[:200]}"}))
+
+def _close_context_cache(context: DocumentContext) -> None:
+    if context.cache is None:
+        return
+    try:
+        context.cache.delete()
+    except Exception as e: # It still expires after CONTEXT_CACHE_TTL_SECONDS
+        logger.info(json.dumps({"event": "context_cache_delete_failed", "cache": context.cache.name,
+                                "reason": f"{type(e).__name__}: {str(e)[:200]}"}))
+    context.cache = context.cached_model = None
+
+def _stop_using_context_cache(context: DocumentContext, error: Exception) -> None:
+    # Expired, deleted or rejected: the remaining sections of the build send full prompts
+    if context.cached_model is not None:
+        context.cached_model = None
+        logger.info(json.dumps({"event": "context_cache_fallback", "cache": getattr(context.cache, "name", None),
+                                "reason": f"{type(error).__name__}: {str(error)[:200]}"}))
+
+@contextmanager
+def document_build_context(section_titles: List[str], current_phase_data_json_str: str,
+                           all_project_data_json_str: str) -> Iterator[DocumentContext]:
+    """
+    Prepares the prompt context shared by all sections of a document build, cached with Gemini
+    when it is large enough to be worth it. Pass the yielded context to generate_document_section;
+    the cache is deleted when the block exits.
+    """
+    context = _prepare_document_context(current_phase_data_json_str, all_project_data_json_str, section_titles)
+    if _context_cache_worthwhile(context, len(section_titles)):
+        _open_context_cache(context)
+    try:
+        yield context
+    finally:
+        _close_context_cache(context)
+
+@asynccontextmanager
+async def document_build_context_async(section_titles: List[str], current_phase_data_json_str: str,
+                                       all_project_data_json_str: str) -> AsyncIterator[DocumentContext]:
+    """Async variant of document_build_context; the cache API calls run in the default executor."""
+    context = _prepare_document_context(current_phase_data_json_str, all_project_data_json_str, section_titles)
+    loop = asyncio.get_running_loop()
+    if _context_cache_worthwhile(context, len(section_titles)):
+        await loop.run_in_executor(None, _open_context_cache, context)
+    try:
+        yield context
+    finally:
+        await loop.run_in_executor(None, _close_context_cache, context)
+
+def _document_section_tokens(context: DocumentContext, instruction: str) -> int:
+    return context.prefix_tokens + token_budget.estimate_tokens(instruction)
+
+def estimate_document_build_tokens(section_titles: List[str], current_phase_data_json_str: str,
+                                   all_project_data_json_str: str) -> dict:
+    """
+    Offline estimate of the prompt tokens a document build sends, without calling Gemini:
+    {"sections", "input_tokens", "cached_input_tokens", "cached"} or {"error"}. With context
+    caching the prefix is sent once (to create the cache) and then read from the cache by every section.
+    """
+    context = _prepare_document_context(current_phase_data_json_str, all_project_data_json_str, section_titles)
+    if context.error:
+        return {"error": context.error}
+    instruction_tokens = sum(token_budget.estimate_tokens(_document_section_instruction(title)) for title in section_titles)
+    cached = _context_cacheable(context, len(section_titles))
+    full_prompt_tokens = context.full_prompt_context.prefix_tokens * len(section_titles)
+    return {
+        "sections": len(section_titles),
+        "input_tokens": (context.prefix_tokens if cached else full_prompt_tokens) + instruction_tokens,
+        "cached_input_tokens": context.prefix_tokens * len(section_titles) if cached else 0,
+        "cached": cached,
+    }
+
+
+# --- Public API (synchronous) ---
+# Each prompt is size-checked (and trimmed if needed) before it is sent; see _budgeted_prompt.
+def _solution_summary_request(phase_data_json_str: str):
+    return _budgeted_prompt("solution_summary", _solution_summary_prompt, [phase_data_json_str])
+
+def _seed_next_phase_request(current_phase_data_json_str: str, next_phase_field_keys: list):
+    return _budgeted_prompt(
+        "seed_next_phase",
+        lambda current_json: _seed_next_phase_prompt(current_json, next_phase_field_keys),
+        [current_phase_data_json_str]
+    )
+
+def generate_solution_summary(phase_data_json_str: str) -> str:
+    if not _MODEL: return "Error: AI model not available."
+    prompt, estimated_tokens, error = _solution_summary_request(phase_data_json_str)
+    if error: return error
+    return _call_gemini_api(prompt, action="solution_summary", estimated_tokens=estimated_tokens)
+
+def generate_document_section(section_title: str, current_phase_data_json_str: str, all_project_data_json_str: str,
+                              context: Optional[DocumentContext] = None) -> str:
+    """With a `context` from document_build_context, the two JSON arguments are ignored and its prefix is used."""
+    if not _MODEL: return "Error: AI model not available."
+    context = context or _prepare_document_context(current_phase_data_json_str, all_project_data_json_str, [section_title])
+    if context.error: return context.error
+    instruction = _document_section_instruction(section_title)
+    cached_model = context.cached_model
+    if cached_model is not None:
+        try:
+            # Only the instruction is sent; the context is already held by the cache
+            return _response_to_text(_generate(cached_model, instruction, action="document_section",
+                                               estimated_tokens=_document_section_tokens(context, instruction),
+                                               cached_prefix=context.prefix))
+        except Exception as e:
+            _stop_using_context_cache(context, e)
+    context = context.full_prompt_context
+    if context.error: return context.error
+    return _call_gemini_api(context.prefix + instruction, action="document_section",
+                            estimated_tokens=_document_section_tokens(context, instruction))
+
+def seed_next_phase_data(current_phase_data_json_str: str, next_phase_field_keys: list) -> dict:
+    if not _MODEL: return {"error": "AI model not available."}
+    prompt, estimated_tokens, error = _seed_next_phase_request(current_phase_data_json_str, next_phase_field_keys)
+    if error: return {"error": error}
+    raw_json_str = _call_gemini_api(prompt, action="seed_next_phase", estimated_tokens=estimated_tokens)
+    return _parse_seeded_data(raw_json_str, next_phase_field_keys)
+
+
+# --- Public API (asynchronous) ---
+# Same behaviour as the functions above, built on generate_content_async.
+# Calls awaited together on one event loop (e.g. the sections of a document) run concurrently
+# without a thread each. Under WSGI each request still holds a worker thread; asgi.py serves the
+# AI action route natively on one event loop (see app.py).
+async def generate_solution_summary_async(phase_data_json_str: str) -> str:
+    if not _MODEL: return "Error: AI model not available."
+    prompt, estimated_tokens, error = _solution_summary_request(phase_data_json_str)
+    if error: return error
+    return await _call_gemini_api_async(prompt, action="solution_summary", estimated_tokens=estimated_tokens)
+
+async def generate_document_section_async(section_title: str, current_phase_data_json_str: str, all_project_data_json_str: str,
+                                          context: Optional[DocumentContext] = None) -> str:
+    if not _MODEL: return "Error: AI model not available."
+    context = context or _prepare_document_context(current_phase_data_json_str, all_project_data_json_str, [section_title])
+    if context.error: return context.error
+    instruction = _document_section_instruction(section_title)
+    cached_model = context.cached_model
+    if cached_model is not None:
+        try:
+            return _response_to_text(await _generate_async(cached_model, instruction, action="document_section",
+                                                           estimated_tokens=_document_section_tokens(context, instruction),
+                                                           cached_prefix=context.prefix))
+        except Exception as e:
+            _stop_using_context_cache(context, e)
+    context = context.full_prompt_context
+    if context.error: return context.error
+    return await _call_gemini_api_async(context.prefix + instruction, action="document_section",
+                                        estimated_tokens=_document_section_tokens(context, instruction))
+
+async def seed_next_phase_data_async(current_phase_data_json_str: str, next_phase_field_keys: list) -> dict:
+    if not _MODEL: return {"error": "AI model not available."}
+    prompt, estimated_tokens, error = _seed_next_phase_request(current_phase_data_json_str, next_phase_field_keys)
+    if error: return {"error": error}
+    raw_json_str = await _call_gemini_api_async(prompt, action="seed_next_phase", estimated_tokens=estimated_tokens)
+    return _parse_seeded_data(raw_json_str, next_phase_field_keys)
+
 if __name__ == '__main__':
     # This block is for testing the client directly.
     # Ensure GEMINI_API_KEY is set in your environment before running.
-    if not GEMINI_API_KEY:
-        print("Cannot run tests: GEMINI_API_KEY environment variable is not set.")
+    if not _MODEL:
+        print("Cannot run tests: GEMINI_API_KEY environment variable is not set (or set GEMINI_BACKEND=fake).")
     else:
         print("Gemini Client Initialized with API Key. Testing functions...")
 
@@ -0,0 +1,365 @@
+"""
+Per-request timing: where did a request spend its time?
+
+Every request gets a tree of timed spans. The root is the request. Child spans come from:
+
+- SQLAlchemy cursor events, one span per query (category "db")
+- Flask's template signals, one span per render (category "render")
+- gemini_client calls (category "gemini")
+- the JSON provider (category "json")
+- explicit `with span(...)` blocks
+
+Spans are tracked in a contextvar, so they nest correctly in async views too. Concurrent
+children, such as document sections generated with asyncio.gather, overlap. Their category
+totals can therefore add up to more than the request's wall time.
+
+Each response gets a Server-Timing header with per-category totals, shown in the browser's
+network panel. Each request is also logged as one JSON line on the "engpartner.requests"
+logger. Requests slower than SLOW_REQUEST_MS are appended, with their full span tree, to
+SLOW_REQUEST_LOG (JSON lines).
+
+An opt-in sampling profiler writes one folded-stack file per profiled request to PROFILE_DIR:
+
+    func;func;func <samples>    (one line per distinct stack)
+
+flamegraph.pl, speedscope and inferno all read this format. It profiles endpoints listed in
+PROFILE_ENDPOINTS, plus requests carrying ?_profile=1 or an "X-Profile: 1" header when
+PROFILE_ALLOW_REQUEST is set.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import datetime
+import threading
+import collections
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '1').lower() in ('1', 'true', 'yes')
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '1000'))
+SLOW_REQUEST_LOG = os.environ.get('SLOW_REQUEST_LOG', os.path.join('logs', 'slow_requests.jsonl'))
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# Caps the spans kept per request (e.g. an N+1 loop); totals still count everything.
+MAX_SPANS_PER_REQUEST = int(os.environ.get('MAX_SPANS_PER_REQUEST', '2000'))
+
+PROFILE_ENDPOINTS = {e.strip() for e in os.environ.get('PROFILE_ENDPOINTS', '').split(',') if e.strip()}
+PROFILE_ALLOW_REQUEST = os.environ.get('PROFILE_ALLOW_REQUEST', '').lower() in ('1', 'true', 'yes')
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join('logs', 'profiles'))
+
+# Order of the categories in the Server-Timing header
+CATEGORIES = ('db', 'render', 'gemini', 'json')
+
+request_logger = logging.getLogger('engpartner.requests')
+_slow_log_lock = threading.Lock()
+
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    start: float = field(default_factory=time.perf_counter)
+    end: Optional[float] = None
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    children: List['Span'] = field(default_factory=list)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end if self.end is not None else time.perf_counter()) - self.start) * 1000
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        node = {'name': self.name, 'category': self.category,
+                'offset_ms': round((self.start - origin) * 1000, 2), 'duration_ms': round(self.duration_ms, 2)}
+        if self.attrs:
+            node['attrs'] = self.attrs
+        if self.children:
+            node['children'] = [child.to_dict(origin) for child in self.children]
+        return node
+
+
+class RequestTrace:
+    """The span tree and per-category totals of one request."""
+
+    def __init__(self, name: str):
+        self.request_id = uuid.uuid4().hex[:16]
+        self.root = Span(name, 'request')
+        self.totals: Dict[str, float] = collections.defaultdict(float)
+        self.counts: Dict[str, int] = collections.defaultdict(int)
+        self.span_count = 0
+        self.profiler: Optional['SamplingProfiler'] = None
+        self.profile_path: Optional[str] = None
+
+    def record(self, span: Span) -> None:
+        self.totals[span.category] += span.duration_ms
+        self.counts[span.category] += 1
+
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar('current_trace', default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('current_span', default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(category: str, name: str, **attrs) -> Iterator[Optional[Span]]:
+    """Times the enclosed block as a child of the current span. A no-op outside a traced request."""
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    if trace is None or parent is None:
+        yield None
+        return
+    child = Span(name, category, attrs=attrs)
+    if trace.span_count < MAX_SPANS_PER_REQUEST:
+        parent.children.append(child)
+        trace.span_count += 1
+    token = _current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+        trace.record(child)
+
+
+def start_span(category: str, name: str, **attrs) -> Optional[Span]:
+    """Opens a span without a with-block, for callback pairs such as SQLAlchemy's before/after events."""
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    if trace is None or parent is None:
+        return None
+    child = Span(name, category, attrs=attrs)
+    if trace.span_count < MAX_SPANS_PER_REQUEST:
+        parent.children.append(child)
+        trace.span_count += 1
+    return child
+
+
+def finish_span(child: Optional[Span]) -> None:
+    trace = _current_trace.get()
+    if child is None or trace is None:
+        return
+    child.end = time.perf_counter()
+    trace.record(child)
+
+
+# --- Sampling profiler ---
+class SamplingProfiler:
+    """
+    Samples Python stacks on a background thread every `interval` seconds and counts them in
+    folded form. All threads except its own are sampled, because async views run their
+    coroutines on an event-loop thread rather than the request thread; use it on a quiet server.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: collections.Counter = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    @staticmethod
+    def _fold(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            # Function granularity (definition line, not current line) so samples of one function merge
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self.stacks[f"{thread_names.get(thread_id, thread_id)};{self._fold(frame)}"] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def write_folded(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# --- Output ---
+def server_timing_header(trace: RequestTrace) -> str:
+    entries = []
+    for category in CATEGORIES:
+        if trace.counts.get(category):
+            entries.append(f'{category};dur={trace.totals[category]:.1f};desc="{trace.counts[category]} calls"')
+    if trace.profile_path:
+        entries.append(f'profile;desc="{os.path.basename(trace.profile_path)}"')
+    entries.append(f'total;dur={trace.root.duration_ms:.1f}')
+    return ', '.join(entries)
+
+
+def request_summary(trace: RequestTrace, **fields) -> Dict[str, Any]:
+    summary = {'request_id': trace.request_id, **fields, 'duration_ms': round(trace.root.duration_ms, 2)}
+    for category in CATEGORIES:
+        if trace.counts.get(category):
+            summary[f'{category}_ms'] = round(trace.totals[category], 2)
+            summary[f'{category}_count'] = trace.counts[category]
+    return summary
+
+
+def write_slow_request(trace: RequestTrace, summary: Dict[str, Any], path: str = SLOW_REQUEST_LOG) -> None:
+    record = {'timestamp': datetime.datetime.utcnow().isoformat() + 'Z', **summary,
+              'spans': trace.root.to_dict(trace.root.start)}
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    with _slow_log_lock:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+# --- Wiring ---
+def _truncate(statement: str, limit: int = 300) -> str:
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + '…'
+
+
+def install_sqlalchemy_hooks(engine_class) -> None:
+    """Times every query run through any engine; spans attach to the current request, if any."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine_class, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        child = start_span('db', _truncate(statement))
+        if child is not None and executemany:
+            child.attrs['executemany'] = True
+        if context is not None:
+            context._instrumentation_span = child
+
+    @event.listens_for(engine_class, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        finish_span(getattr(context, '_instrumentation_span', None))
+
+    @event.listens_for(engine_class, 'handle_error')
+    def _handle_error(exception_context):
+        context = exception_context.execution_context
+        child = getattr(context, '_instrumentation_span', None)
+        if child is not None and child.end is None:
+            child.attrs['error'] = type(exception_context.original_exception).__name__
+            finish_span(child)
+
+
+def _profiling_requested(request) -> bool:
+    if request.endpoint in PROFILE_ENDPOINTS:
+        return True
+    return PROFILE_ALLOW_REQUEST and (request.args.get('_profile') == '1' or request.headers.get('X-Profile') == '1')
+
+
+def init_app(app) -> None:
+    """Installs the request hooks, template signals and JSON timing on a Flask app."""
+    if not logging.getLogger('engpartner').handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        logging.getLogger('engpartner').addHandler(handler)
+    logging.getLogger('engpartner').setLevel(LOG_LEVEL)
+    app.logger.setLevel(LOG_LEVEL)
+
+    if not INSTRUMENTATION_ENABLED:
+        return
+
+    from flask import request, g, before_render_template, template_rendered
+    from flask.json.provider import DefaultJSONProvider
+
+    class TimedJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            with span('json', 'dumps'):
+                return super().dumps(obj, **kwargs)
+
+        def loads(self, s, **kwargs):
+            with span('json', 'loads'):
+                return super().loads(s, **kwargs)
+
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def _start_trace():
+        trace = RequestTrace(f"{request.method} {request.path}")
+        trace.request_id = request.headers.get('X-Request-ID', trace.request_id)[:64]
+        g._trace_tokens = (_current_trace.set(trace), _current_span.set(trace.root))
+        g._trace = trace
+        if _profiling_requested(request):
+            trace.profiler = SamplingProfiler(PROFILE_INTERVAL_MS / 1000)
+            trace.profiler.start()
+
+    @app.after_request
+    def _finish_trace(response):
+        trace = g.pop('_trace', None)
+        if trace is None:
+            return response
+        # Streamed bodies (exports, downloads) are produced after this point and are not included
+        trace.root.end = time.perf_counter()
+        if trace.profiler is not None:
+            trace.profiler.stop()
+            stamp = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+            trace.profile_path = os.path.join(PROFILE_DIR, f"{stamp}_{request.endpoint or 'unknown'}_{trace.request_id}.folded")
+            try:
+                trace.profiler.write_folded(trace.profile_path)
+            except OSError:
+                request_logger.exception("Could not write profile %s", trace.profile_path)
+                trace.profile_path = None
+
+        response.headers['Server-Timing'] = server_timing_header(trace)
+        response.headers['X-Request-ID'] = trace.request_id
+        summary = request_summary(trace, method=request.method, path=request.path,
+                                  endpoint=request.endpoint, status=response.status_code)
+        if trace.profile_path:
+            summary['profile'] = trace.profile_path
+        request_logger.info(json.dumps(summary, default=str))
+        if trace.root.duration_ms >= SLOW_REQUEST_MS:
+            try:
+                write_slow_request(trace, summary)
+            except OSError:
+                request_logger.exception("Could not write the slow request log")
+        return response
+
+    @app.teardown_request
+    def _reset_trace(exc):
+        tokens = g.pop('_trace_tokens', None)
+        if tokens is not None:
+            try:
+                _current_span.reset(tokens[1])
+                _current_trace.reset(tokens[0])
+            except ValueError:
+                # Reset from another context (e.g. a streamed response); just clear the current values
+                _current_span.set(None)
+                _current_trace.set(None)
+        trace = g.pop('_trace', None) # Only left over when after_request did not run
+        if trace is not None and trace.profiler is not None:
+            trace.profiler.stop()
+
+    # Queries run while rendering (lazy loads in templates) nest under the render span
+    def _before_render(sender, template, context, **extra):
+        child = start_span('render', template.name or 'template')
+        token = _current_span.set(child) if child is not None else None
+        g.setdefault('_render_spans', []).append((child, token))
+
+    def _rendered(sender, template, context, **extra):
+        spans = g.get('_render_spans')
+        if spans:
+            child, token = spans.pop()
+            if token is not None:
+                _current_span.reset(token)
+            finish_span(child)
+
+    # weak=False: these closures have no other reference and would be garbage collected
+    before_render_template.connect(_before_render, app, weak=False)
+    template_rendered.connect(_rendered, app, weak=False)
@@ -0,0 +1,63 @@
+"""
+Splitting Markdown documents into heading sections.
+
+One fence-aware splitter shared by the document preview (doc_preview.py), the search index
+of generated documents and the failed-section check of batch regeneration (both through
+doc_generator.split_document_sections): a '#' line inside a fenced code block is never a heading.
+"""
+import re
+import hashlib
+from dataclasses import dataclass
+from typing import List, Optional
+
+_HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+_FENCE_RE = re.compile(r'^\s*(```|~~~)')
+
+
+@dataclass
+class OutlineSection:
+    index: int
+    title: str # Empty for text before the first heading
+    level: int # Heading level, 0 for text before the first heading
+    content_hash: str # SHA-256 of `markdown`
+    markdown: str
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def split_markdown_sections(markdown_text: str) -> List[OutlineSection]:
+    """
+    Splits Markdown into sections that each start at a heading line, keeping the heading
+    line in the section. Lines inside fenced code blocks are never treated as headings.
+    """
+    chunks: List[List[str]] = [[]]
+    headings: List[Optional[re.Match]] = [None]
+    in_fence: Optional[str] = None
+    for line in markdown_text.splitlines():
+        fence = _FENCE_RE.match(line)
+        if fence:
+            if in_fence is None:
+                in_fence = fence.group(1)
+            elif fence.group(1) == in_fence:
+                in_fence = None
+        heading = _HEADING_RE.match(line) if in_fence is None else None
+        if heading:
+            chunks.append([])
+            headings.append(heading)
+        chunks[-1].append(line)
+
+    sections: List[OutlineSection] = []
+    for lines, heading in zip(chunks, headings):
+        text = "\n".join(lines).strip('\n')
+        if heading is None and not text.strip():
+            continue # No preamble before the first heading
+        sections.append(OutlineSection(
+            index=len(sections),
+            title=heading.group(2) if heading else '',
+            level=len(heading.group(1)) if heading else 0,
+            content_hash=content_hash(text),
+            markdown=text,
+        ))
+    return sections
@@ -0,0 +1,43 @@
+"""Use jsonb for phase_data.data on PostgreSQL and index it
+
+Revision ID: 3b7d2e91c4a0
+Revises: 9f8c51ba6e54
+Create Date: 2026-10-19 09:12:44.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7d2e91c4a0'
+down_revision = '9f8c51ba6e54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite keeps its JSON (TEXT) column; only PostgreSQL gets jsonb and the GIN index.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.alter_column('phase_data', 'data',
+                    existing_type=sa.JSON(),
+                    type_=postgresql.JSONB(),
+                    existing_nullable=False,
+                    postgresql_using='data::jsonb')
+    # jsonb_path_ops: smaller and faster than the default opclass for containment (@>) lookups.
+    op.create_index('ix_phase_data_data_gin', 'phase_data', ['data'],
+                    postgresql_using='gin',
+                    postgresql_ops={'data': 'jsonb_path_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_phase_data_data_gin', table_name='phase_data')
+    op.alter_column('phase_data', 'data',
+                    existing_type=postgresql.JSONB(),
+                    type_=sa.JSON(),
+                    existing_nullable=False,
+                    postgresql_using='data::json')
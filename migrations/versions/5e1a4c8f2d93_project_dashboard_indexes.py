@@ -0,0 +1,26 @@
+"""Add indexes for the multi-project dashboard
+
+Revision ID: 5e1a4c8f2d93
+Revises: 3b7d2e91c4a0
+Create Date: 2026-10-19 11:03:27.540918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e1a4c8f2d93'
+down_revision = '3b7d2e91c4a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Covering index for the per-project, per-phase max(last_modified) aggregate.
+    op.create_index('ix_phase_data_project_phase_modified', 'phase_data',
+                    ['project_id', 'phase_id_int', 'last_modified'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_phase_data_project_phase_modified', table_name='phase_data')
@@ -0,0 +1,72 @@
+"""Add search_entry table with FTS5 (SQLite) / tsvector GIN (PostgreSQL) index
+
+Revision ID: 7c4f0a2b9e16
+Revises: 5e1a4c8f2d93
+Create Date: 2026-10-19 13:41:09.772310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c4f0a2b9e16'
+down_revision = '5e1a4c8f2d93'
+branch_labels = None
+depends_on = None
+
+
+# Deliberately frozen copy of search_index.SQLITE_SEARCH_DDL / POSTGRES_SEARCH_DDL as of this
+# revision: a migration must keep producing its own revision's schema, so it does not import app
+# code that may change later. search_index.py's copy serves create_all() (fresh databases); any
+# change to the index needs a new migration as well as an edit there.
+SQLITE_UPGRADE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS search_entry_fts USING fts5(
+        body, content='search_entry', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS search_entry_ai AFTER INSERT ON search_entry BEGIN
+        INSERT INTO search_entry_fts(rowid, body) VALUES (new.id, new.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_entry_ad AFTER DELETE ON search_entry BEGIN
+        INSERT INTO search_entry_fts(search_entry_fts, rowid, body) VALUES ('delete', old.id, old.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_entry_au AFTER UPDATE ON search_entry BEGIN
+        INSERT INTO search_entry_fts(search_entry_fts, rowid, body) VALUES ('delete', old.id, old.body);
+        INSERT INTO search_entry_fts(rowid, body) VALUES (new.id, new.body);
+    END""",
+]
+
+POSTGRES_UPGRADE = [
+    """ALTER TABLE search_entry ADD COLUMN body_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', coalesce(body, ''))) STORED""",
+    "CREATE INDEX ix_search_entry_body_tsv ON search_entry USING gin (body_tsv)",
+]
+
+
+def upgrade():
+    op.create_table('search_entry',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('phase_id_int', sa.Integer(), nullable=False),
+    sa.Column('source', sa.String(length=16), nullable=False),
+    sa.Column('field_key', sa.String(), nullable=False),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['project_id'], ['project.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_search_entry_scope', 'search_entry',
+                    ['project_id', 'phase_id_int', 'source', 'field_key'], unique=False)
+
+    dialect = op.get_bind().dialect.name
+    for statement in SQLITE_UPGRADE if dialect == 'sqlite' else POSTGRES_UPGRADE if dialect == 'postgresql' else []:
+        op.execute(statement)
+    # Existing data is not indexed here; run `flask search reindex` once after upgrading.
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        for trigger in ('search_entry_ai', 'search_entry_ad', 'search_entry_au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS search_entry_fts")
+    op.drop_index('ix_search_entry_scope', table_name='search_entry')
+    op.drop_table('search_entry')
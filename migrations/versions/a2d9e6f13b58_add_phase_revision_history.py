@@ -0,0 +1,41 @@
+"""Add phase data revision history
+
+Revision ID: a2d9e6f13b58
+Revises: 7c4f0a2b9e16
+Create Date: 2026-10-19 15:20:51.309477
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2d9e6f13b58'
+down_revision = '7c4f0a2b9e16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('phase_data', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+
+    op.create_table('phase_revision',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('phase_data_id', sa.Integer(), nullable=False),
+    sa.Column('revision', sa.Integer(), nullable=False),
+    sa.Column('is_snapshot', sa.Boolean(), nullable=False),
+    sa.Column('payload', sa.JSON().with_variant(postgresql.JSONB(astext_type=sa.Text()), 'postgresql'), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['phase_data_id'], ['phase_data.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('phase_data_id', 'revision', name='uq_phase_revision')
+    )
+    # Existing rows start at revision 0; their next save is recorded as a full snapshot.
+
+
+def downgrade():
+    op.drop_table('phase_revision')
+    with op.batch_alter_table('phase_data', schema=None) as batch_op:
+        batch_op.drop_column('revision')
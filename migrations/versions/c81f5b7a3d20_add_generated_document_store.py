@@ -0,0 +1,40 @@
+"""Add generated_document metadata for the content-addressed document store
+
+Revision ID: c81f5b7a3d20
+Revises: a2d9e6f13b58
+Create Date: 2026-10-19 17:05:38.224619
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f5b7a3d20'
+down_revision = 'a2d9e6f13b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('generated_document',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('phase_id_int', sa.Integer(), nullable=False),
+    sa.Column('build_no', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('stored_size', sa.Integer(), nullable=False),
+    sa.Column('compressed', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['project_id'], ['project.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('project_id', 'phase_id_int', 'build_no', name='uq_generated_document_build')
+    )
+    op.create_index(op.f('ix_generated_document_content_hash'), 'generated_document', ['content_hash'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_generated_document_content_hash'), table_name='generated_document')
+    op.drop_table('generated_document')
@@ -0,0 +1,41 @@
+"""Add speculative_result for precomputed AI actions
+
+Revision ID: e47b2c9d1a06
+Revises: c81f5b7a3d20
+Create Date: 2026-10-19 18:12:04.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e47b2c9d1a06'
+down_revision = 'c81f5b7a3d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('speculative_result',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('phase_id_int', sa.Integer(), nullable=False),
+    sa.Column('action', sa.String(length=32), nullable=False),
+    sa.Column('fingerprint', sa.String(length=64), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('result', sa.JSON().with_variant(postgresql.JSONB(astext_type=sa.Text()), 'postgresql'), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.Column('consumed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['project_id'], ['project.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('project_id', 'phase_id_int', 'action', 'fingerprint', name='uq_speculative_result')
+    )
+    op.create_index('ix_speculative_result_created_at', 'speculative_result', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_speculative_result_created_at', table_name='speculative_result')
+    op.drop_table('speculative_result')
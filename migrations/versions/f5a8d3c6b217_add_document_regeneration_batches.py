@@ -0,0 +1,53 @@
+"""Add document config versions and regeneration batch checkpoints
+
+Revision ID: f5a8d3c6b217
+Revises: e47b2c9d1a06
+Create Date: 2026-10-19 21:37:48.206914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5a8d3c6b217'
+down_revision = 'e47b2c9d1a06'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('generated_document', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('config_version', sa.String(length=16), nullable=True))
+
+    op.create_table('regeneration_batch',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('filters', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('regeneration_item',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('batch_id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('phase_id_int', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('document_id', sa.Integer(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['batch_id'], ['regeneration_batch.id'], ),
+    sa.ForeignKeyConstraint(['project_id'], ['project.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('batch_id', 'project_id', 'phase_id_int', name='uq_regeneration_item')
+    )
+    op.create_index('ix_regeneration_item_batch_status', 'regeneration_item', ['batch_id', 'status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_regeneration_item_batch_status', table_name='regeneration_item')
+    op.drop_table('regeneration_item')
+    op.drop_table('regeneration_batch')
+    with op.batch_alter_table('generated_document', schema=None) as batch_op:
+        batch_op.drop_column('config_version')
@@ -0,0 +1,71 @@
+"""
+Compact revision history for phase data.
+
+Each save of a PhaseData row is recorded as a PhaseRevision (see app.py) holding either a
+full snapshot of the data or a delta of the changed keys only:
+
+    {"set": {"objective": "new text"}, "unset": ["old_key"]}
+
+A snapshot is written for the first recorded revision and then every
+REVISION_SNAPSHOT_INTERVAL revisions, so rebuilding any revision replays at most
+that many deltas. Storage grows with the size of the edits, not with the size of the blob.
+"""
+import os
+from typing import Any, Dict, Iterable, List
+
+# A full snapshot every N revisions bounds reconstruction cost.
+REVISION_SNAPSHOT_INTERVAL = max(1, int(os.environ.get('REVISION_SNAPSHOT_INTERVAL', '20')))
+# Retention: keep at most this many revisions per phase (0 keeps all) ...
+REVISION_RETENTION_COUNT = int(os.environ.get('REVISION_RETENTION_COUNT', '200'))
+# ... and drop revisions older than this many days (0 disables). The latest revision is always kept.
+REVISION_RETENTION_DAYS = int(os.environ.get('REVISION_RETENTION_DAYS', '0'))
+
+
+def compute_delta(old_data: Dict[str, Any], new_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the delta that turns old_data into new_data."""
+    delta: Dict[str, Any] = {}
+    changed = {key: value for key, value in new_data.items() if key not in old_data or old_data[key] != value}
+    removed = [key for key in old_data if key not in new_data]
+    if changed:
+        delta['set'] = changed
+    if removed:
+        delta['unset'] = removed
+    return delta
+
+
+def apply_delta(data: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns a new dict with `delta` applied to `data`."""
+    result = dict(data)
+    result.update(delta.get('set', {}))
+    for key in delta.get('unset', []):
+        result.pop(key, None)
+    return result
+
+
+def changed_keys(delta: Dict[str, Any]) -> List[str]:
+    return sorted(set(delta.get('set', {})) | set(delta.get('unset', [])))
+
+
+def is_snapshot_revision(revision: int) -> bool:
+    """Revisions 1, 1 + N, 1 + 2N, ... are stored as full snapshots."""
+    return (revision - 1) % REVISION_SNAPSHOT_INTERVAL == 0
+
+
+def reconstruct(snapshot_data: Dict[str, Any], deltas: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Replays deltas, in revision order, on top of a snapshot."""
+    data = dict(snapshot_data)
+    for delta in deltas:
+        data = apply_delta(data, delta)
+    return data
+
+
+def diff(old_data: Dict[str, Any], new_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Key-level diff between two versions, for display."""
+    return {
+        'added': {key: new_data[key] for key in new_data if key not in old_data},
+        'removed': {key: old_data[key] for key in old_data if key not in new_data},
+        'changed': {
+            key: {'from': old_data[key], 'to': new_data[key]}
+            for key in new_data if key in old_data and old_data[key] != new_data[key]
+        },
+    }
@@ -0,0 +1,213 @@
+"""
+Full-text search over phase data field values and generated document sections.
+
+Searchable text lives in the portable `search_entry` table (see SearchEntry in app.py);
+one row per phase field or document section. The engine-specific index sits next to it:
+
+- SQLite: an external-content FTS5 table (`search_entry_fts`) kept in sync by triggers,
+  ranked with bm25().
+- PostgreSQL: a generated `body_tsv` tsvector column with a GIN index, ranked with ts_rank_cd().
+
+Entries are replaced per (project, phase, source) and, for phase data, per changed field,
+so each save or document build only touches the rows it affects.
+"""
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from markupsafe import Markup, escape
+from sqlalchemy import DDL, event, text
+
+SOURCE_PHASE_DATA = 'phase'
+SOURCE_DOCUMENT = 'document'
+
+# Underscore-prefixed keys are app artifacts; only these are worth searching.
+SEARCHABLE_ARTIFACT_KEYS = {'_solution_summary'}
+
+# Sentinels wrapped around matches by the database, swapped for <mark> after HTML-escaping the snippet.
+_MATCH_START = '\x02'
+_MATCH_END = '\x03'
+
+# Used by create_all() for fresh databases. Migration 7c4f0a2b9e16 holds a frozen copy of the
+# original statements; changing the index here also needs a new migration.
+SQLITE_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS search_entry_fts USING fts5(
+        body, content='search_entry', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS search_entry_ai AFTER INSERT ON search_entry BEGIN
+        INSERT INTO search_entry_fts(rowid, body) VALUES (new.id, new.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_entry_ad AFTER DELETE ON search_entry BEGIN
+        INSERT INTO search_entry_fts(search_entry_fts, rowid, body) VALUES ('delete', old.id, old.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_entry_au AFTER UPDATE ON search_entry BEGIN
+        INSERT INTO search_entry_fts(search_entry_fts, rowid, body) VALUES ('delete', old.id, old.body);
+        INSERT INTO search_entry_fts(rowid, body) VALUES (new.id, new.body);
+    END""",
+]
+
+POSTGRES_SEARCH_DDL = [
+    """ALTER TABLE search_entry ADD COLUMN IF NOT EXISTS body_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', coalesce(body, ''))) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_search_entry_body_tsv ON search_entry USING gin (body_tsv)",
+]
+
+
+def install_search_ddl(table) -> None:
+    """Attaches the engine-specific full-text index DDL to the search_entry table's creation."""
+    for statement in SQLITE_SEARCH_DDL:
+        event.listen(table, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+    for statement in POSTGRES_SEARCH_DDL:
+        event.listen(table, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+
+def _value_to_text(value: Any) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _is_searchable_key(key: str) -> bool:
+    return not key.startswith('_') or key in SEARCHABLE_ARTIFACT_KEYS
+
+
+def index_phase_data(session, entry_model, project_id: int, phase_id_int: int,
+                     data: Dict[str, Any], changed_keys: Optional[Iterable[str]] = None,
+                     field_labels: Optional[Dict[str, str]] = None) -> None:
+    """
+    Re-indexes the searchable fields of one phase's data inside the caller's transaction.
+
+    Args:
+        session: SQLAlchemy session; the caller commits.
+        entry_model: The SearchEntry model class.
+        data: The full, already-merged phase data.
+        changed_keys: Keys written by this save. None re-indexes every field.
+        field_labels: Field key to display label, used as the result title.
+    """
+    keys = [k for k in (data.keys() if changed_keys is None else changed_keys) if _is_searchable_key(k)]
+    query = session.query(entry_model).filter_by(
+        project_id=project_id, phase_id_int=phase_id_int, source=SOURCE_PHASE_DATA
+    )
+    if changed_keys is not None:
+        if not keys:
+            return
+        query = query.filter(entry_model.field_key.in_(keys))
+    query.delete(synchronize_session=False)
+
+    for row in phase_data_entry_rows(project_id, phase_id_int, data, keys, field_labels):
+        session.add(entry_model(**row))
+
+
+def phase_data_entry_rows(project_id: int, phase_id_int: int, data: Dict[str, Any],
+                          keys: Optional[Iterable[str]] = None,
+                          field_labels: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+    """
+    Column values of the search entries for `keys` of one phase's data (every searchable key
+    when None), for callers that insert many rows at once, e.g. bulk imports.
+    """
+    labels = field_labels or {}
+    rows = []
+    for key in (data.keys() if keys is None else keys):
+        if not _is_searchable_key(key):
+            continue
+        body = _value_to_text(data.get(key)).strip()
+        if not body:
+            continue
+        rows.append({
+            'project_id': project_id, 'phase_id_int': phase_id_int, 'source': SOURCE_PHASE_DATA,
+            'field_key': key, 'title': labels.get(key, key), 'body': body,
+        })
+    return rows
+
+
+def index_document_sections(session, entry_model, project_id: int, phase_id_int: int,
+                            sections: List[Tuple[str, str]]) -> None:
+    """Replaces the indexed sections of a phase's generated document with `sections` ((title, body) pairs)."""
+    session.query(entry_model).filter_by(
+        project_id=project_id, phase_id_int=phase_id_int, source=SOURCE_DOCUMENT
+    ).delete(synchronize_session=False)
+    for position, (title, body) in enumerate(sections):
+        if not body.strip():
+            continue
+        session.add(entry_model(
+            project_id=project_id, phase_id_int=phase_id_int, source=SOURCE_DOCUMENT,
+            field_key=f"section_{position}", title=title, body=body
+        ))
+
+
+def _fts5_match_expression(query: str) -> str:
+    # Quote every term so user input is never parsed as FTS5 syntax (AND/OR/NEAR, column filters, "C++" etc.).
+    terms = [term.replace('"', '""') for term in query.split()]
+    return ' '.join(f'"{term}"' for term in terms if term)
+
+
+def _highlight(snippet: Optional[str]) -> Markup:
+    escaped = str(escape(snippet or ''))
+    return Markup(escaped.replace(_MATCH_START, '<mark>').replace(_MATCH_END, '</mark>'))
+
+
+def search(session, query: str, limit: int, offset: int = 0,
+           project_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Runs a ranked full-text query and returns up to `limit` hits starting at `offset`.
+
+    Each hit is a dict with project_id, phase_id_int, source, field_key, title,
+    snippet (HTML-safe Markup with <mark> highlights) and rank (higher is better).
+    """
+    query = (query or '').strip()
+    if not query:
+        return []
+
+    dialect = session.get_bind().dialect.name
+    params: Dict[str, Any] = {'limit': limit, 'offset': offset}
+    project_filter = ''
+    if project_id is not None:
+        project_filter = 'AND e.project_id = :project_id'
+        params['project_id'] = project_id
+
+    if dialect == 'sqlite':
+        match = _fts5_match_expression(query)
+        if not match:
+            return []
+        params.update(match=match, match_start=_MATCH_START, match_end=_MATCH_END)
+        sql = text(f"""
+            SELECT e.project_id, e.phase_id_int, e.source, e.field_key, e.title,
+                   snippet(search_entry_fts, 0, :match_start, :match_end, '…', 16) AS snippet,
+                   -bm25(search_entry_fts) AS rank
+            FROM search_entry_fts
+            JOIN search_entry e ON e.id = search_entry_fts.rowid
+            WHERE search_entry_fts MATCH :match {project_filter}
+            ORDER BY bm25(search_entry_fts)
+            LIMIT :limit OFFSET :offset
+        """)
+    elif dialect == 'postgresql':
+        params.update(query=query, headline_options=(
+            f"StartSel={_MATCH_START}, StopSel={_MATCH_END}, MaxFragments=2, MaxWords=30, MinWords=10"
+        ))
+        sql = text(f"""
+            SELECT e.project_id, e.phase_id_int, e.source, e.field_key, e.title,
+                   ts_headline('english', e.body, q, :headline_options) AS snippet,
+                   ts_rank_cd(e.body_tsv, q) AS rank
+            FROM search_entry e, websearch_to_tsquery('english', :query) AS q
+            WHERE e.body_tsv @@ q {project_filter}
+            ORDER BY rank DESC, e.id
+            LIMIT :limit OFFSET :offset
+        """)
+    else:
+        # Unindexed fallback for other databases; correct but not fast.
+        params['pattern'] = f"%{query}%"
+        sql = text(f"""
+            SELECT e.project_id, e.phase_id_int, e.source, e.field_key, e.title,
+                   substr(e.body, 1, 200) AS snippet, 0 AS rank
+            FROM search_entry e
+            WHERE lower(e.body) LIKE lower(:pattern) {project_filter}
+            ORDER BY e.id
+            LIMIT :limit OFFSET :offset
+        """)
+
+    hits = []
+    for row in session.execute(sql, params).mappings():
+        hit = dict(row)
+        hit['snippet'] = _highlight(hit['snippet'])
+        hits.append(hit)
+    return hits
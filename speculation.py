@@ -0,0 +1,114 @@
+"""
+Speculative precomputation of the AI actions that usually follow a save.
+
+Users almost always click "Generate Solution" and "Seed Phase N+1" right after saving a
+phase. With SPECULATIVE_PRECOMPUTE on, a save queues those Gemini calls on a small
+background pool and stores the results (SpeculativeResult rows, see app.py) under a
+fingerprint of exactly the input the click would send. A click whose fingerprint matches
+a ready result uses it instead of calling Gemini; one still running in this process is
+awaited instead of being started again.
+
+Speculation only uses spare capacity:
+
+- a pool worker must be idle; speculative calls never queue behind each other
+- the Gemini rate limiter must have SPECULATIVE_MIN_HEADROOM of its budget unused
+- per-project and global daily caps on speculative calls, counted in the database so
+  they hold across server processes
+
+The counters below are per process (clicks served, skip reasons, latency saved); the
+database rows give the hit rate across processes (see app.get_speculation_stats).
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+SPECULATIVE_PRECOMPUTE = os.environ.get('SPECULATIVE_PRECOMPUTE', '').lower() in ('1', 'true', 'yes')
+SPECULATIVE_WORKERS = int(os.environ.get('SPECULATIVE_WORKERS', '2'))
+SPECULATIVE_DAILY_CAP_PER_PROJECT = int(os.environ.get('SPECULATIVE_DAILY_CAP_PER_PROJECT', '50'))
+SPECULATIVE_DAILY_CAP_GLOBAL = int(os.environ.get('SPECULATIVE_DAILY_CAP_GLOBAL', '500'))
+# Fraction of the Gemini rate limit that must be unused before a speculative call starts
+SPECULATIVE_MIN_HEADROOM = float(os.environ.get('SPECULATIVE_MIN_HEADROOM', '0.5'))
+SPECULATIVE_RETENTION_DAYS = int(os.environ.get('SPECULATIVE_RETENTION_DAYS', '14'))
+# A result still 'running' after this long belongs to a process that died
+SPECULATIVE_STALE_SECONDS = 600
+
+ACTION_SOLUTION_SUMMARY = 'solution_summary'
+ACTION_SEED_NEXT_PHASE = 'seed_next_phase'
+
+STATUS_RUNNING = 'running'
+STATUS_READY = 'ready'
+STATUS_FAILED = 'failed' # Gemini returned an error; never served, so the click retries for real
+
+logger = logging.getLogger('engpartner.speculation')
+
+
+def fingerprint(action: str, phase_data: Dict[str, Any], next_phase_field_keys: Optional[list] = None) -> str:
+    """SHA-256 of everything the action's prompt is built from."""
+    payload = json.dumps([action, phase_data, next_phase_field_keys], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SpeculationPool:
+    """A few background threads for speculative calls, and the futures of the ones in flight."""
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def has_idle_worker(self) -> bool:
+        with self._lock:
+            return len(self._in_flight) < self.workers
+
+    def submit(self, key: Hashable, fn: Callable, *args) -> Optional[Future]:
+        """Runs fn(*args) on an idle worker; None when all workers are busy or `key` is already running."""
+        with self._lock:
+            if key in self._in_flight or len(self._in_flight) >= self.workers:
+                return None
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='speculation')
+            future = self._executor.submit(fn, *args)
+            self._in_flight[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key: Hashable, future: Future) -> None:
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def in_flight(self, key: Hashable) -> Optional[Future]:
+        with self._lock:
+            return self._in_flight.get(key)
+
+
+class SpeculationMetrics:
+    """Per-process counters, reported next to the database totals."""
+    def __init__(self):
+        self._counts: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        served = counts.get('hits', 0) + counts.get('waited_hits', 0)
+        clicks = served + counts.get('misses', 0)
+        counts['click_hit_rate'] = round(served / clicks, 4) if clicks else None
+        counts['saved_seconds'] = round(counts.get('saved_seconds', 0), 3)
+        return counts
+
+
+pool = SpeculationPool(SPECULATIVE_WORKERS)
+metrics = SpeculationMetrics()
+
+
+def log_event(event: str, **fields) -> None:
+    logger.info(json.dumps({'event': f'speculation_{event}', **fields}))
@@ -0,0 +1,136 @@
+// Debounced field-level autosave for the phase forms.
+// Sends only the fields edited since the last save, together with the revision the page was
+// loaded at, to PATCH /project/<id>/phase/<n>/data (see patch_phase_data in app.py).
+// The Save/AI buttons still post the whole form, so the page works without JavaScript.
+(function () {
+    'use strict';
+
+    const DEBOUNCE_MS = 1000; // Wait for a pause in typing before saving
+
+    document.addEventListener('DOMContentLoaded', function () {
+        const form = document.querySelector('form.phase-form[data-autosave-url]');
+        if (!form || !window.fetch) {
+            return;
+        }
+        const status = form.querySelector('.autosave-status');
+        const csrfToken = form.querySelector('input[name="csrf_token"]').value;
+        let revision = parseInt(form.dataset.revision, 10) || 0;
+        const dirty = new Set();
+        let timer = null;
+        let inFlight = false;
+        let conflicted = false;
+
+        function setStatus(text, state) {
+            if (!status) {
+                return;
+            }
+            status.textContent = text;
+            status.dataset.state = state || '';
+        }
+
+        function fieldLabel(key) {
+            const label = form.querySelector('label[for="' + key + '"]');
+            return label ? label.textContent.trim() : key;
+        }
+
+        function schedule() {
+            clearTimeout(timer);
+            timer = setTimeout(save, DEBOUNCE_MS);
+        }
+
+        function showConflict(conflicts, serverRevision) {
+            conflicted = true;
+            setStatus('Changed by someone else since you opened this page: ' +
+                      Object.keys(conflicts).map(fieldLabel).join(', ') + '. ', 'conflict');
+            const keepMine = document.createElement('button');
+            keepMine.type = 'button';
+            keepMine.className = 'btn-link';
+            keepMine.textContent = 'Keep my version';
+            keepMine.addEventListener('click', function () {
+                revision = serverRevision; // Overwrite their edit on purpose
+                conflicted = false;
+                save();
+            });
+            const reload = document.createElement('button');
+            reload.type = 'button';
+            reload.className = 'btn-link';
+            reload.textContent = 'Load theirs';
+            reload.addEventListener('click', function () {
+                dirty.clear();
+                window.location.reload();
+            });
+            status.append(keepMine, ' · ', reload);
+        }
+
+        function save() {
+            if (inFlight) {
+                schedule(); // One request at a time; the next one picks up edits made meanwhile
+                return;
+            }
+            if (!dirty.size || conflicted) {
+                return;
+            }
+            const fields = {};
+            dirty.forEach(function (key) { fields[key] = form.elements[key].value; });
+            dirty.clear();
+            inFlight = true;
+            setStatus('Saving…', 'saving');
+
+            fetch(form.dataset.autosaveUrl, {
+                method: 'PATCH',
+                credentials: 'same-origin',
+                headers: {'Content-Type': 'application/json', 'X-CSRFToken': csrfToken},
+                body: JSON.stringify({revision: revision, fields: fields})
+            }).then(function (response) {
+                return response.json().then(function (body) { return {response: response, body: body}; });
+            }).then(function (result) {
+                if (result.response.ok) {
+                    revision = result.body.revision;
+                    form.dataset.revision = revision;
+                    form.elements['revision'].value = revision; // A full-form submit is based on this save too
+                    setStatus(dirty.size ? 'Unsaved changes' : 'All changes saved', 'saved');
+                    return;
+                }
+                Object.keys(fields).forEach(function (key) { dirty.add(key); }); // Not saved: keep them pending
+                if (result.response.status === 409) {
+                    showConflict(result.body.conflicts || {}, result.body.revision);
+                } else if (result.response.status === 503) {
+                    setStatus('Saving…', 'saving');
+                    schedule(); // Busy with other saves to this phase: try again shortly
+                } else {
+                    setStatus(result.body.error || 'Autosave failed.', 'error');
+                }
+            }).catch(function () {
+                Object.keys(fields).forEach(function (key) { dirty.add(key); });
+                setStatus('Autosave failed; changes are not saved yet.', 'error');
+            }).finally(function () {
+                inFlight = false;
+            });
+        }
+
+        form.addEventListener('input', function (event) {
+            const key = event.target.name;
+            if (!key || key === 'csrf_token') {
+                return;
+            }
+            dirty.add(key);
+            if (!conflicted) {
+                setStatus('Unsaved changes', 'pending');
+            }
+            schedule();
+        });
+
+        // A full-form submit carries every field anyway
+        form.addEventListener('submit', function () {
+            clearTimeout(timer);
+            dirty.clear();
+        });
+
+        window.addEventListener('beforeunload', function (event) {
+            if (dirty.size || inFlight) {
+                event.preventDefault();
+                event.returnValue = '';
+            }
+        });
+    });
+})();
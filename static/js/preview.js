@@ -0,0 +1,62 @@
+// Lazy loading for the document preview page (templates/preview.html).
+// Sections that were not rendered into the page are fetched as HTML fragments from
+// /documents/<id>/<content hash>/sections/<n> shortly before they scroll into view.
+(function () {
+    'use strict';
+
+    const PRELOAD_MARGIN = '1200px'; // Start loading this far below the viewport
+    let observer = null;
+
+    function load(section) {
+        if (section.dataset.loading) {
+            return;
+        }
+        section.dataset.loading = '1';
+        fetch(section.dataset.src, {credentials: 'same-origin'})
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error('HTTP ' + response.status);
+                }
+                return response.text();
+            })
+            .then(function (html) {
+                section.innerHTML = html; // Sanitized on the server (doc_preview.py)
+                section.classList.remove('doc-section-pending');
+                if (observer) {
+                    observer.unobserve(section);
+                }
+            })
+            .catch(function () {
+                delete section.dataset.loading; // Retried when it next scrolls into view
+                const placeholder = section.querySelector('.doc-section-placeholder');
+                if (placeholder) {
+                    placeholder.textContent = 'Could not load this section.';
+                }
+            });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        const pending = document.querySelectorAll('.doc-section-pending[data-src]');
+        if (!pending.length || !window.fetch) {
+            return;
+        }
+        if (!('IntersectionObserver' in window)) {
+            pending.forEach(load);
+            return;
+        }
+        observer = new IntersectionObserver(function (entries) {
+            entries.forEach(function (entry) {
+                if (entry.isIntersecting) {
+                    load(entry.target);
+                }
+            });
+        }, {rootMargin: '0px 0px ' + PRELOAD_MARGIN + ' 0px'});
+        pending.forEach(function (section) { observer.observe(section); });
+
+        // Jumping to a section from the contents loads it (and its neighbours come into view as usual)
+        const target = window.location.hash && document.querySelector(window.location.hash);
+        if (target && target.classList.contains('doc-section-pending')) {
+            load(target);
+        }
+    });
+})();
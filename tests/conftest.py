@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+_TMP = tempfile.mkdtemp(prefix='engpartner-tests-')
+
+# Must be set before app/config/gemini_client are imported: they read the environment at import time
+os.environ['GEMINI_BACKEND'] = 'fake'
+os.environ['GEMINI_FAKE_LATENCY'] = '0.001'
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_TMP, 'test.db')
+os.environ['DOC_STORE_ROOT'] = os.path.join(_TMP, 'store')
+os.environ['SLOW_REQUEST_MS'] = '1000000' # Keep the slow-request log out of the working tree
+os.environ.pop('SPECULATIVE_PRECOMPUTE', None)
+
+sys.path.insert(0, ROOT)
+os.chdir(ROOT) # phases.yaml is loaded relative to the working directory
+
+import app as app_module # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app = app_module.app
+    flask_app.config.update(
+        TESTING=True,
+        WTF_CSRF_ENABLED=False,
+        UPLOAD_FOLDER=os.path.join(_TMP, 'uploads'),
+        DOC_STORE_ROOT=os.path.join(_TMP, 'store'),
+    )
+    os.makedirs(flask_app.config['UPLOAD_FOLDER'], exist_ok=True)
+    with flask_app.app_context():
+        app_module.db.create_all()
+    return flask_app
+
+
+@pytest.fixture
+def db(app):
+    """An application context with empty tables; everything written by the test is removed afterwards."""
+    with app.app_context():
+        yield app_module.db
+        app_module.db.session.rollback()
+        for table in reversed(app_module.db.metadata.sorted_tables):
+            app_module.db.session.execute(table.delete())
+        app_module.db.session.commit()
+
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
+
+
+@pytest.fixture
+def project(db):
+    project = app_module.Project(name="Test Project")
+    db.session.add(project)
+    db.session.commit()
+    return project
@@ -0,0 +1,87 @@
+import asyncio
+import contextvars
+import threading
+import time
+from urllib.parse import urlencode
+
+import asgi
+import gemini_client
+from app import Project, get_current_phase_data_db
+
+
+async def _request(method, path, form=None):
+    body = urlencode(form or {}).encode()
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+        'method': method, 'path': path, 'root_path': '', 'query_string': b'',
+        'headers': [(b'host', b'testserver'), (b'content-type', b'application/x-www-form-urlencoded'),
+                    (b'content-length', str(len(body)).encode())],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+    }
+    received = iter([{'type': 'http.request', 'body': body, 'more_body': False}])
+    messages = []
+
+    async def receive():
+        return next(received, {'type': 'http.disconnect'})
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi.application(scope, receive, send)
+    start = messages[0]
+    return start['status'], dict(start['headers']), b''.join(m.get('body', b'') for m in messages[1:])
+
+
+def _run(coroutine):
+    # Outside the test's app context, like a server: every request pushes its own
+    return contextvars.Context().run(asyncio.run, coroutine)
+
+
+def _generate_solution(project_id):
+    return _request('POST', f'/project/{project_id}/phase/1/action',
+                    {'action': 'generate_solution', 'project_name': "Bridge monitor", 'revision': 0})
+
+
+def test_routes_are_split_between_the_event_loop_and_the_wsgi_threads():
+    assert asgi._native_endpoint({'path': '/project/1/phase/1/action', 'method': 'POST'}) == 'handle_phase_action'
+    assert asgi._native_endpoint({'path': '/project/1/phase/1/action', 'method': 'GET'}) is None
+    assert asgi._native_endpoint({'path': '/projects', 'method': 'GET'}) is None
+
+
+def test_native_action_runs_the_flask_pipeline(db, project):
+    status, headers, _ = _run(_generate_solution(project.id))
+    assert status == 302
+    assert headers[b'location'].endswith(f'/project/{project.id}/phase/1'.encode())
+    assert b'x-request-id' in headers and b'session=' in headers[b'set-cookie'] # after_request hooks and the flash
+    db.session.expire_all()
+    assert get_current_phase_data_db(project.id, 1)['_solution_summary'].startswith("Fake response")
+
+
+def test_native_action_handles_errors_like_flask(db):
+    status, _, _ = _run(_generate_solution(999999))
+    assert status == 404
+
+
+def test_other_routes_are_served_as_wsgi(db, project):
+    status, _, body = _run(_request('GET', '/projects'))
+    assert status == 200 and b'Test Project' in body
+
+
+def test_waiting_actions_share_the_event_loop_without_a_thread_each(db, monkeypatch):
+    monkeypatch.setattr(gemini_client._MODEL, 'latency', 0.3)
+    projects = [Project(name=f"Load {n}") for n in range(20)]
+    db.session.add_all(projects)
+    db.session.commit()
+    project_ids = [p.id for p in projects]
+    threads_before = threading.active_count()
+
+    async def _all():
+        return await asyncio.gather(*(_generate_solution(project_id) for project_id in project_ids))
+
+    start = time.perf_counter()
+    responses = _run(_all())
+    elapsed = time.perf_counter() - start
+    assert [status for status, _, _ in responses] == [302] * 20
+    assert elapsed < 20 * 0.3 / 4 # Far from one call after another
+    # Only the small pool for database work was added, not a thread per waiting request
+    assert threading.active_count() - threads_before < 20
@@ -0,0 +1,45 @@
+import asyncio
+
+import doc_generator
+import gemini_client
+from app import get_current_phase_data_db
+
+PHASE_DATA = {'project_name': "Bridge monitor", 'objective': "Detect cracks early."}
+
+
+def test_async_build_matches_sync_build():
+    sync_document = doc_generator.build_document_for_phase(1, PHASE_DATA, {'1': PHASE_DATA})
+    async_document = asyncio.run(doc_generator.build_document_for_phase_async(1, PHASE_DATA, {'1': PHASE_DATA}))
+    assert async_document == sync_document
+    # Sections finish in any order but are assembled in outline order
+    headings = [line for line in async_document.splitlines() if line.startswith('#')][1:]
+    assert headings == doc_generator.get_phase_config(1).document.outline
+
+
+def test_async_build_runs_sections_concurrently(monkeypatch):
+    model = gemini_client._MODEL
+    original = model.generate_content_async
+    in_flight, peak = 0, 0
+
+    async def _tracked(prompt, **kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            return await original(prompt, **kwargs)
+        finally:
+            in_flight -= 1
+
+    monkeypatch.setattr(model, 'generate_content_async', _tracked)
+    monkeypatch.setattr(doc_generator, 'DOC_SECTION_CONCURRENCY', 3)
+    asyncio.run(doc_generator.build_document_for_phase_async(1, PHASE_DATA, {}))
+    assert peak == 3
+
+
+def test_generate_solution_action_stores_summary(client, project):
+    response = client.post(f'/project/{project.id}/phase/1/action',
+                           data={'action': 'generate_solution', 'project_name': "Bridge monitor", 'revision': 0})
+    assert response.status_code == 302
+    summary = get_current_phase_data_db(project.id, 1)['_solution_summary']
+    assert summary.startswith("Fake response")
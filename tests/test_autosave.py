@@ -0,0 +1,90 @@
+import pytest
+
+import app as app_module
+from app import PhaseData, PhaseRevision, get_current_phase_data_db, update_current_phase_data_db
+
+
+def _patch(client, project_id, revision, fields):
+    return client.patch(f'/project/{project_id}/phase/1/data', json={'revision': revision, 'fields': fields})
+
+
+def test_patch_saves_fields_and_returns_the_new_revision(client, project):
+    response = _patch(client, project.id, 0, {'objective': "draft"})
+    assert response.status_code == 200
+    assert response.get_json()['revision'] == 1
+    assert response.get_json()['saved'] == ['objective']
+    response = _patch(client, project.id, 1, {'stakeholders': "ops"})
+    assert response.get_json()['revision'] == 2
+    assert get_current_phase_data_db(project.id, 1) == {'objective': "draft", 'stakeholders': "ops"}
+
+
+def test_patch_conflicts_only_on_fields_changed_by_others(client, project):
+    _patch(client, project.id, 0, {'objective': "mine", 'stakeholders': "ops"})
+    update_current_phase_data_db(project.id, 1, {'objective': "theirs"}) # Revision 2, from another tab
+
+    conflict = _patch(client, project.id, 1, {'objective': "mine again"})
+    assert conflict.status_code == 409
+    assert conflict.get_json() == {'error': 'conflict', 'revision': 2, 'conflicts': {'objective': "theirs"}}
+
+    other_field = _patch(client, project.id, 1, {'stakeholders': "ops, users"})
+    assert other_field.status_code == 200
+    assert get_current_phase_data_db(project.id, 1) == {'objective': "theirs", 'stakeholders': "ops, users"}
+
+
+def test_unchanged_patch_records_no_revision(client, project):
+    _patch(client, project.id, 0, {'objective': "same"})
+    response = _patch(client, project.id, 1, {'objective': "same"})
+    assert response.get_json()['revision'] == 1
+    assert PhaseRevision.query.count() == 1
+
+
+@pytest.mark.parametrize('payload', [
+    {'fields': {'objective': "x"}},
+    {'revision': True, 'fields': {'objective': "x"}},
+    {'revision': 0, 'fields': {'bogus': "x"}},
+    {'revision': 0, 'fields': {'objective': 3}},
+])
+def test_patch_rejects_malformed_bodies(client, project, payload):
+    assert client.patch(f'/project/{project.id}/phase/1/data', json=payload).status_code == 400
+
+
+def test_stale_form_post_is_refused_and_keeps_both_versions(client, project):
+    _patch(client, project.id, 0, {'objective': "autosaved"})
+    response = client.post(f'/project/{project.id}/phase/1/action',
+                           data={'action': 'save', 'objective': "from the form", 'revision': 0})
+    assert response.status_code == 409
+    assert b"from the form" in response.data # The user's text is shown again
+    assert b'name="revision" value="1"' in response.data
+    assert get_current_phase_data_db(project.id, 1)['objective'] == "autosaved"
+
+    resubmitted = client.post(f'/project/{project.id}/phase/1/action',
+                              data={'action': 'save', 'objective': "from the form", 'revision': 1})
+    assert resubmitted.status_code == 302
+    assert get_current_phase_data_db(project.id, 1)['objective'] == "from the form"
+
+
+def test_compare_and_set_refuses_a_stale_revision(db, project):
+    update_current_phase_data_db(project.id, 1, {'objective': "v1"})
+    entry = PhaseData.query.filter_by(project_id=project.id, phase_id_int=1).one()
+    assert not app_module.claim_next_phase_revision(entry, 0, {'objective': "lost"}, {'set': {'objective': "lost"}})
+    assert app_module.claim_next_phase_revision(entry, 1, {'objective': "v2"}, {'set': {'objective': "v2"}})
+    db.session.commit()
+    assert get_current_phase_data_db(project.id, 1) == {'objective': "v2"}
+
+
+def test_merge_save_that_loses_the_race_is_applied_on_top(db, project, monkeypatch):
+    update_current_phase_data_db(project.id, 1, {'objective': "v1"})
+    original = app_module.claim_next_phase_revision
+    raced = []
+
+    def _racing_claim(entry, current_revision, new_data, delta):
+        if not raced: # Another writer saves between our read and our write
+            raced.append(True)
+            db.session.execute(PhaseData.__table__.update().where(PhaseData.id == entry.id)
+                               .values(revision=current_revision + 1, data={'objective': "v1", 'stakeholders': "them"}))
+        return original(entry, current_revision, new_data, delta)
+
+    monkeypatch.setattr(app_module, 'claim_next_phase_revision', _racing_claim)
+    update_current_phase_data_db(project.id, 1, {'constraints': "budget"})
+    assert get_current_phase_data_db(project.id, 1) == {'objective': "v1", 'stakeholders': "them", 'constraints': "budget"}
+    assert PhaseData.query.filter_by(project_id=project.id, phase_id_int=1).one().revision == 3
@@ -0,0 +1,181 @@
+import asyncio
+import datetime
+import multiprocessing
+
+import pytest
+
+import app as app_module
+import batch_regen
+import gemini_client
+from app import (
+    GeneratedDocument, RegenerationBatch, RegenerationItem, regenerate_document_item, save_document_build,
+    select_regeneration_targets, update_current_phase_data_db
+)
+from doc_generator import document_config_version
+
+
+def test_shared_rate_limiter_allows_a_burst_then_spaces_calls():
+    limiter = batch_regen.SharedRateLimiter(60, multiprocessing.get_context('spawn'))
+    assert [limiter.reserve() for _ in range(60)] == [0.0] * 60
+    assert limiter.reserve() == pytest.approx(1.0, abs=0.05) # One call per second once the burst is spent
+    assert limiter.headroom() == 0.0
+
+
+def test_shared_rate_limiter_counts_calls_from_other_processes():
+    mp_context = multiprocessing.get_context('spawn')
+    limiter = batch_regen.SharedRateLimiter(60, mp_context)
+    workers = [mp_context.Process(target=limiter.reserve) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+    assert limiter.headroom() == pytest.approx(57 / 60, abs=0.01)
+
+
+def test_disabled_rate_limit_never_waits():
+    limiter = batch_regen.SharedRateLimiter(0, multiprocessing.get_context('spawn'))
+    assert (limiter.reserve(), limiter.headroom()) == (0.0, 1.0)
+
+
+def test_cancelled_wait_for_a_call_slot_gives_the_slot_back(monkeypatch):
+    slots = multiprocessing.get_context('spawn').Semaphore(1)
+    monkeypatch.setattr(gemini_client, '_CALL_SLOTS', slots)
+
+    async def _take_slot():
+        async with gemini_client._call_slot_async():
+            pass
+
+    async def _cancel_while_waiting():
+        slots.acquire() # Held elsewhere: the call below has to wait
+        waiting = asyncio.ensure_future(_take_slot())
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        slots.release() # The abandoned acquire now takes the slot, and must hand it back
+        await asyncio.sleep(0.2)
+
+    asyncio.run(_cancel_while_waiting())
+    assert slots.get_value() == 1
+
+
+def test_cost_estimate():
+    estimate = batch_regen.CostEstimate()
+    estimate.add({'sections': 2, 'input_tokens': 1_000_000, 'cached_input_tokens': 0, 'cached': False})
+    estimate.add({'error': "too large"})
+    assert (estimate.documents, estimate.sections, estimate.errors) == (1, 2, 1)
+    assert estimate.output_tokens == 2 * batch_regen.ESTIMATED_OUTPUT_TOKENS_PER_SECTION
+    assert estimate.usd() == pytest.approx(batch_regen.GEMINI_PRICE_INPUT_PER_1M
+                                           + estimate.output_tokens * batch_regen.GEMINI_PRICE_OUTPUT_PER_1M / 1e6)
+
+
+@pytest.mark.parametrize('seconds, text', [(None, '?'), (5.4, '5s'), (65, '1m05s'), (3 * 3600 + 120, '3h02m')])
+def test_format_duration(seconds, text):
+    assert batch_regen.format_duration(seconds) == text
+
+
+def test_progress_counts_resumed_work_as_done():
+    progress = batch_regen.ProgressReporter(total=4, already_done=2)
+    progress.record(True)
+    progress.record(False)
+    assert (progress.completed, progress.finished_this_run, progress.failed) == (4, 2, 1)
+    assert progress.line().startswith('[4/4]')
+    assert progress.eta_seconds() == 0
+
+
+@pytest.fixture
+def shared_limits(monkeypatch):
+    # Building in process installs the batch limits in gemini_client; put the originals back afterwards
+    monkeypatch.setattr(gemini_client, '_RATE_LIMITER', gemini_client._RATE_LIMITER)
+    monkeypatch.setattr(gemini_client, '_CALL_SLOTS', gemini_client._CALL_SLOTS)
+
+
+def _phase_with_build(project_id, phase_id=1, config_version=None):
+    update_current_phase_data_db(project_id, phase_id, {'objective': f"phase {phase_id}"})
+    document = save_document_build(project_id, phase_id, f"# Phase {phase_id}\n")
+    if config_version is not None:
+        document.config_version = config_version
+        app_module.db.session.commit()
+    return document
+
+
+def test_select_targets_by_config_version_age_and_build_state(db, project):
+    _phase_with_build(project.id, 1)
+    _phase_with_build(project.id, 2, config_version='outdated')
+    update_current_phase_data_db(project.id, 3, {'objective': "never built"})
+
+    assert select_regeneration_targets() == [(project.id, 2)]
+    assert select_regeneration_targets(include_unbuilt=True) == [(project.id, 2), (project.id, 3)]
+    assert select_regeneration_targets(phase_ids=[1]) == []
+    assert select_regeneration_targets(phase_ids=[1], config_version='other') == [(project.id, 1)]
+    tomorrow = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+    assert select_regeneration_targets(phase_ids=[1], built_before=tomorrow) == [(project.id, 1)]
+    assert select_regeneration_targets(force=True) == [(project.id, 1), (project.id, 2), (project.id, 3)]
+    assert select_regeneration_targets(project_ids=[project.id + 1], force=True) == []
+
+
+def _item(db, project_id, phase_id=1):
+    batch = RegenerationBatch()
+    db.session.add(batch)
+    db.session.flush()
+    item = RegenerationItem(batch_id=batch.id, project_id=project_id, phase_id_int=phase_id)
+    db.session.add(item)
+    db.session.commit()
+    return item.id
+
+
+def test_regenerate_item_stores_the_build_and_checkpoints_it(db, project):
+    _phase_with_build(project.id, 1, config_version='outdated')
+    item_id = _item(db, project.id)
+    result = regenerate_document_item(item_id)
+    assert result['status'] == batch_regen.ITEM_DONE and result['error'] is None
+    db.session.expire_all()
+    item = db.session.get(RegenerationItem, item_id)
+    document = db.session.get(GeneratedDocument, item.document_id)
+    assert (document.build_no, document.config_version) == (2, document_config_version(1))
+    assert regenerate_document_item(item_id)['seconds'] == 0.0 # Already done: skipped on resume
+
+
+def test_build_with_failed_sections_is_not_stored(db, project, monkeypatch):
+    update_current_phase_data_db(project.id, 1, {'objective': "x"})
+    item_id = _item(db, project.id)
+
+    async def _failing_call(*args, **kwargs):
+        return "A Google API error occurred: ResourceExhausted - quota"
+
+    monkeypatch.setattr(gemini_client, '_call_gemini_api_async', _failing_call)
+    result = regenerate_document_item(item_id)
+    assert result['status'] == batch_regen.ITEM_FAILED
+    assert "section(s) failed" in result['error']
+    assert GeneratedDocument.query.count() == 0
+
+
+def _regenerate(app, *args):
+    return app.test_cli_runner().invoke(args=['docs', 'regenerate', *args])
+
+
+def test_cli_dry_run_estimates_without_building(app, db, project):
+    _phase_with_build(project.id, 1, config_version='outdated')
+    result = _regenerate(app, '--dry-run')
+    assert result.exit_code == 0, result.output
+    assert "Phase 1: 1 documents" in result.output and "(dry run)" in result.output
+    assert GeneratedDocument.query.count() == 1 and RegenerationBatch.query.count() == 0
+
+
+def test_cli_builds_in_process_and_resumes_failed_items(app, db, project, shared_limits):
+    _phase_with_build(project.id, 1, config_version='outdated')
+    _phase_with_build(project.id, 2, config_version='outdated')
+    result = _regenerate(app, '--workers', '0')
+    assert result.exit_code == 0, result.output
+    assert "[2/2]" in result.output and "0 failed." in result.output
+    db.session.expire_all()
+    batch = RegenerationBatch.query.one()
+    assert batch.status == batch_regen.BATCH_FINISHED
+    assert select_regeneration_targets() == []
+
+    batch.status = batch_regen.BATCH_RUNNING
+    batch.items.filter_by(phase_id_int=2).one().status = batch_regen.ITEM_FAILED
+    db.session.commit()
+    resumed = _regenerate(app, '--workers', '0', '--resume', str(batch.id), '--retry-failed')
+    assert resumed.exit_code == 0, resumed.output
+    assert "1 documents to build (1 already done)" in resumed.output
@@ -0,0 +1,107 @@
+import io
+import json
+import re
+
+import pytest
+
+import bulk_io
+from app import PhaseData, PhaseRevision, Project, get_current_phase_data_db, update_current_phase_data_db
+
+
+def _ndjson(*records):
+    return "\n".join(json.dumps(record) for record in records).encode('utf-8')
+
+
+def _import(client, body, **params):
+    query = '&'.join(f'{key}={value}' for key, value in params.items())
+    return client.post(f'/api/bulk/import?{query}', data=body, content_type='application/x-ndjson')
+
+
+def test_iter_raw_records_reports_bad_lines_in_place():
+    records = list(bulk_io.iter_raw_records(io.BytesIO(b'{"a": 1}\n\nnot json\n[2]\n')))
+    assert [line_no for line_no, _ in records] == [1, 3, 4]
+    assert isinstance(records[1][1], json.JSONDecodeError)
+    assert list(bulk_io.iter_raw_records(io.StringIO('{"records": [{"a": 1}]}'), 'json')) == [(1, {'a': 1})]
+
+
+@pytest.mark.parametrize('raw, message', [
+    ([], "must be a JSON object"),
+    ({'phase_id': True, 'project_id': 1, 'data': {}}, "'phase_id' must be an integer"),
+    ({'phase_id': 99, 'project_id': 1, 'data': {}}, "Phase 99 is not configured"),
+    ({'phase_id': 1, 'data': {}}, "Either 'project_id' or 'project_name'"),
+    ({'phase_id': 1, 'project_name': " ", 'data': {}}, "non-empty string"),
+    ({'phase_id': 1, 'project_id': 1, 'data': {'bogus': "x"}}, "Unknown field(s) for phase 1: bogus"),
+])
+def test_validate_record_errors(raw, message):
+    with pytest.raises(bulk_io.BulkRecordError, match=re.escape(message)):
+        bulk_io.validate_record(1, raw)
+
+
+def test_validate_record_keeps_only_portable_artifacts():
+    record = bulk_io.validate_record(7, {'phase_id': 1, 'project_name': " Bridge ", 'data': {
+        'objective': "x", '_solution_summary': "s", '_generated_doc_id': 3}})
+    assert (record.line_no, record.project_name) == (7, "Bridge")
+    assert record.data == {'objective': "x", '_solution_summary': "s"}
+
+
+def test_chunked():
+    assert list(bulk_io.chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+def test_import_creates_projects_and_revisions_in_chunks(client, db):
+    body = _ndjson(
+        {'project_name': "Bridge", 'phase_id': 1, 'data': {'objective': "a"}},
+        {'project_name': "Bridge", 'phase_id': 2, 'data': {}},
+        {'project_name': "Bridge", 'phase_id': 1, 'data': {'stakeholders': "b"}},
+        {'project_name': "Tunnel", 'phase_id': 1, 'data': {'objective': "c"}},
+        {'phase_id': 1, 'data': {}},
+    )
+    response = _import(client, body, chunk_size=2)
+    report = response.get_json()
+    assert response.status_code == 207
+    assert (report['records'], report['valid'], report['projects_created']) == (5, 4, 2)
+    assert [error['line'] for error in report['errors']] == [5]
+    bridge = Project.query.filter_by(name="Bridge").one()
+    assert get_current_phase_data_db(bridge.id, 1) == {'objective': "a", 'stakeholders': "b"}
+    assert PhaseRevision.query.join(PhaseData).filter(PhaseData.project_id == bridge.id,
+                                                      PhaseData.phase_id_int == 1).count() == 2
+
+
+def test_colliding_source_ids_never_merge_into_unrelated_projects(client, project):
+    update_current_phase_data_db(project.id, 1, {'objective': "ours"})
+    body = _ndjson(
+        {'project_id': project.id, 'project_name': "Theirs", 'phase_id': 1, 'data': {'objective': "theirs"}},
+        {'project_id': project.id, 'project_name': "Theirs", 'phase_id': 2, 'data': {}},
+    )
+    report = _import(client, body, chunk_size=1).get_json()
+    assert report['projects_created'] == 1
+    theirs = Project.query.filter_by(name="Theirs").one()
+    assert theirs.id != project.id
+    assert get_current_phase_data_db(project.id, 1) == {'objective': "ours"}
+    assert get_current_phase_data_db(theirs.id, 1) == {'objective': "theirs"}
+
+
+def test_match_ids_writes_into_existing_project(client, project):
+    body = _ndjson({'project_id': project.id, 'project_name': "Renamed", 'phase_id': 1, 'data': {'objective': "x"}})
+    report = _import(client, body, match_ids=1).get_json()
+    assert report['projects_created'] == 0
+    assert get_current_phase_data_db(project.id, 1) == {'objective': "x"}
+
+
+def test_id_only_record_must_exist(client, db):
+    report = _import(client, _ndjson({'project_id': 12345, 'phase_id': 1, 'data': {}})).get_json()
+    assert report['errors'] == [{'line': 1, 'error': "Project 12345 does not exist and no 'project_name' was given."}]
+
+
+def test_replace_mode_and_export_round_trip(client, project):
+    update_current_phase_data_db(project.id, 1, {'objective': "old", 'stakeholders': "kept?"})
+    body = _ndjson({'project_id': project.id, 'project_name': project.name, 'phase_id': 1, 'data': {'objective': "new"}})
+    assert _import(client, body, mode='replace').status_code == 200
+    (line,) = client.get(f'/api/bulk/export?project={project.id}').data.splitlines()
+    exported = json.loads(line)
+    assert (exported['project_id'], exported['revision'], exported['data']) == (project.id, 2, {'objective': "new"})
+
+
+def test_import_rejects_other_content_types(client, db):
+    response = client.post('/api/bulk/import', data=b'x', content_type='text/plain')
+    assert response.status_code == 415
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+from google.api_core import exceptions as gexc
+
+import doc_generator
+import gemini_client
+import token_budget
+
+SMALL_DATA = {'objective': "Monitor bridges."}
+LARGE_DATA = {'objective': "word " * 40000} # Above the 32,768-token cache minimum
+
+
+@pytest.fixture(autouse=True)
+def fresh_calibration(monkeypatch):
+    # Default limits throughout: the section limit (24,000) is below the cache minimum.
+    # Contexts are budgeted at this ratio 1.0 before the fake calls recalibrate it, so prompt
+    # sizes are checked with the raw estimate.
+    monkeypatch.setattr(token_budget, '_calibration', token_budget._Calibration(1.0))
+
+
+@pytest.fixture
+def caches(monkeypatch):
+    """Every cached content created during the test."""
+    created = []
+    original = gemini_client._FakeCachedContent.create.__func__
+
+    def _create(cls, model, **kwargs):
+        cache = original(cls, model, **kwargs)
+        created.append(cache)
+        return cache
+
+    monkeypatch.setattr(gemini_client._FakeCachedContent, 'create', classmethod(_create))
+    return created
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """(model, prompt) of every model call."""
+    made = []
+    original = gemini_client._generate_content_with_retry_async
+
+    async def _recorded(model, prompt, *args):
+        made.append((model, prompt))
+        return await original(model, prompt, *args)
+
+    monkeypatch.setattr(gemini_client, '_generate_content_with_retry_async', _recorded)
+    return made
+
+
+def _build(data):
+    return asyncio.run(doc_generator.build_document_for_phase_async(1, data, {}))
+
+
+def test_cache_minimum_by_model():
+    assert gemini_client._cache_min_tokens("models/gemini-1.5-pro-002") == 32768
+    assert gemini_client._cache_min_tokens("models/unknown-model") == 32768
+    assert gemini_client.CONTEXT_CACHE_MIN_TOKENS >= 32768
+
+
+def test_fake_cache_rejects_content_below_the_minimum():
+    with pytest.raises(gexc.InvalidArgument):
+        gemini_client._FakeCachedContent.create(gemini_client.MODEL_NAME, contents=[{'role': 'user', 'parts': ["small"]}])
+
+
+def test_small_context_is_sent_in_full_without_a_cache(caches, calls):
+    document = _build(SMALL_DATA)
+    assert caches == []
+    section_count = len(doc_generator.get_phase_config(1).document.outline)
+    assert len(calls) == section_count
+    assert all(model is gemini_client._MODEL and "Monitor bridges." in prompt for model, prompt in calls)
+    assert not any(gemini_client.is_error_result(body) for _, body in doc_generator.split_document_sections(document))
+
+
+def test_large_context_is_cached_once_per_build_with_the_same_model(caches, calls):
+    _build(LARGE_DATA)
+    (cache,) = caches
+    assert cache.model == gemini_client.MODEL_NAME == gemini_client._MODEL.model_name
+    assert not cache.is_live() # Deleted when the build finished
+    assert all(model.cached_content is cache for model, _ in calls)
+    assert all("word word" not in prompt for _, prompt in calls) # Only the section instructions are sent
+
+
+def test_default_limits_cache_a_context_above_the_section_limit(caches, calls):
+    assert token_budget.PROMPT_TOKEN_LIMITS['document_section'] < gemini_client.CONTEXT_CACHE_MIN_TOKENS
+    _build(LARGE_DATA)
+    (cache,) = caches
+    assert cache.text.count("word") >= 40000 # Budgeted against the cache limit, not trimmed to the section limit
+    assert all(model.cached_content is cache for model, _ in calls)
+
+
+def test_build_falls_back_to_full_prompts_when_the_cache_disappears(caches, calls, monkeypatch):
+    monkeypatch.setattr(doc_generator, 'DOC_SECTION_CONCURRENCY', 1)
+    original = gemini_client._FakeGenerativeModel._prepare
+
+    def _expire_after_first_call(model, prompt):
+        result = original(model, prompt)
+        if model.cached_content is not None:
+            model.cached_content.delete()
+        return result
+
+    monkeypatch.setattr(gemini_client._FakeGenerativeModel, '_prepare', _expire_after_first_call)
+    document = _build(LARGE_DATA)
+    assert len(caches) == 1
+    assert calls[0][0].cached_content is not None
+    # The second call finds the cache gone; it and every later section are sent in full, within the section limit
+    assert all(model is gemini_client._MODEL for model, _ in calls[2:])
+    limit = token_budget.PROMPT_TOKEN_LIMITS['document_section']
+    assert all(token_budget.raw_token_estimate(prompt) <= limit for _, prompt in calls[2:])
+    assert not any(gemini_client.is_error_result(body) for _, body in doc_generator.split_document_sections(document))
+
+
+def test_estimate_counts_cached_tokens_only_for_cacheable_contexts():
+    small = doc_generator.estimate_document_build(1, SMALL_DATA, {})
+    large = doc_generator.estimate_document_build(1, LARGE_DATA, {})
+    assert (small['cached'], small['cached_input_tokens']) == (False, 0)
+    assert large['cached'] and large['cached_input_tokens'] > large['input_tokens']
+
+
+def test_failed_cache_creation_sends_prompts_within_the_section_limit(caches, calls, monkeypatch):
+    def _unavailable(cls, model, **kwargs):
+        raise gexc.PermissionDenied("Caching is not enabled for this project.")
+
+    monkeypatch.setattr(gemini_client._FakeCachedContent, 'create', classmethod(_unavailable))
+    document = _build(LARGE_DATA)
+    limit = token_budget.PROMPT_TOKEN_LIMITS['document_section']
+    assert calls and all(model is gemini_client._MODEL for model, _ in calls)
+    assert all(token_budget.raw_token_estimate(prompt) <= limit for _, prompt in calls)
+    assert not any(gemini_client.is_error_result(body) for _, body in doc_generator.split_document_sections(document))
+
+
+def test_disabled_cache_is_never_created(caches, calls, monkeypatch):
+    monkeypatch.setattr(gemini_client, 'CONTEXT_CACHE_ENABLED', False)
+    _build(LARGE_DATA)
+    assert caches == []
+    limit = token_budget.PROMPT_TOKEN_LIMITS['document_section']
+    assert all(token_budget.raw_token_estimate(prompt) <= limit for _, prompt in calls)
+    assert doc_generator.estimate_document_build(1, LARGE_DATA, {})['cached'] is False
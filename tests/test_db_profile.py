@@ -0,0 +1,27 @@
+from sqlalchemy import text
+
+import config
+
+
+def test_sqlite_file_engine_options():
+    options = config.get_engine_options('sqlite:////tmp/app.db')
+    assert options['pool_pre_ping'] is True
+    assert options['pool_size'] == config.DB_POOL_SIZE
+    assert options['connect_args'] == {'timeout': config.SQLITE_BUSY_TIMEOUT_MS / 1000}
+
+
+def test_sqlite_memory_engine_options_have_no_pool_sizing():
+    options = config.get_engine_options('sqlite://')
+    assert 'pool_size' not in options
+
+
+def test_postgres_engine_options_set_statement_timeout():
+    options = config.get_engine_options('postgresql://user@localhost/app')
+    assert options['max_overflow'] == config.DB_MAX_OVERFLOW
+    assert options['connect_args'] == {'options': f'-c statement_timeout={config.DB_STATEMENT_TIMEOUT_MS}'}
+
+
+def test_sqlite_pragmas_applied_to_connections(db):
+    assert db.session.execute(text('PRAGMA journal_mode')).scalar().lower() == config.SQLITE_JOURNAL_MODE.lower()
+    assert db.session.execute(text('PRAGMA busy_timeout')).scalar() == config.SQLITE_BUSY_TIMEOUT_MS
+    assert db.session.execute(text('PRAGMA synchronous')).scalar() == 1 # NORMAL
@@ -0,0 +1,98 @@
+import gzip
+import hashlib
+import os
+
+import pytest
+
+import app as app_module
+import doc_store
+from app import GeneratedDocument, save_document_build, update_current_phase_data_db
+from doc_store import DocumentStore
+
+CONTENT = "# Doc\n\n## Scope\n\nEverything.\n"
+CONTENT_HASH = hashlib.sha256(CONTENT.encode('utf-8')).hexdigest()
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_put_deduplicates_and_reads_back(tmp_path, compress):
+    store = DocumentStore(str(tmp_path), compress=compress)
+    first = store.put(CONTENT)
+    second = store.put(CONTENT)
+    assert (first.content_hash, first.created, second.created) == (CONTENT_HASH, True, False)
+    assert first.compressed is compress
+    assert store.find(CONTENT_HASH).endswith('.gz') is compress
+    assert store.read_text(CONTENT_HASH) == CONTENT
+    assert b''.join(store.iter_chunks(CONTENT_HASH, chunk_size=4)) == CONTENT.encode('utf-8')
+    assert list(store.iter_hashes()) == [CONTENT_HASH]
+
+
+def test_gzip_blobs_are_reproducible(tmp_path):
+    store = DocumentStore(str(tmp_path), compress=True)
+    store.put(CONTENT)
+    with open(store.find(CONTENT_HASH), 'rb') as f:
+        assert f.read() == gzip.compress(CONTENT.encode('utf-8'), mtime=0)
+
+
+def test_garbage_collection_honours_references_and_grace(tmp_path):
+    store = DocumentStore(str(tmp_path), compress=False)
+    kept = store.put("kept").content_hash
+    dropped = store.put("dropped").content_hash
+    assert store.collect_garbage({kept}) == 0 # Both still inside the grace period
+    old = os.path.getmtime(store.find(dropped)) - 7200
+    for content_hash in (kept, dropped):
+        os.utime(store.find(content_hash), (old, old))
+    assert store.collect_garbage({kept}, grace_seconds=3600) == 1
+    assert store.find(dropped) is None and store.find(kept) is not None
+
+
+def _build(project_id, content=CONTENT):
+    document = save_document_build(project_id, 1, content)
+    return document.id
+
+
+def test_builds_share_blobs_and_old_builds_are_pruned(db, project):
+    update_current_phase_data_db(project.id, 1, {'project_name': "Bridge"})
+    keep = doc_store.DOC_RETENTION_BUILDS
+    ids = [_build(project.id) for _ in range(keep)] + [_build(project.id, CONTENT + "More.\n")]
+    builds = GeneratedDocument.query.order_by(GeneratedDocument.build_no).all()
+    assert [b.id for b in builds] == ids[1:]
+    assert [b.build_no for b in builds] == list(range(2, keep + 2))
+    assert {b.content_hash for b in builds[:-1]} == {CONTENT_HASH} # One blob for identical builds
+    assert app_module.get_document_store().find(CONTENT_HASH) is not None
+
+
+def test_download_uses_the_content_hash_as_etag(client, project):
+    update_current_phase_data_db(project.id, 1, {'project_name': "Bridge"})
+    document_id = _build(project.id)
+    response = client.get(f'/documents/{document_id}/download')
+    assert response.status_code == 200
+    assert response.get_etag() == (CONTENT_HASH, False)
+    assert response.data == CONTENT.encode('utf-8')
+    assert 'max-age=31536000' in response.headers['Cache-Control']
+    revalidated = client.get(f'/documents/{document_id}/download', headers={'If-None-Match': f'"{CONTENT_HASH}"'})
+    assert revalidated.status_code == 304
+
+
+@pytest.fixture
+def gzip_store(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'DOC_STORE_COMPRESS', True)
+    monkeypatch.setitem(app.config, 'DOC_STORE_ROOT', app.config['DOC_STORE_ROOT'] + '-gz')
+
+
+def test_gzip_blob_served_encoded_with_its_own_etag(client, project, gzip_store):
+    update_current_phase_data_db(project.id, 1, {'project_name': "Bridge"})
+    document_id = _build(project.id)
+    response = client.get(f'/documents/{document_id}/download', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.get_etag() == (f"{CONTENT_HASH}-gz", False)
+    assert gzip.decompress(response.data) == CONTENT.encode('utf-8')
+
+
+@pytest.mark.parametrize('accept_encoding', ['identity', 'gzip;q=0', 'x-gzip-custom'])
+def test_gzip_blob_decompressed_for_clients_without_gzip(client, project, gzip_store, accept_encoding):
+    update_current_phase_data_db(project.id, 1, {'project_name': "Bridge"})
+    document_id = _build(project.id)
+    response = client.get(f'/documents/{document_id}/download', headers={'Accept-Encoding': accept_encoding})
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_etag() == (CONTENT_HASH, False)
+    assert response.data == CONTENT.encode('utf-8')
@@ -0,0 +1,65 @@
+import json
+
+import instrumentation
+
+
+def test_span_is_a_no_op_outside_a_request():
+    with instrumentation.span('db', 'query') as span:
+        assert span is None
+
+
+def test_spans_nest_and_add_up_per_category():
+    trace = instrumentation.RequestTrace('GET /x')
+    tokens = (instrumentation._current_trace.set(trace), instrumentation._current_span.set(trace.root))
+    try:
+        with instrumentation.span('render', 'page') as outer:
+            with instrumentation.span('db', 'select', rows=2):
+                pass
+            with instrumentation.span('db', 'update'):
+                pass
+    finally:
+        instrumentation._current_span.reset(tokens[1])
+        instrumentation._current_trace.reset(tokens[0])
+    trace.root.end = outer.end
+    assert [child.name for child in trace.root.children] == ['page']
+    assert [child.attrs for child in outer.children] == [{'rows': 2}, {}]
+    assert (trace.counts['db'], trace.counts['render']) == (2, 1)
+
+    header = instrumentation.server_timing_header(trace)
+    assert header.startswith('db;dur=')
+    assert '"2 calls"' in header and 'render;dur=' in header and 'gemini' not in header
+    assert header.endswith(f'total;dur={trace.root.duration_ms:.1f}')
+
+
+def test_responses_carry_server_timing_and_request_id(client, project):
+    response = client.get('/projects', headers={'X-Request-ID': 'abc123'})
+    timing = response.headers['Server-Timing']
+    assert 'db;dur=' in timing and 'render;dur=' in timing and 'total;dur=' in timing
+    assert response.headers['X-Request-ID'] == 'abc123'
+
+
+def test_gemini_calls_are_timed(client, project):
+    response = client.post(f'/project/{project.id}/phase/1/action',
+                           data={'action': 'generate_solution', 'objective': "x", 'revision': 0})
+    assert 'gemini;dur=' in response.headers['Server-Timing']
+
+
+def test_slow_requests_are_logged(client, project, monkeypatch):
+    logged = []
+    monkeypatch.setattr(instrumentation, 'SLOW_REQUEST_MS', 0)
+    monkeypatch.setattr(instrumentation, 'write_slow_request', lambda trace, summary: logged.append(summary))
+    client.get('/projects')
+    (summary,) = logged
+    assert (summary['path'], summary['status'], summary['endpoint']) == ('/projects', 200, 'list_projects')
+    assert summary['db_count'] >= 1
+
+
+def test_write_slow_request_appends_json_lines(tmp_path):
+    trace = instrumentation.RequestTrace('GET /x')
+    trace.root.end = trace.root.start + 0.5
+    path = tmp_path / 'logs' / 'slow.jsonl'
+    instrumentation.write_slow_request(trace, {'path': '/x'}, str(path))
+    instrumentation.write_slow_request(trace, {'path': '/y'}, str(path))
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record['path'] for record in records] == ['/x', '/y']
+    assert records[0]['spans']['duration_ms'] == 500.0
@@ -0,0 +1,78 @@
+import doc_preview
+from app import save_document_build, update_current_phase_data_db
+from markdown_sections import split_markdown_sections
+
+
+def test_rendering_sanitizes_scripts_handlers_and_unsafe_links():
+    html = doc_preview.render_markdown(
+        "Hi <script>alert(1)</script> <img src=x onerror=alert(1)>\n\n"
+        "[bad](javascript:alert(1)) [good](https://example.com)")
+    assert '<script' not in html and 'onerror' not in html and 'javascript:' not in html
+    assert '<a href="https://example.com" rel="noopener noreferrer">good</a>' in html
+
+
+def test_rendering_keeps_markdown_structure():
+    html = doc_preview.render_markdown("## Title\n\n| a | b |\n|---|---|\n| 1 | 2 |\n\n```python\nx = 1\n```")
+    assert '<h2>Title</h2>' in html and '<table>' in html
+    assert '<code class="language-python">' in html
+
+
+def test_lru_cache_counts_hits_and_evicts_least_recently_used():
+    cache = doc_preview.LRUCache(2)
+    computed = []
+
+    def _compute(key):
+        return lambda: computed.append(key) or key.upper()
+
+    assert cache.get_or_compute('a', _compute('a')) == 'A'
+    cache.get_or_compute('b', _compute('b'))
+    assert cache.get_or_compute('a', _compute('a')) == 'A' # Hit: 'a' becomes most recent
+    cache.get_or_compute('c', _compute('c')) # Evicts 'b'
+    cache.get_or_compute('b', _compute('b'))
+    assert computed == ['a', 'b', 'c', 'b']
+    assert cache.stats() == {'entries': 2, 'max_entries': 2, 'hits': 1, 'misses': 4, 'evictions': 2}
+
+
+def test_identical_sections_render_once(monkeypatch):
+    monkeypatch.setattr(doc_preview, '_section_cache', doc_preview.LRUCache(10))
+    first = doc_preview.render_document("# A\n\nOne.\n\n# B\n\nTwo.")
+    second = doc_preview.render_document("# A\n\nOne.\n\n# B\n\nTwo, edited.")
+    assert first[0] == second[0]
+    assert doc_preview.cache_stats()['sections']['hits'] == 1
+
+
+def _document(project_id, content):
+    update_current_phase_data_db(project_id, 1, {'project_name': "Bridge"})
+    return save_document_build(project_id, 1, content)
+
+
+CONTENT = "".join(f"## Section {i}\n\nBody {i}.\n\n" for i in range(doc_preview.PREVIEW_EAGER_SECTIONS + 2))
+
+
+def test_preview_renders_the_first_sections_and_links_the_rest(client, project):
+    document = _document(project.id, CONTENT)
+    html = client.get(f'/documents/{document.id}/preview').get_data(as_text=True)
+    assert '<h2>Section 0</h2>' in html and '<p>Body 0.</p>' in html
+    lazy_index = doc_preview.PREVIEW_EAGER_SECTIONS
+    assert f'data-src="/documents/{document.id}/{document.content_hash}/sections/{lazy_index}"' in html
+    assert f'<p>Body {lazy_index}.</p>' not in html
+    assert f'<p>Body {lazy_index}.</p>' in client.get(f'/documents/{document.id}/preview?all=1').get_data(as_text=True)
+
+
+def test_section_fragments_are_privately_cached_under_the_content_hash(client, project):
+    document = _document(project.id, CONTENT)
+    url = f'/documents/{document.id}/{document.content_hash}/sections/1'
+    response = client.get(url)
+    assert response.get_data(as_text=True) == '<h2>Section 1</h2>\n<p>Body 1.</p>'
+    cache_control = response.cache_control
+    assert cache_control.private and cache_control.immutable and cache_control.max_age == 31536000
+    assert not cache_control.public
+    section = split_markdown_sections(CONTENT)[1]
+    assert response.get_etag() == (section.content_hash, False)
+    assert client.get(url, headers={'If-None-Match': f'"{section.content_hash}"'}).status_code == 304
+
+
+def test_section_fragment_urls_with_a_stale_hash_or_index_are_not_found(client, project):
+    document = _document(project.id, CONTENT)
+    assert client.get(f'/documents/{document.id}/{"0" * 64}/sections/1').status_code == 404
+    assert client.get(f'/documents/{document.id}/{document.content_hash}/sections/99').status_code == 404
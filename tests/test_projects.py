@@ -0,0 +1,52 @@
+from app import Project, get_project_summaries, get_current_phase_data_db, update_current_phase_data_db
+
+
+def _create_projects(db, count):
+    projects = [Project(name=f"Project {i}") for i in range(count)]
+    db.session.add_all(projects)
+    db.session.commit()
+    return [p.id for p in projects]
+
+
+def test_project_summaries_page_newest_first_with_cursor(db):
+    ids = _create_projects(db, 5)
+    first_page, cursor = get_project_summaries(2)
+    assert [p['id'] for p in first_page] == ids[::-1][:2]
+    assert cursor == ids[3]
+    second_page, cursor = get_project_summaries(2, before_id=cursor)
+    assert [p['id'] for p in second_page] == [ids[2], ids[1]]
+    last_page, cursor = get_project_summaries(2, before_id=cursor)
+    assert [p['id'] for p in last_page] == [ids[0]]
+    assert cursor is None
+
+
+def test_project_summaries_report_phase_progress(db, project):
+    update_current_phase_data_db(project.id, 1, {'project_name': "A"})
+    update_current_phase_data_db(project.id, 3, {'notes': "B"})
+    (summary,), _ = get_project_summaries(10)
+    assert summary['phases_started'] == 2
+    assert summary['phase_last_modified'][1] is not None
+    assert summary['phase_last_modified'][2] is None
+    assert summary['last_modified'] == max(summary['phase_last_modified'][1], summary['phase_last_modified'][3])
+
+
+def test_create_project_selects_it(client, db):
+    response = client.post('/projects', data={'name': "Turbine"})
+    project = Project.query.filter_by(name="Turbine").one()
+    assert response.headers['Location'].endswith(f'/project/{project.id}/phase/1')
+    with client.session_transaction() as session:
+        assert session['current_project_id'] == project.id
+
+
+def test_projects_page_lists_projects(client, project):
+    response = client.get('/projects')
+    assert response.status_code == 200
+    assert b"Test Project" in response.data
+
+
+def test_phase_data_is_kept_per_project(client, db):
+    first, second = _create_projects(db, 2)
+    client.post(f'/project/{first}/phase/1/action', data={'action': 'save', 'project_name': "First"})
+    client.post(f'/project/{second}/phase/1/action', data={'action': 'save', 'project_name': "Second"})
+    assert get_current_phase_data_db(first, 1)['project_name'] == "First"
+    assert get_current_phase_data_db(second, 1)['project_name'] == "Second"
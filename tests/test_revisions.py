@@ -0,0 +1,80 @@
+import pytest
+
+import revisions
+from app import PhaseData, PhaseRevision, compact_phase_revisions, get_phase_revision_data, update_current_phase_data_db
+
+
+def test_delta_round_trip():
+    old = {'a': 1, 'b': "x", 'c': [1]}
+    new = {'a': 1, 'b': "y", 'd': None}
+    delta = revisions.compute_delta(old, new)
+    assert delta == {'set': {'b': "y", 'd': None}, 'unset': ['c']}
+    assert revisions.apply_delta(old, delta) == new
+    assert old == {'a': 1, 'b': "x", 'c': [1]} # Not modified in place
+    assert revisions.changed_keys(delta) == ['b', 'c', 'd']
+
+
+def test_unchanged_data_has_empty_delta():
+    assert revisions.compute_delta({'a': 1}, {'a': 1}) == {}
+
+
+def test_reconstruct_replays_deltas_in_order():
+    versions = [{'a': 1}, {'a': 2, 'b': 1}, {'b': 2}]
+    deltas = [revisions.compute_delta(old, new) for old, new in zip(versions, versions[1:])]
+    assert revisions.reconstruct(versions[0], deltas) == versions[-1]
+
+
+def test_snapshot_revisions(monkeypatch):
+    monkeypatch.setattr(revisions, 'REVISION_SNAPSHOT_INTERVAL', 3)
+    assert [r for r in range(1, 9) if revisions.is_snapshot_revision(r)] == [1, 4, 7]
+
+
+def test_diff():
+    assert revisions.diff({'a': 1, 'b': 2}, {'b': 3, 'c': 4}) == {
+        'added': {'c': 4}, 'removed': {'a': 1}, 'changed': {'b': {'from': 2, 'to': 3}},
+    }
+
+
+@pytest.fixture
+def snapshot_every_three(monkeypatch):
+    monkeypatch.setattr(revisions, 'REVISION_SNAPSHOT_INTERVAL', 3)
+
+
+def _save_versions(project_id, count):
+    for i in range(1, count + 1):
+        update_current_phase_data_db(project_id, 1, {'objective': f"v{i}", f'field_{i}': i})
+    return PhaseData.query.filter_by(project_id=project_id, phase_id_int=1).one()
+
+
+def test_saves_store_snapshots_and_deltas(db, project, snapshot_every_three):
+    entry = _save_versions(project.id, 5)
+    stored = entry.revisions.order_by(PhaseRevision.revision).all()
+    assert [(r.revision, r.is_snapshot) for r in stored] == [(1, True), (2, False), (3, False), (4, True), (5, False)]
+    assert stored[1].payload == {'set': {'objective': "v2", 'field_2': 2}}
+    assert get_phase_revision_data(entry, 3) == {'objective': "v3", 'field_1': 1, 'field_2': 2, 'field_3': 3}
+
+
+def test_unchanged_save_records_no_revision(db, project):
+    update_current_phase_data_db(project.id, 1, {'objective': "same"})
+    update_current_phase_data_db(project.id, 1, {'objective': "same"})
+    assert PhaseRevision.query.count() == 1
+
+
+def test_compaction_keeps_recent_revisions_reconstructable(db, project, snapshot_every_three):
+    entry = _save_versions(project.id, 6)
+    expected = {revision: get_phase_revision_data(entry, revision) for revision in (5, 6)}
+    assert compact_phase_revisions(entry, keep=2, max_age_days=0) == 4
+    db.session.commit()
+    assert [r.revision for r in entry.revisions.order_by(PhaseRevision.revision)] == [5, 6]
+    assert {revision: get_phase_revision_data(entry, revision) for revision in (5, 6)} == expected
+    assert get_phase_revision_data(entry, 4) is None
+
+
+def test_restore_creates_a_new_revision(client, project):
+    _save_versions(project.id, 2)
+    response = client.post(f'/project/{project.id}/phase/1/revisions/1/restore')
+    assert response.status_code == 302
+    data = client.get(f'/project/{project.id}/phase/1/revisions/3').get_json()['data']
+    assert data == {'objective': "v1", 'field_1': 1}
+    diff = client.get(f'/project/{project.id}/phase/1/revisions/2/diff/3').get_json()['diff']
+    assert diff['removed'] == {'field_2': 2}
@@ -0,0 +1,55 @@
+import search_index
+from app import Project, SearchEntry, update_current_phase_data_db, save_document_build
+from doc_generator import split_document_sections
+
+
+def _search(db, query, **kwargs):
+    return search_index.search(db.session, query, 20, **kwargs)
+
+
+def test_phase_fields_are_searchable_with_labels_and_highlights(db, project):
+    update_current_phase_data_db(project.id, 1, {'objective': "Monitor vibration of the turbine blades."})
+    (hit,) = _search(db, "turbine")
+    assert (hit['project_id'], hit['phase_id_int'], hit['field_key']) == (project.id, 1, 'objective')
+    assert hit['title'] == "Project Objective"
+    assert '<mark>turbine</mark>' in str(hit['snippet'])
+
+
+def test_edits_reindex_only_the_changed_field(db, project):
+    update_current_phase_data_db(project.id, 1, {'objective': "turbine", 'stakeholders': "operators"})
+    update_current_phase_data_db(project.id, 1, {'objective': "compressor"})
+    assert _search(db, "turbine") == []
+    assert [hit['field_key'] for hit in _search(db, "operators")] == ['stakeholders']
+
+
+def test_search_filters_by_project_and_quotes_fts_syntax(db, project):
+    other = Project(name="Other")
+    db.session.add(other)
+    db.session.commit()
+    update_current_phase_data_db(project.id, 1, {'objective': "C++ firmware NEAR the sensor"})
+    update_current_phase_data_db(other.id, 1, {'objective': "firmware"})
+    assert {hit['project_id'] for hit in _search(db, "firmware")} == {project.id, other.id}
+    assert [hit['project_id'] for hit in _search(db, "firmware", project_id=other.id)] == [other.id]
+    assert len(_search(db, 'C++ NEAR "sensor')) == 1
+
+
+def test_generated_document_sections_are_indexed(app, db, project):
+    update_current_phase_data_db(project.id, 1, {'project_name': "Bridge"})
+    save_document_build(project.id, 1, "# Doc\n\n## Risks\n\nCorrosion of the anchorage.\n")
+    (hit,) = _search(db, "anchorage")
+    assert (hit['source'], hit['title']) == (search_index.SOURCE_DOCUMENT, "Risks")
+
+
+def test_document_split_ignores_headings_inside_code_fences():
+    markdown_text = "# Title\n\nIntro\n\n## Setup\n\n```bash\n# not a heading\npip install app\n```\n\n## Usage\n\nRun it."
+    assert split_document_sections(markdown_text) == [
+        ("Title", "Intro"),
+        ("Setup", "```bash\n# not a heading\npip install app\n```"),
+        ("Usage", "Run it."),
+    ]
+
+
+def test_search_entries_removed_with_cleared_field(db, project):
+    update_current_phase_data_db(project.id, 1, {'objective': "turbine"})
+    update_current_phase_data_db(project.id, 1, {'objective': ""})
+    assert SearchEntry.query.filter_by(project_id=project.id, field_key='objective').count() == 0
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+
+import pytest
+
+import app as app_module
+import speculation
+from app import SpeculativeResult, get_current_phase_data_db
+
+
+def test_fingerprint_depends_on_content_not_key_order():
+    first = speculation.fingerprint('solution_summary', {'a': 1, 'b': 2})
+    assert first == speculation.fingerprint('solution_summary', {'b': 2, 'a': 1})
+    assert first != speculation.fingerprint('seed_next_phase', {'a': 1, 'b': 2})
+    assert first != speculation.fingerprint('solution_summary', {'a': 1, 'b': 3})
+    assert (speculation.fingerprint('seed_next_phase', {'a': 1}, ['x'])
+            != speculation.fingerprint('seed_next_phase', {'a': 1}, ['y']))
+
+
+def test_pool_runs_each_key_once_and_only_on_idle_workers():
+    pool = speculation.SpeculationPool(2)
+    release = threading.Event()
+    first = pool.submit('a', release.wait)
+    assert first is not None and pool.in_flight('a') is first
+    assert pool.submit('a', release.wait) is None # Same input already running
+    assert pool.submit('b', release.wait) is not None
+    assert not pool.has_idle_worker()
+    assert pool.submit('c', release.wait) is None # No idle worker: skipped, not queued
+    release.set()
+    first.result(timeout=5)
+    pool._executor.shutdown(wait=True)
+    assert pool.in_flight('a') is None and pool.has_idle_worker()
+
+
+def test_metrics_snapshot_reports_click_hit_rate():
+    metrics = speculation.SpeculationMetrics()
+    metrics.incr('hits', 2)
+    metrics.incr('waited_hits')
+    metrics.incr('misses')
+    metrics.incr('saved_seconds', 1.23456)
+    snapshot = metrics.snapshot()
+    assert snapshot['click_hit_rate'] == 0.75
+    assert snapshot['saved_seconds'] == 1.235
+
+
+@pytest.fixture
+def speculating(monkeypatch):
+    monkeypatch.setattr(speculation, 'SPECULATIVE_PRECOMPUTE', True)
+    pool = speculation.SpeculationPool(2)
+    monkeypatch.setattr(speculation, 'pool', pool)
+    yield pool
+    if pool._executor is not None:
+        pool._executor.shutdown(wait=True)
+
+
+def _wait_for_speculation(pool):
+    pool._executor.shutdown(wait=True)
+    pool._executor = None
+
+
+def test_save_precomputes_and_click_uses_the_result(client, project, speculating):
+    client.post(f'/project/{project.id}/phase/1/action', data={'action': 'save', 'objective': "Monitor bridges", 'revision': 0})
+    _wait_for_speculation(speculating)
+    results = {r.action: r for r in SpeculativeResult.query.all()}
+    assert set(results) == {speculation.ACTION_SOLUTION_SUMMARY, speculation.ACTION_SEED_NEXT_PHASE}
+    assert all(r.status == speculation.STATUS_READY for r in results.values())
+    summary = results[speculation.ACTION_SOLUTION_SUMMARY].result
+
+    client.post(f'/project/{project.id}/phase/1/action', data={'action': 'generate_solution', 'revision': 1})
+    assert get_current_phase_data_db(project.id, 1)['_solution_summary'] == summary
+    app_module.db.session.expire_all()
+    assert SpeculativeResult.query.filter_by(action=speculation.ACTION_SOLUTION_SUMMARY).one().consumed_at is not None
+
+
+def test_results_are_single_use_and_only_for_the_same_input(client, project, speculating):
+    client.post(f'/project/{project.id}/phase/1/action', data={'action': 'save', 'objective': "v1", 'revision': 0})
+    _wait_for_speculation(speculating)
+    phase_data = get_current_phase_data_db(project.id, 1)
+
+    def _claim(data):
+        return asyncio.run(app_module.claim_speculative_result(project.id, 1, speculation.ACTION_SOLUTION_SUMMARY, data))
+
+    assert _claim({**phase_data, 'objective': "v2"}) is None
+    assert _claim(phase_data).startswith("Fake response")
+    assert _claim(phase_data) is None
+
+
+def test_daily_cap_stops_speculation(client, project, speculating, monkeypatch):
+    monkeypatch.setattr(speculation, 'SPECULATIVE_DAILY_CAP_PER_PROJECT', 1)
+    client.post(f'/project/{project.id}/phase/1/action', data={'action': 'save', 'objective': "v1", 'revision': 0})
+    _wait_for_speculation(speculating)
+    assert SpeculativeResult.query.count() == 1
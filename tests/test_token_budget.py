@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+import gemini_client
+import token_budget
+from token_budget import TRUNCATION_MARKER, estimate_tokens, trim_json_documents
+
+
+@pytest.fixture(autouse=True)
+def fresh_calibration(monkeypatch):
+    # Every fake Gemini call feeds the process-wide calibration; start each test from the configured ratio
+    monkeypatch.setattr(token_budget, '_calibration', token_budget._Calibration(1.0))
+
+
+def test_raw_estimate_counts_subword_pieces():
+    assert token_budget.raw_token_estimate("hello world") == 2
+    assert token_budget.raw_token_estimate("internationalization") == 4
+    assert token_budget.raw_token_estimate("1234567") == 3
+    assert token_budget.raw_token_estimate('{"a": 1}') == 7 # { " a " : 1 }
+    assert token_budget.raw_token_estimate("") == 0
+
+
+def test_calibration_learns_from_reported_usage():
+    token_budget.observe_usage("hello world", 3)
+    assert token_budget.calibration_ratio() == 1.5
+    assert estimate_tokens("hello world") == 3
+    token_budget.observe_usage("hello world", 100) # Clamped to the upper bound, then averaged in
+    assert token_budget.calibration_ratio() == pytest.approx(0.9 * 1.5 + 0.1 * 2.0)
+    token_budget.observe_usage("hello world", None)
+    assert token_budget._calibration.observations == 2
+
+
+def test_documents_within_budget_are_returned_unchanged():
+    documents = [json.dumps({'a': "short", '_solution_summary': "kept"})]
+    trimmed, report = trim_json_documents(documents, 1000)
+    assert trimmed is documents
+    assert report.fits and report.dropped_keys == [] and report.estimated_after == report.estimated_before
+
+
+def test_artifacts_are_dropped_before_any_field_is_truncated():
+    documents = [json.dumps({'objective': "word " * 100, '_solution_summary': "word " * 400})]
+    trimmed, report = trim_json_documents(documents, 150)
+    assert report.dropped_keys == ['_solution_summary']
+    assert report.truncated_fields == []
+    assert json.loads(trimmed[0]) == {'objective': "word " * 100}
+
+
+def test_longest_field_is_truncated_until_the_documents_fit():
+    history = json.dumps({'1': {'objective': "history " * 300}})
+    current = json.dumps({'objective': "current " * 300, 'name': "Bridge"})
+    trimmed, report = trim_json_documents([history, current], 500)
+    assert report.fits
+    assert report.estimated_after <= 500
+    assert sum(estimate_tokens(document) for document in trimmed) == report.estimated_after
+    # Equal lengths: the earlier (historical) document gives way first
+    assert report.truncated_fields[0] == '1.objective'
+    assert json.loads(trimmed[0])['1']['objective'].endswith(TRUNCATION_MARKER)
+    assert json.loads(trimmed[1])['name'] == "Bridge"
+
+
+def test_trimming_is_deterministic():
+    documents = [json.dumps({'a': "alpha " * 500, 'b': "beta " * 400})]
+    assert trim_json_documents(documents, 200)[0] == trim_json_documents(documents, 200)[0]
+
+
+def test_report_when_the_documents_cannot_fit():
+    documents = [json.dumps({f'k{i}': "x" for i in range(200)})]
+    _, report = trim_json_documents(documents, 10)
+    assert not report.fits
+    assert report.estimated_after > 10
+
+
+def test_oversized_prompt_is_trimmed_before_it_is_sent(monkeypatch):
+    monkeypatch.setitem(token_budget.PROMPT_TOKEN_LIMITS, 'solution_summary', 600)
+    sent = []
+    monkeypatch.setattr(gemini_client, '_call_gemini_api', lambda prompt, **kwargs: sent.append((prompt, kwargs)) or "ok")
+    assert gemini_client.generate_solution_summary(json.dumps({'objective': "word " * 2000})) == "ok"
+    ((prompt, kwargs),) = sent
+    assert '[truncated]' in prompt # JSON-escaped marker
+    assert estimate_tokens(prompt) <= 600 and kwargs['estimated_tokens'] <= 600
+
+
+def test_prompt_that_cannot_be_trimmed_is_not_sent(monkeypatch):
+    monkeypatch.setitem(token_budget.PROMPT_TOKEN_LIMITS, 'solution_summary', 50)
+    monkeypatch.setattr(gemini_client, '_call_gemini_api', lambda prompt, **kwargs: pytest.fail("prompt was sent"))
+    result = gemini_client.generate_solution_summary(json.dumps({'objective': "word " * 2000}))
+    assert result.startswith("Error: The input for this AI request is too large")
+    assert gemini_client.is_error_result(result)
+
+
+@pytest.mark.parametrize('options', [{'separators': (',', ':')}, {}, {'indent': 2}, {'ensure_ascii': False, 'indent': 2}])
+def test_trimmed_documents_keep_their_json_formatting(options):
+    value = {'objective': "béton " * 400, '_solution_summary': "x", 'name': "Bridge"}
+    document = json.dumps(value, **options)
+    trimmed, report = trim_json_documents([document], estimate_tokens(document) - 50)
+    assert report.fits and report.truncated_fields == ['objective']
+    assert trimmed[0] == json.dumps(json.loads(trimmed[0]), **options)
+    assert len(trimmed[0]) < len(document)
+
+
+def test_unrecognised_formatting_is_trimmed_compact():
+    document = '{ "objective" :   "' + "word " * 300 + '",\n"_notes": "x" }'
+    trimmed, report = trim_json_documents([document], estimate_tokens(document) - 2)
+    assert report.dropped_keys == ['_notes']
+    assert trimmed[0] == json.dumps({'objective': "word " * 300}, ensure_ascii=False, separators=(',', ':'))
+
+
+def test_reported_size_is_measured_on_the_returned_documents():
+    documents = [json.dumps({'objective': "word " * 500}), json.dumps({'objective': "short"})]
+    trimmed, report = trim_json_documents(documents, 200)
+    assert report.estimated_after == sum(estimate_tokens(document) for document in trimmed)
+    assert report.fits == (report.estimated_after <= 200)
+    assert trimmed[1] is documents[1]
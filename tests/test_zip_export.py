@@ -0,0 +1,60 @@
+import io
+import json
+import os
+import zipfile
+
+import bulk_io
+import zip_stream
+from app import save_document_build, update_current_phase_data_db
+
+
+def _open(chunks):
+    return zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+
+
+def test_iter_zip_streams_a_valid_archive_lazily():
+    consumed = []
+
+    def _chunks(name, parts):
+        for part in parts:
+            consumed.append(name)
+            yield part
+
+    stream = zip_stream.iter_zip([('a.txt', _chunks('a', [b'hello ', b'world'])), ('b/c.txt', _chunks('b', [b'x' * 100000]))])
+    first = next(stream)
+    assert first and consumed == ['a'] # Only the first chunk of the first entry has been read
+    archive = _open([first, *stream])
+    assert archive.testzip() is None
+    assert archive.read('a.txt') == b'hello world'
+    assert archive.read('b/c.txt') == b'x' * 100000
+
+
+def test_project_export_contains_documents_data_and_manifest(client, project):
+    update_current_phase_data_db(project.id, 1, {'project_name': "Bridge"})
+    document = save_document_build(project.id, 1, "# Doc\n\nBody.\n")
+    response = client.get(f'/project/{project.id}/export')
+    assert response.mimetype == 'application/zip'
+    assert f'Test_Project_{project.id}_export.zip' in response.headers['Content-Disposition']
+
+    archive = _open([response.data])
+    document_name = f"documents/phase_1/{document.filename}"
+    assert archive.read(document_name) == b"# Doc\n\nBody.\n"
+    (line,) = archive.read('phase_data.ndjson').splitlines()
+    record = bulk_io.validate_record(1, json.loads(line)) # Re-importable as-is
+    assert record.data == {'project_name': "Bridge"}
+    manifest = json.loads(archive.read('manifest.json'))
+    assert manifest['phase_data']['rows'] == 1
+    assert [d['file'] for d in manifest['documents']] == [document_name]
+
+
+def test_legacy_document_filenames_cannot_escape_the_upload_folder(app, client, project):
+    upload_folder = app.config['UPLOAD_FOLDER']
+    with open(os.path.join(upload_folder, 'x.md'), 'w') as f:
+        f.write("legacy")
+    update_current_phase_data_db(project.id, 1, {'_generated_doc_filename': "../../x.md"})
+    update_current_phase_data_db(project.id, 2, {'_generated_doc_filename': "../../../etc/passwd"})
+
+    archive = _open([client.get(f'/project/{project.id}/export').data])
+    documents = [name for name in archive.namelist() if name.startswith('documents/')]
+    assert documents == ['documents/phase_1/x.md']
+    assert archive.read('documents/phase_1/x.md') == b"legacy"
@@ -0,0 +1,206 @@
+"""
+Offline prompt token estimation and size limits for Gemini calls.
+
+estimate_tokens() approximates the Gemini tokenizer without a network round trip: words are
+split into subword-sized pieces, and punctuation and non-ASCII characters count one piece each.
+The raw estimate is scaled by a calibration ratio. The ratio is learned from the
+prompt_token_count that Gemini reports in usage_metadata after every call (see
+observe_usage), so estimates converge on the real tokenizer as the app runs.
+
+Each action has a prompt limit. An oversize prompt is trimmed deterministically before it is
+sent (see trim_json_documents):
+
+1. drop underscore-prefixed app artifacts (_solution_summary, _generated_doc_* ...)
+2. repeatedly truncate the longest remaining string value, historical context first
+
+Trimmed documents are written back in the formatting they came in (indent, separators,
+ASCII escaping), compact if it cannot be recognised, so trimming never makes a document
+longer, and the size is checked again on the text actually returned.
+
+For a given calibration, the same input therefore always yields the same prompt. A prompt
+that cannot be trimmed under its limit is not sent at all.
+"""
+import re
+import os
+import json
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional, Tuple
+
+PROMPT_TOKEN_LIMITS = {
+    'solution_summary': int(os.environ.get('PROMPT_TOKEN_LIMIT_SUMMARY', '8000')),
+    'document_section': int(os.environ.get('PROMPT_TOKEN_LIMIT_SECTION', '24000')),
+    'seed_next_phase': int(os.environ.get('PROMPT_TOKEN_LIMIT_SEED', '8000')),
+}
+# Starting calibration ratio (actual / raw estimate) until real usage has been observed
+TOKEN_ESTIMATE_RATIO = float(os.environ.get('TOKEN_ESTIMATE_RATIO', '1.0'))
+# Weight of each new observation in the running calibration ratio
+_CALIBRATION_ALPHA = 0.1
+_RATIO_BOUNDS = (0.5, 2.0)
+
+# Values are never truncated below this many characters
+MIN_FIELD_CHARS = 200
+TRUNCATION_MARKER = ' …[truncated]'
+
+_PIECE_RE = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+_CHARS_PER_WORD_PIECE = 5 # Long words split into pieces of about this size
+_DIGITS_PER_PIECE = 3
+
+
+class _Calibration:
+    def __init__(self, ratio: float):
+        self.ratio = ratio
+        self.observations = 0
+        self._lock = threading.Lock()
+
+    def observe(self, raw_estimate: int, actual: int) -> None:
+        if raw_estimate <= 0 or actual <= 0:
+            return
+        sample = min(max(actual / raw_estimate, _RATIO_BOUNDS[0]), _RATIO_BOUNDS[1])
+        with self._lock:
+            # The first observation replaces the configured starting ratio outright
+            self.ratio = sample if self.observations == 0 else (1 - _CALIBRATION_ALPHA) * self.ratio + _CALIBRATION_ALPHA * sample
+            self.observations += 1
+
+
+_calibration = _Calibration(TOKEN_ESTIMATE_RATIO)
+
+
+def raw_token_estimate(text: str) -> int:
+    """Uncalibrated subword piece count of `text`."""
+    pieces = 0
+    for piece in _PIECE_RE.findall(text or ''):
+        if piece[0].isdigit():
+            pieces += math.ceil(len(piece) / _DIGITS_PER_PIECE)
+        elif piece[0].isalpha():
+            pieces += math.ceil(len(piece) / _CHARS_PER_WORD_PIECE)
+        else:
+            pieces += 1
+    return pieces
+
+
+def estimate_tokens(text: str) -> int:
+    """Calibrated estimate of the Gemini prompt tokens for `text`."""
+    return math.ceil(raw_token_estimate(text) * _calibration.ratio)
+
+
+def calibration_ratio() -> float:
+    return _calibration.ratio
+
+
+def observe_usage(prompt: str, actual_prompt_tokens: Optional[int]) -> None:
+    """Feeds a real prompt_token_count back into the calibration."""
+    if actual_prompt_tokens:
+        _calibration.observe(raw_token_estimate(prompt), int(actual_prompt_tokens))
+
+
+@dataclass
+class TrimReport:
+    estimated_before: int
+    estimated_after: int
+    dropped_keys: List[str] = field(default_factory=list)
+    truncated_fields: List[str] = field(default_factory=list)
+    fits: bool = True
+
+
+# json.dumps options tried, in order, to reproduce a document's formatting exactly
+_JSON_FORMATS = [{'separators': (',', ':')}, {}, {'indent': 2}, {'indent': 4}]
+
+
+def _dumper(document: str, value: Any) -> Callable[[Any], str]:
+    """json.dumps with the options that reproduce `document` from `value`; compact when none does."""
+    for options in _JSON_FORMATS:
+        for ensure_ascii in (True, False):
+            if json.dumps(value, ensure_ascii=ensure_ascii, **options) == document:
+                return lambda v, o=options, a=ensure_ascii: json.dumps(v, ensure_ascii=a, **o)
+    return lambda v: json.dumps(v, ensure_ascii=False, separators=(',', ':'))
+
+
+def _load(document: str) -> Any:
+    try:
+        return json.loads(document)
+    except (TypeError, ValueError):
+        return document # Not JSON: trimmed as one long string
+
+
+def _drop_artifacts(value: Any, path: str, dropped: List[str]) -> Any:
+    if isinstance(value, dict):
+        kept = {}
+        for key, child in value.items():
+            if isinstance(key, str) and key.startswith('_'):
+                dropped.append(f"{path}.{key}" if path else key)
+                continue
+            kept[key] = _drop_artifacts(child, f"{path}.{key}" if path else str(key), dropped)
+        return kept
+    if isinstance(value, list):
+        return [_drop_artifacts(child, f"{path}[{i}]", dropped) for i, child in enumerate(value)]
+    return value
+
+
+def _string_leaves(value: Any, path: Tuple = ()) -> List[Tuple[Tuple, str]]:
+    """(path, text) of every string in a JSON value, in document order."""
+    if isinstance(value, dict):
+        return [leaf for key, child in value.items() for leaf in _string_leaves(child, path + (key,))]
+    if isinstance(value, list):
+        return [leaf for i, child in enumerate(value) for leaf in _string_leaves(child, path + (i,))]
+    if isinstance(value, str):
+        return [(path, value)]
+    return []
+
+
+def _set_path(value: Any, path: Tuple, text: str) -> Any:
+    if not path:
+        return text
+    value[path[0]] = _set_path(value[path[0]], path[1:], text)
+    return value
+
+
+def trim_json_documents(documents: List[str], budget_tokens: int) -> Tuple[List[str], TrimReport]:
+    """
+    Shrinks JSON `documents` until their combined estimate fits `budget_tokens`.
+
+    Documents are listed in trimming priority: when fields are equally long, those of
+    earlier documents are truncated first, so pass historical context before current data.
+    Untouched documents are returned unchanged; trimmed ones keep their JSON formatting.
+    """
+    sizes = [estimate_tokens(d) for d in documents]
+    report = TrimReport(estimated_before=sum(sizes), estimated_after=sum(sizes))
+    if report.estimated_before <= budget_tokens:
+        return documents, report
+
+    values = [_load(d) for d in documents]
+    dumps = [_dumper(d, v) for d, v in zip(documents, values)]
+    dump = lambda index: dumps[index](values[index]) if isinstance(values[index], (dict, list)) else values[index]
+    values = [_drop_artifacts(v, '', report.dropped_keys) for v in values]
+    trimmed = [dump(i) for i in range(len(values))]
+    changed = [t != d for t, d in zip(trimmed, documents)]
+    sizes = [estimate_tokens(t) for t in trimmed]
+
+    while sum(sizes) > budget_tokens:
+        # Longest string anywhere, ties broken by document order, then path order
+        candidates = [(len(text), -doc_index, path, text) for doc_index, v in enumerate(values)
+                      for path, text in _string_leaves(v) if len(text) > MIN_FIELD_CHARS + len(TRUNCATION_MARKER)]
+        if not candidates:
+            report.fits = False
+            break
+        length, neg_index, path, text = max(candidates, key=lambda c: (c[0], c[1]))
+        doc_index = -neg_index
+        if text.endswith(TRUNCATION_MARKER):
+            text = text[:-len(TRUNCATION_MARKER)]
+        # Cut the overage from this field (by a chars-per-token approximation), at least by half
+        overage_chars = (sum(sizes) - budget_tokens) * 4
+        keep = max(MIN_FIELD_CHARS, min(length // 2, length - overage_chars))
+        values[doc_index] = _set_path(values[doc_index], path, text[:keep].rstrip() + TRUNCATION_MARKER)
+        label = '.'.join(str(p) for p in path) or f"document {doc_index}"
+        if label not in report.truncated_fields:
+            report.truncated_fields.append(label)
+        trimmed[doc_index] = dump(doc_index)
+        changed[doc_index] = True
+        sizes[doc_index] = estimate_tokens(trimmed[doc_index])
+
+    result = [t if c else d for t, d, c in zip(trimmed, documents, changed)]
+    # Re-checked on the returned text itself, not on the sizes tracked while trimming
+    report.estimated_after = sum(estimate_tokens(t) for t in result)
+    report.fits = report.fits and report.estimated_after <= budget_tokens
+    return result, report
@@ -0,0 +1,61 @@
+"""
+Streaming ZIP writer.
+
+Builds a ZIP archive on the fly and yields it as byte chunks, so a response can start
+sending immediately and memory use does not depend on the size of the archive. Nothing is
+written to a temporary file: zipfile writes into a non-seekable buffer that is drained after
+every write, and it falls back to data descriptors because it cannot seek back to fill in sizes.
+"""
+import io
+import time
+import zipfile
+from typing import Iterable, Iterator, List, Tuple
+
+# (archive name, iterable of content chunks). Chunks are consumed lazily while streaming.
+ZipEntry = Tuple[str, Iterable[bytes]]
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Write-only, non-seekable sink that hands written bytes back to the generator."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # zipfile records local header offsets from tell(); a running byte count is all it needs
+        return self._position
+
+    def drain(self) -> Iterator[bytes]:
+        chunks, self._chunks = self._chunks, []
+        if chunks:
+            yield b"".join(chunks)
+
+
+def iter_zip(entries: Iterable[ZipEntry], compression: int = zipfile.ZIP_DEFLATED) -> Iterator[bytes]:
+    """Yields a complete ZIP archive containing `entries`, chunk by chunk."""
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=compression) as archive:
+        for name, chunks in entries:
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.compress_type = compression
+            with archive.open(info, mode='w') as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    yield from buffer.drain()
+            yield from buffer.drain()
+    # Central directory, written when the archive is closed
+    yield from buffer.drain()